@@ -6,48 +6,155 @@
 # VPN AVEC TEST AUTOMATIQUE MULTI-PROXIES
 # ============================================
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Blueprint, Response, current_app, render_template, request, jsonify, session
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface
+from itsdangerous import BadSignature, Signer
+from werkzeug.local import LocalProxy
+from werkzeug.http import parse_cookie
+from contextlib import contextmanager, nullcontext
 import os
+import sys
 import requests
 import json
 import random
 import time
 from functools import wraps
-import google.generativeai as genai
 from datetime import datetime, timedelta
 import hashlib
+import hmac
+import math
+import heapq
+import threading
+import inspect
+import string
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from itertools import islice
+import sqlite3
+import re
+import unicodedata
+import zlib
+import gzip
+import bisect
+import socket
+import asyncio
+import tempfile
+import atexit
+import io
+from urllib.parse import parse_qsl, urlencode
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrous limités au processus
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:  # Dépendance de requirements.txt; sans elle, gzip seulement
+    brotli = None
 
 # ============================================
 # CONFIGURATION - VARIABLES D'ENVIRONNEMENT
 # ============================================
 
-app = Flask(__name__)
+# Routes regroupées dans un blueprint, enregistré par create_app()
+bp = Blueprint('benbot', __name__)
 
 # Clé secrète pour les sessions Flask
 SECRET_KEY = os.environ.get('SECRET_KEY')
 if not SECRET_KEY:
     raise ValueError("❌ ERREUR CRITIQUE: SECRET_KEY non définie dans Vercel!")
-app.secret_key = SECRET_KEY
 
 # Configuration de la session pour 24h
-app.config['SECRET_KEY'] = SECRET_KEY
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)  # ⏰ 24 HEURES !
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_COOKIE_NAME'] = 'benbot_session'
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SECURE'] = False  # Mettre True en HTTPS
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+APP_CONFIG = {
+    'SECRET_KEY': SECRET_KEY,
+    'PERMANENT_SESSION_LIFETIME': timedelta(hours=24),  # ⏰ 24 HEURES !
+    'SESSION_TYPE': 'filesystem',
+    'SESSION_COOKIE_NAME': 'benbot_session',
+    'SESSION_COOKIE_HTTPONLY': True,
+    'SESSION_COOKIE_SECURE': False,  # Mettre True en HTTPS
+    'SESSION_COOKIE_SAMESITE': 'Lax'
+}
+
+# État partagé des services : memory (par worker), sqlite ou shm (entre workers)
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'memory')
+STATE_PATH = os.environ.get('STATE_PATH')  # fichier SQLite ou nom du segment shm
+STATE_SHM_SIZE_MB = int(os.environ.get('STATE_SHM_SIZE_MB', '8'))  # taille fixe du segment shm
+STATE_PARTITION = os.environ.get('STATE_PARTITION', 'shared')  # shared | worker
+
+# Sessions : 'cookie' (tout dans le cookie signé) ou 'sharded' (côté serveur,
+# réparties sur SESSION_SHARDS fichiers SQLite de SESSION_SHARD_PATH, ou en mémoire)
+SESSION_STORE = os.environ.get('SESSION_STORE', 'cookie')
+SESSION_SHARDS = int(os.environ.get('SESSION_SHARDS', '4'))
+SESSION_SHARD_PATH = os.environ.get('SESSION_SHARD_PATH')
+# Écritures différées des sessions côté serveur : vidage groupé toutes les N ms
+# ou dès SESSION_WRITE_BEHIND_MAX sessions en attente (0 : écriture immédiate)
+SESSION_WRITE_BEHIND_MS = int(os.environ.get('SESSION_WRITE_BEHIND_MS', '0'))
+SESSION_WRITE_BEHIND_MAX = int(os.environ.get('SESSION_WRITE_BEHIND_MAX', '256'))
+
+# Index plein texte de la mémoire (SQLite FTS5) : fichier partagé entre workers,
+# par défaut à côté de l'état SQLite, sinon en mémoire dans chaque processus
+MEMORY_INDEX_PATH = os.environ.get('MEMORY_INDEX_PATH')
+
+# Profilage à la demande : en-tête X-Profile / ?profile=<clé>, ou une part du trafic
+PROFILE_KEY = os.environ.get('PROFILE_KEY')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+
+# Actions d'administration (préchauffage, relance des tests des modèles qui
+# consomme des tokens) : en-tête X-Admin-Key ou ?key=<clé>; sans ADMIN_KEY, refusées
+ADMIN_KEY = os.environ.get('ADMIN_KEY')
+
+# Capture du trafic pour rejeu (benchmarks/replay.py) : fichier JSONL, '{pid}'
+# pour un fichier par worker; part des clients capturés; textes libres masqués
+TRACE_CAPTURE_PATH = os.environ.get('TRACE_CAPTURE_PATH')
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '1'))
+TRACE_REDACT = os.environ.get('TRACE_REDACT', 'text')  # text | none
+
+# Compression des réponses (octets) : en dessous, l'en-tête coûte plus qu'il ne rapporte
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '500'))
 
 # 🔥 API GEMINI - Utilise OPENAI_API_KEY ou GEMINI_API_KEY
 GEMINI_API_KEY = os.environ.get('OPENAI_API_KEY') or os.environ.get('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
-    print("⚠️ ATTENTION: Aucune clé API Gemini trouvée!")
-else:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        print("✅ Gemini configuré avec succès!")
-    except Exception as e:
-        print(f"❌ Erreur configuration Gemini: {str(e)}")
+
+class LazyGenAI:
+    """Importe et configure google.generativeai au premier usage.
+    
+    L'import du SDK domine le démarrage à froid sur Vercel alors que /health
+    ou / n'en ont pas besoin : il est donc différé jusqu'au premier accès
+    à un attribut (genai.GenerativeModel, genai.list_models...) ou à warm_up().
+    """
+    
+    def __init__(self):
+        self._module = None
+        self._lock = threading.Lock()
+        self.load_time = None
+    
+    @property
+    def loaded(self):
+        return self._module is not None
+    
+    def load(self):
+        """Importe le SDK une seule fois (thread-safe)"""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    import google.generativeai as module
+                    if GEMINI_API_KEY:
+                        try:
+                            module.configure(api_key=GEMINI_API_KEY)
+                            print("✅ Gemini configuré avec succès!")
+                        except Exception as e:
+                            print(f"❌ Erreur configuration Gemini: {str(e)}")
+                    self.load_time = time.perf_counter() - start
+                    self._module = module
+        return self._module
+    
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+genai = LazyGenAI()
 
 # Google AdSense
 ADSENSE_CLIENT_ID = os.environ.get('ADSENSE_CLIENT_ID', 'ca-pub-XXXXXXXXXXXXXXXX')
@@ -55,19 +162,41 @@ ADSENSE_CLIENT_ID = os.environ.get('ADSENSE_CLIENT_ID', 'ca-pub-XXXXXXXXXXXXXXXX
 # Mode debug
 DEBUG_MODE = os.environ.get('FLASK_ENV', 'production') == 'development'
 
+# Liste des sources de proxies (fichier JSON)
+PROXY_SOURCES_FILE = os.environ.get(
+    'PROXY_SOURCES_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'proxy_sources.json')
+)
+
+# Préchauffage du SDK Gemini en arrière-plan au démarrage (serveurs longue durée)
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', 'false').lower() == 'true'
+
 # ============================================
 # LOGS DE DÉMARRAGE
 # ============================================
 
-print("\n" + "="*50)
-print("🚀 APPLICATION DÉMARRÉE SUR VERCEL AVEC MÉMOIRE 24H")
-print("="*50)
-print(f"✅ SECRET_KEY: {'Configurée' if SECRET_KEY else 'MANQUANTE'}")
-print(f"✅ GEMINI_API_KEY: {'Configurée' if GEMINI_API_KEY else 'MANQUANTE'}")
-print(f"✅ ADSENSE_CLIENT_ID: {'Configuré' if ADSENSE_CLIENT_ID != 'ca-pub-XXXXXXXXXXXXXXXX' else 'Défaut'}")
-print(f"✅ Mode: {'Développement' if DEBUG_MODE else 'Production'}")
-print(f"✅ Mémoire: 24 heures active")
-print("="*50 + "\n")
+def log_startup():
+    """Résumé de la configuration, affiché par les serveurs longue durée
+    (python app.py, WARMUP_ON_START) et pas à l'import : un démarrage à
+    froid sur Vercel n'a pas à le payer"""
+    if not GEMINI_API_KEY:
+        print("⚠️ ATTENTION: Aucune clé API Gemini trouvée!")
+    print("\n" + "="*50)
+    print("🚀 APPLICATION DÉMARRÉE AVEC MÉMOIRE 24H")
+    print("="*50)
+    print(f"✅ SECRET_KEY: {'Configurée' if SECRET_KEY else 'MANQUANTE'}")
+    print(f"✅ GEMINI_API_KEY: {'Configurée' if GEMINI_API_KEY else 'MANQUANTE'}")
+    print(f"✅ ADSENSE_CLIENT_ID: {'Configuré' if ADSENSE_CLIENT_ID != 'ca-pub-XXXXXXXXXXXXXXXX' else 'Défaut'}")
+    print(f"✅ Mode: {'Développement' if DEBUG_MODE else 'Production'}")
+    print(f"✅ Mémoire: 24 heures active")
+    print(f"✅ État des services: {STATE_BACKEND} ({STATE_PARTITION})")
+    print(f"✅ Sessions: {'côté serveur, ' + str(SESSION_SHARDS) + ' shards' if SESSION_STORE == 'sharded' else 'cookie signé'}"
+          f"{f', écritures groupées ({SESSION_WRITE_BEHIND_MS} ms)' if SESSION_STORE == 'sharded' and SESSION_WRITE_BEHIND_MS else ''}")
+    if TRACE_CAPTURE_PATH:
+        print(f"✅ Capture du trafic: {TRACE_CAPTURE_PATH} ({TRACE_SAMPLE_RATE * 100:.0f}% des clients, masquage {TRACE_REDACT})")
+    print(f"✅ SDK Gemini: chargement {'au démarrage' if WARMUP_ON_START else 'différé (premier usage)'}")
+    print(f"✅ Administration: {'clé ADMIN_KEY' if ADMIN_KEY else 'désactivée'}")
+    print("="*50 + "\n")
 
 # ============================================
 # DÉCORATEURS ET UTILITAIRES
@@ -93,662 +222,4394 @@ def handle_errors(f):
                 return jsonify({'error': 'Erreur interne'}), 500
     return decorated_function
 
+def is_admin():
+    """La requête courante présente-t-elle la clé ADMIN_KEY ?"""
+    key = request.headers.get('X-Admin-Key') or request.args.get('key') or ''
+    return bool(ADMIN_KEY) and hmac.compare_digest(key.encode(), ADMIN_KEY.encode())
+
 # ============================================
-# SERVICE VPN AMÉLIORÉ - TEST AUTOMATIQUE MULTI-PROXIES
+# PROFILAGE - ÉCHANTILLONNAGE DES PILES ET SPANS
 # ============================================
 
-class VPNService:
-    """Service VPN avec test automatique de proxies mondiaux"""
+class Profiler:
+    """Profileur par échantillonnage, activé requête par requête.
     
-    _proxies_cache = []
-    _working_cache = []
-    _cache_timestamp = 0
-    CACHE_DURATION = 600  # 10 minutes (rechargement fréquent)
+    Un thread lit les piles des seules requêtes profilées toutes les
+    PROFILE_INTERVAL_MS (sys._current_frames) : aucun coût pour les autres.
+    Les spans (Profiler.span) chronomètrent les grandes étapes; ils sont
+    toujours agrégés et préfixent les piles échantillonnées. Les piles
+    agrégées sont exportées au format « collapsed » (flamegraph.pl, speedscope).
+    """
     
-    # Statistiques
-    _total_tested = 0
-    _total_working = 0
-    _last_test_duration = 0
-    _proxy_countries = {}
+    MAX_DEPTH = 64
+    MAX_STACKS = 5000  # piles distinctes gardées (au-delà : regroupées)
+    RECENT_REQUESTS = 50
+    MAX_SPANS = 500  # spans détaillés par requête (les agrégats comptent tout)
+    
+    _active = {}  # ident du thread -> profil de la requête en cours
+    _spans = {}  # ident du thread -> pile des spans ouverts
+    _stacks = Counter()
+    _span_stats = {}
+    _recent = deque(maxlen=RECENT_REQUESTS)
+    _lock = threading.Lock()
+    _wake = threading.Event()
+    _thread = None
+    _pid = None
     
     @classmethod
-    def test_proxy(cls, proxy, timeout=3):
-        """Teste si un proxy est fonctionnel avec vérification multiple et retourne pays + latence"""
-        try:
-            proxies = {
-                'http': f'http://{proxy}',
-                'https': f'http://{proxy}'
-            }
-            
-            # ✅ TEST 1: Vérifier que l'IP est accessible
-            test_urls = [
-                'http://httpbin.org/ip',
-                'http://api.ipify.org',
-                'http://ip-api.com/json',
-                'http://ifconfig.me/ip',
-                'http://icanhazip.com'
-            ]
-            
-            for url in test_urls:
-                try:
-                    start_time = time.time()
-                    response = requests.get(
-                        url,
-                        proxies=proxies,
-                        timeout=timeout,
-                        headers={
-                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                            'Accept': 'application/json',
-                            'Connection': 'keep-alive'
-                        },
-                        verify=False
-                    )
-                    
-                    if response.status_code == 200:
-                        latency = int((time.time() - start_time) * 1000)
-                        
-                        # Récupérer le pays du proxy
-                        country = "Inconnu"
-                        try:
-                            ip = proxy.split(':')[0]
-                            ip_response = requests.get(
-                                f'http://ip-api.com/json/{ip}',
-                                timeout=2
-                            )
-                            if ip_response.status_code == 200:
-                                ip_data = ip_response.json()
-                                country = ip_data.get('country', 'Inconnu')
-                        except:
-                            pass
-                        
-                        return True, latency, country
-                        
-                except requests.exceptions.Timeout:
-                    continue
-                except requests.exceptions.ConnectionError:
-                    continue
-                except:
-                    continue
-                    
-            return False, 0, None
-            
-        except Exception as e:
-            return False, 0, None
+    def enabled(cls):
+        return bool(PROFILE_KEY) or PROFILE_SAMPLE_RATE > 0
     
     @classmethod
-    def get_proxies_from_source(cls, url, parser='default'):
-        """Récupère les proxies depuis différentes sources"""
-        proxies = []
-        try:
-            response = requests.get(url, timeout=15)
-            if response.status_code == 200:
-                text = response.text.strip()
-                
-                # Différents formats de parsing
-                if parser == 'scrape':
-                    # Format proxyscrape
-                    if '\r\n' in text:
-                        proxies = text.split('\r\n')
-                    elif '\n' in text:
-                        proxies = text.split('\n')
-                    else:
-                        proxies = text.split()
-                        
-                elif parser == 'github':
-                    # Format GitHub raw
-                    lines = text.split('\n')
-                    for line in lines:
-                        line = line.strip()
-                        if ':' in line and not line.startswith('#'):
-                            if ' ' in line:
-                                proxies.append(line.split()[0])
-                            else:
-                                proxies.append(line)
-                
-                elif parser == 'speedx':
-                    # Format SpeedX
-                    lines = text.split('\n')
-                    for line in lines:
-                        line = line.strip()
-                        if ':' in line and len(line.split(':')) == 2:
-                            proxies.append(line)
-                
-                else:
-                    # Format par défaut
-                    if '\r\n' in text:
-                        proxies = text.split('\r\n')
-                    elif '\n' in text:
-                        proxies = text.split('\n')
-                    else:
-                        proxies = text.split()
-                
-                # Nettoyer les proxies
-                cleaned = []
-                for proxy in proxies:
-                    proxy = proxy.strip()
-                    if ':' in proxy and len(proxy.split(':')) == 2:
-                        parts = proxy.split(':')
-                        if parts[0].count('.') == 3 and parts[1].isdigit():
-                            cleaned.append(proxy)
-                
-                return cleaned
-                
-        except Exception as e:
-            if DEBUG_MODE:
-                print(f"⚠️ Source indisponible: {url[:30]}...")
-        
-        return []
+    def wants(cls, req):
+        """La requête doit-elle être profilée ? (clé fournie ou tirage)"""
+        if PROFILE_KEY:
+            flag = req.headers.get('X-Profile') or req.args.get('profile')
+            if flag and flag == PROFILE_KEY:
+                return True
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
     
     @classmethod
-    def get_all_proxies(cls, force_refresh=False):
-        """Récupère des proxies depuis TOUTES les sources disponibles dans le monde"""
-        
-        current_time = time.time()
-        if (not force_refresh and 
-            cls._proxies_cache and 
-            current_time - cls._cache_timestamp < cls.CACHE_DURATION):
-            return cls._proxies_cache
-        
-        print("\n🌍 RECHERCHE DE PROXIES DANS LE MONDE ENTIER...")
-        print("=" * 50)
-        
-        # 🌍 SOURCES DE PROXIES PAR PAYS ET MONDIALES
-        proxy_sources = [
-            # 🌐 SOURCES MONDIALES (TOUS PAYS)
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=all&ssl=all&anonymity=all', 'parser': 'scrape'},
-            {'url': 'https://raw.githubusercontent.com/TheSpeedX/PROXY-List/master/http.txt', 'parser': 'speedx'},
-            {'url': 'https://raw.githubusercontent.com/ShiftyTR/Proxy-List/master/http.txt', 'parser': 'speedx'},
-            {'url': 'https://raw.githubusercontent.com/jetkai/proxy-list/main/online-proxies/txt/proxies-http.txt', 'parser': 'github'},
-            {'url': 'https://raw.githubusercontent.com/mmpx12/proxy-list/master/http.txt', 'parser': 'github'},
-            {'url': 'https://raw.githubusercontent.com/roosterkid/openproxylist/main/HTTP_RAW.txt', 'parser': 'github'},
-            {'url': 'https://raw.githubusercontent.com/mertguvencli/http-proxy-list/main/proxy-list.txt', 'parser': 'github'},
-            {'url': 'https://raw.githubusercontent.com/sunny9577/proxy-scraper/master/proxies.txt', 'parser': 'github'},
-            {'url': 'https://raw.githubusercontent.com/opsxcq/proxy-list/master/list.txt', 'parser': 'github'},
-            {'url': 'https://raw.githubusercontent.com/proxy4parsers/proxy-list/main/http.txt', 'parser': 'github'},
-            
-            # 🇺🇸 USA
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=us&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇫🇷 FRANCE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=fr&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇬🇧 UK
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=gb&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇩🇪 ALLEMAGNE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=de&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇨🇦 CANADA
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=ca&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇯🇵 JAPON
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=jp&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇧🇷 BRÉSIL
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=br&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇮🇳 INDE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=in&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇷🇺 RUSSIE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=ru&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇨🇳 CHINE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=cn&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇧🇪 BELGIQUE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=be&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇨🇭 SUISSE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=ch&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇪🇸 ESPAGNE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=es&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇮🇹 ITALIE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=it&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇳🇱 PAYS-BAS
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=nl&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇸🇪 SUÈDE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=se&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇳🇴 NORVÈGE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=no&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇫🇮 FINLANDE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=fi&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇩🇰 DANEMARK
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=dk&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇦🇺 AUSTRALIE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=au&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇳🇿 NOUVELLE-ZÉLANDE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=nz&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇿🇦 AFRIQUE DU SUD
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=za&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇦🇪 ÉMIRATS ARABES UNIS
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=ae&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇮🇱 ISRAËL
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=il&ssl=all&anonymity=all', 'parser': 'scrape'},
-            
-            # 🇹🇷 TURQUIE
-            {'url': 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=http&timeout=1000&country=tr&ssl=all&anonymity=all', 'parser': 'scrape'},
-        ]
-        
-        all_proxies = []
-        
-        # Récupérer les proxies de toutes les sources
-        for source in proxy_sources:
-            proxies = cls.get_proxies_from_source(source['url'], source['parser'])
-            all_proxies.extend(proxies)
-            if DEBUG_MODE:
-                print(f"📦 {len(proxies)} proxies de {source['url'][:50]}...")
-        
-        # Dédupliquer
-        all_proxies = list(set(all_proxies))
-        print(f"\n📊 TOTAL BRUT: {len(all_proxies)} proxies uniques")
-        
-        cls._proxies_cache = all_proxies
-        cls._cache_timestamp = current_time
-        
-        return all_proxies
+    def _ensure_started(cls):
+        """Démarre le thread d'échantillonnage dans ce processus (verrou déjà pris)"""
+        if cls._thread is not None and cls._thread.is_alive() and cls._pid == os.getpid():
+            return
+        cls._pid = os.getpid()
+        cls._thread = threading.Thread(target=cls._run, name='profiler-sampler', daemon=True)
+        cls._thread.start()
     
     @classmethod
-    def find_working_proxies(cls, limit=50, max_tests=100):
-        """Trouve automatiquement les proxies qui fonctionnent dans le monde"""
-        
-        print("\n🔍 RECHERCHE DE PROXIES FONCTIONNELS...")
-        print("=" * 50)
-        
-        # Récupérer tous les proxies
-        all_proxies = cls.get_all_proxies(force_refresh=True)
-        
-        if not all_proxies:
-            print("❌ Aucun proxy trouvé!")
-            return []
-        
-        # Mélanger pour avoir un échantillon aléatoire
-        random.shuffle(all_proxies)
-        
-        # Limiter le nombre de tests pour la performance
-        to_test = all_proxies[:max_tests]
-        
-        working_proxies = []
-        start_time = time.time()
-        
-        print(f"🧪 Test de {len(to_test)} proxies...\n")
-        
-        for i, proxy in enumerate(to_test, 1):
-            print(f"  Test {i}/{len(to_test)}: {proxy}", end=" ")
-            
-            is_working, latency, country = cls.test_proxy(proxy, timeout=3)
-            cls._total_tested += 1
-            
-            if is_working:
-                working_proxies.append({
-                    'proxy': proxy,
-                    'latency': latency,
-                    'country': country or 'Inconnu'
-                })
-                cls._total_working += 1
-                cls._working_cache.append(proxy)
-                
-                # Compter par pays
-                if country:
-                    cls._proxy_countries[country] = cls._proxy_countries.get(country, 0) + 1
-                
-                print(f"✅ {latency}ms - {country}")
-            else:
-                print("❌")
-            
-            # Limiter le nombre de proxies fonctionnels trouvés
-            if len(working_proxies) >= limit:
-                print(f"\n✅ Limite de {limit} proxies fonctionnels atteinte!")
-                break
-        
-        cls._last_test_duration = time.time() - start_time
-        
-        # Trier par latence (les plus rapides d'abord)
-        working_proxies.sort(key=lambda x: x['latency'])
-        
-        print(f"\n✅ RECHERCHE TERMINÉE!")
-        print(f"   - Temps: {cls._last_test_duration:.1f} secondes")
-        print(f"   - Proxies testés: {cls._total_tested}")
-        print(f"   - Proxies fonctionnels: {cls._total_working}")
-        print(f"   - Taux de succès: {cls._total_working/cls._total_tested*100:.1f}%" if cls._total_tested > 0 else "   - Taux de succès: 0%")
-        
-        # Afficher la répartition par pays
-        if cls._proxy_countries:
-            print("\n🌍 RÉPARTITION PAR PAYS:")
-            for country, count in sorted(cls._proxy_countries.items(), key=lambda x: x[1], reverse=True)[:5]:
-                print(f"   - {country}: {count}")
-        
-        return working_proxies
+    def begin(cls, label):
+        """Commence le profil de la requête du thread courant"""
+        profile = {
+            'id': os.urandom(6).hex(),
+            'label': label,
+            'start': time.perf_counter(),
+            'timestamp': time.time(),
+            'samples': Counter(),
+            'spans': []
+        }
+        with cls._lock:
+            cls._active[threading.get_ident()] = profile
+            cls._ensure_started()
+        cls._wake.set()
+        return profile
     
     @classmethod
-    def get_working_proxy(cls, force_refresh=False):
-        """Retourne un proxy 100% fonctionnel (testé en temps réel)"""
-        
-        # Si on a des proxies en cache et pas de rafraîchissement forcé
-        if cls._working_cache and not force_refresh and len(cls._working_cache) > 0:
-            proxy = random.choice(cls._working_cache)
-            # Vérifier rapidement qu'il fonctionne encore
-            is_working, _, _ = cls.test_proxy(proxy, timeout=2)
-            if is_working:
-                return proxy
-        
-        # Sinon, lancer une recherche de nouveaux proxies
-        working = cls.find_working_proxies(limit=10, max_tests=50)
+    def current(cls):
+        return cls._active.get(threading.get_ident())
+    
+    @classmethod
+    def finish(cls, response=None):
+        """Termine le profil du thread courant et l'ajoute aux agrégats"""
+        # Appelé à chaque fin de requête : sans profil ouvert par ce thread (seul
+        # à y ajouter son entrée), pas de verrou
+        if not cls.enabled() or threading.get_ident() not in cls._active:
+            return None
+        with cls._lock:
+            profile = cls._active.pop(threading.get_ident(), None)
+            if profile is None:
+                return None
+            profile['duration_ms'] = round((time.perf_counter() - profile['start']) * 1000, 2)
+            # Piles brutes (objets code) mises en forme une seule fois, hors du thread d'échantillonnage
+            profile['samples'] = cls._format(profile['label'], profile['samples'])
+            for stack, count in profile['samples'].items():
+                if stack not in cls._stacks and len(cls._stacks) >= cls.MAX_STACKS:
+                    stack = f"{profile['label']};[autres piles]"
+                cls._stacks[stack] += count
+            cls._recent.append(profile)
         
-        if working:
-            # Mettre à jour le cache
-            cls._working_cache = [w['proxy'] for w in working]
-            return cls._working_cache[0]
+        if response is not None:
+            # Server-Timing : lisible directement dans les outils du navigateur
+            durations = {}
+            for name, _, ms in profile['spans']:
+                durations[name] = durations.get(name, 0) + ms
+            timings = [f"{name};dur={round(ms, 2)}" for name, ms in durations.items()]
+            timings.append(f"total;dur={profile['duration_ms']}")
+            response.headers['Server-Timing'] = ', '.join(timings)
+            response.headers['X-Profile-Id'] = profile['id']
+            response.headers['X-Profile-Samples'] = str(sum(profile['samples'].values()))
+        return profile
+    
+    @classmethod
+    def span(cls, name):
+        """Chronomètre une étape; ses échantillons sont regroupés sous `span:name`.
         
-        return None
+        Profileur désactivé : contexte vide, sans verrou ni horloge.
+        """
+        return cls._span(name) if cls.enabled() else nullcontext()
     
     @classmethod
-    def get_ip_info(cls, use_vpn=True):
-        """Obtient les infos IP avec ou sans VPN"""
+    @contextmanager
+    def _span(cls, name):
+        ident = threading.get_ident()
+        spans = cls._spans.setdefault(ident, [])
+        spans.append(name)
+        start = time.perf_counter()
         try:
-            if use_vpn:
-                proxy = cls.get_working_proxy()
-                if proxy:
-                    proxies = {
-                        'http': f'http://{proxy}',
-                        'https': f'http://{proxy}'
-                    }
-                    response = requests.get(
-                        'https://api.ipify.org?format=json',
-                        proxies=proxies,
-                        timeout=5,
-                        headers={'User-Agent': 'Mozilla/5.0'}
-                    )
-                    if response.status_code == 200:
-                        return {
-                            'success': True,
-                            'ip': response.json().get('ip'),
-                            'proxy': proxy,
-                            'method': 'VPN'
-                        }
-            
-            # Fallback direct
-            response = requests.get(
-                'https://api.ipify.org?format=json',
-                timeout=3
-            )
-            return {
-                'success': True,
-                'ip': response.json().get('ip'),
-                'proxy': None,
-                'method': 'Direct'
-            }
-            
-        except Exception as e:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            spans.pop()
+            if not spans:
+                cls._spans.pop(ident, None)
+            with cls._lock:
+                stats = cls._span_stats.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                stats['count'] += 1
+                stats['total_ms'] += elapsed
+                stats['max_ms'] = max(stats['max_ms'], elapsed)
+                profile = cls._active.get(ident)
+                if profile is not None and len(profile['spans']) < cls.MAX_SPANS:
+                    profile['spans'].append((name, round((start - profile['start']) * 1000, 2), round(elapsed, 2)))
+    
+    @classmethod
+    def _codes(cls, frame):
+        codes = []
+        while frame is not None and len(codes) < cls.MAX_DEPTH:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        return tuple(codes)
+    
+    @staticmethod
+    def _format(label, raw):
+        """{(spans, codes): n} -> {'label;span:...;fichier:fonction;...': n}"""
+        stacks = Counter()
+        for (spans, codes), count in raw.items():
+            frames = [f"{os.path.basename(code.co_filename)}:{code.co_name}" for code in reversed(codes)]
+            stacks[';'.join([label] + [f"span:{name}" for name in spans] + frames)] += count
+        return stacks
+    
+    @classmethod
+    def _run(cls):
+        while True:
+            if not cls._active:
+                cls._wake.wait()
+                cls._wake.clear()
+                continue
+            time.sleep(PROFILE_INTERVAL_MS / 1000)
+            frames = sys._current_frames()
+            with cls._lock:
+                for ident, profile in cls._active.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    profile['samples'][(tuple(cls._spans.get(ident, ())), cls._codes(frame))] += 1
+            del frames
+    
+    @classmethod
+    def collapsed(cls, profile_id=None):
+        """Piles agrégées (ou d'une requête récente) : une ligne « pile compte »"""
+        with cls._lock:
+            if profile_id is None:
+                stacks = Counter(cls._stacks)
+            else:
+                profile = next((p for p in cls._recent if p['id'] == profile_id), None)
+                if profile is None:
+                    return None
+                stacks = profile['samples']
+            return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    
+    @classmethod
+    def get_stats(cls):
+        with cls._lock:
             return {
-                'success': False,
-                'error': str(e),
-                'method': 'Échec'
+                'enabled': cls.enabled(),
+                'interval_ms': PROFILE_INTERVAL_MS,
+                'sample_rate': PROFILE_SAMPLE_RATE,
+                'active_requests': len(cls._active),
+                'samples': sum(cls._stacks.values()),
+                'distinct_stacks': len(cls._stacks),
+                'spans': {name: {
+                    'count': stats['count'],
+                    'avg_ms': round(stats['total_ms'] / stats['count'], 2),
+                    'max_ms': round(stats['max_ms'], 2)
+                } for name, stats in sorted(cls._span_stats.items())},
+                'recent': [{
+                    'id': p['id'],
+                    'label': p['label'],
+                    'timestamp': p['timestamp'],
+                    'duration_ms': p['duration_ms'],
+                    'samples': sum(p['samples'].values()),
+                    'spans': [{'name': name, 'start_ms': offset, 'duration_ms': ms}
+                              for name, offset, ms in p['spans']]
+                } for p in reversed(cls._recent)]
             }
     
     @classmethod
-    def get_stats(cls):
-        """Retourne les statistiques du service VPN"""
-        return {
-            'total_tested': cls._total_tested,
-            'total_working': cls._total_working,
-            'success_rate': f"{cls._total_working/cls._total_tested*100:.1f}%" if cls._total_tested > 0 else "0%",
-            'last_test_duration': f"{cls._last_test_duration:.1f}s",
-            'cache_size': len(cls._proxies_cache) if cls._proxies_cache else 0,
-            'working_cache': len(cls._working_cache),
-            'countries': cls._proxy_countries
-        }
+    def reset(cls):
+        with cls._lock:
+            cls._stacks.clear()
+            cls._span_stats.clear()
+            cls._recent.clear()
+
+class ProfiledSessionInterface(SecureCookieSessionInterface):
+    """Cookie de session signé, avec l'ouverture et l'enregistrement chronométrés.
+    
+    Premier et dernier point touchés par Flask pour chaque requête : c'est
+    ici que commence et se termine le profil d'une requête profilée.
+    """
+    
+    def open_session(self, app, request):
+        if Profiler.enabled() and Profiler.wants(request):
+            Profiler.begin(f"{request.method} {request.path}")
+        with Profiler.span('session.open'):
+            return self.load_session(app, request)
+    
+    def save_session(self, app, session, response):
+        with Profiler.span('session.save'):
+            self.store_session(app, session, response)
+        Profiler.finish(response)
+    
+    def load_session(self, app, request):
+        return super().open_session(app, request)
+    
+    def store_session(self, app, session, response):
+        super().save_session(app, session, response)
 
 # ============================================
-# SERVICE DE MÉMOIRE 24H
+# ÉTAT PARTAGÉ - BACKENDS INJECTABLES
 # ============================================
+#
+# Les services reçoivent un backend d'état au lieu de garder leurs caches
+# dans des attributs de classe. Trois implémentations :
+#   - InProcessState : dict + verrou, propre à chaque worker (défaut)
+#   - SQLiteState    : fichier SQLite partagé entre les workers gunicorn
+#   - SharedMemoryState : segment de mémoire partagée + verrou fichier
+# Interface commune : get, set, delete, update(key, fn), incr, keys(prefix), lock(name), describe().
+# Les valeurs doivent être sérialisables en JSON et traitées comme immuables :
+# pour modifier une liste ou un dict, passer par update().
 
-@app.before_request
-def make_session_permanent():
-    """Active la session permanente pour 24h"""
-    session.permanent = True
-    if 'last_activity' not in session:
-        session['last_activity'] = time.time()
+class FileLock:
+    """Verrou inter-processus basé sur flock (repli sur un verrou de thread)"""
+    
+    _fallback_locks = {}
+    _fallback_guard = threading.Lock()
+    
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.timeout = timeout
+        self._fd = None
+        self._thread_lock = None
+        if fcntl is None:
+            with FileLock._fallback_guard:
+                self._thread_lock = FileLock._fallback_locks.setdefault(path, threading.Lock())
+    
+    def acquire(self):
+        if fcntl is None:
+            if not self._thread_lock.acquire(timeout=-1 if self.timeout is None else self.timeout):
+                raise TimeoutError(f"Verrou {self.path} non obtenu")
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._fd = fd
+                return
+            except BlockingIOError:
+                if deadline is not None and time.monotonic() > deadline:
+                    os.close(fd)
+                    raise TimeoutError(f"Verrou {self.path} non obtenu")
+                time.sleep(0.01)
+    
+    def release(self):
+        if fcntl is None:
+            self._thread_lock.release()
+            return
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc):
+        self.release()
 
-class MemoryService24h:
-    """Service de mémoire avec expiration 24h"""
+class InProcessState:
+    """État en mémoire du processus (chaque worker a le sien)"""
     
-    @staticmethod
-    def init_conversation():
-        """Initialise une nouvelle conversation"""
-        if 'conversation' not in session:
-            session['conversation'] = {
-                'id': hashlib.md5(str(time.time()).encode()).hexdigest()[:8],
-                'created_at': time.time(),
-                'expires_at': time.time() + 86400,  # 24h en secondes
-                'messages': [],
-                'user_info': {},
-                'topics': [],
-                'message_count': 0
-            }
-            session.modified = True
-        return session['conversation']
+    name = 'memory'
     
-    @staticmethod
-    def is_expired():
-        """Vérifie si la session a expiré (24h)"""
-        if 'conversation' not in session:
-            return True
-        
-        expires_at = session['conversation'].get('expires_at', 0)
-        if time.time() > expires_at:
-            session.pop('conversation', None)
-            session.modified = True
-            return True
-        return False
+    def __init__(self, namespace=''):
+        self.namespace = namespace
+        self._data = {}
+        self._lock = threading.RLock()
+        self._locks = {}
     
-    @staticmethod
-    def add_message(role, content):
-        """Ajoute un message à la conversation"""
-        MemoryService24h.init_conversation()
+    def _key(self, key):
+        return f"{self.namespace}{key}"
+    
+    def get(self, key, default=None):
+        with self._lock:
+            return self._data.get(self._key(key), default)
+    
+    def set(self, key, value):
+        with self._lock:
+            self._data[self._key(key)] = value
+    
+    def set_many(self, items):
+        """Écrit plusieurs clés d'un coup ({clé: valeur})"""
+        with self._lock:
+            for key, value in items.items():
+                self._data[self._key(key)] = value
+    
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(self._key(key), None)
+    
+    def update(self, key, fn, default=None):
+        """Lecture-modification-écriture atomique; retourne la nouvelle valeur"""
+        with self._lock:
+            value = fn(self._data.get(self._key(key), default))
+            self._data[self._key(key)] = value
+            return value
+    
+    def incr(self, key, amount=1):
+        return self.update(key, lambda value: (value or 0) + amount, 0)
+    
+    def keys(self, prefix=''):
+        """Clés commençant par `prefix` (sans l'espace de noms)"""
+        start = self._key(prefix)
+        with self._lock:
+            return [key[len(self.namespace):] for key in self._data if key.startswith(start)]
+    
+    def lock(self, name, timeout=None):
+        """Verrou nommé (exclusion entre threads du processus)"""
+        with self._lock:
+            lock = self._locks.setdefault(self._key(name), threading.Lock())
+        return _ThreadLockContext(lock, name, timeout)
+    
+    def describe(self):
+        with self._lock:
+            return {'backend': self.name, 'namespace': self.namespace, 'keys': len(self._data)}
+
+class _ThreadLockContext:
+    """Contexte `with` autour d'un threading.Lock avec timeout"""
+    
+    def __init__(self, lock, name, timeout):
+        self._lock = lock
+        self._name = name
+        self._timeout = timeout
+    
+    def __enter__(self):
+        if not self._lock.acquire(timeout=-1 if self._timeout is None else self._timeout):
+            raise TimeoutError(f"Verrou {self._name} non obtenu")
+        return self
+    
+    def __exit__(self, *exc):
+        self._lock.release()
+
+class SQLiteState:
+    """État partagé entre workers dans un fichier SQLite (WAL)"""
+    
+    name = 'sqlite'
+    
+    def __init__(self, path, namespace=''):
+        self.path = path
+        self.namespace = namespace
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    def _key(self, key):
+        return f"{self.namespace}{key}"
+    
+    def get(self, key, default=None):
+        row = self._connect().execute(
+            "SELECT value FROM state WHERE key = ?", (self._key(key),)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+    
+    def set(self, key, value):
+        self._connect().execute(
+            "INSERT INTO state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (self._key(key), json.dumps(value))
+        )
+    
+    def set_many(self, items):
+        """Écrit plusieurs clés dans une seule transaction (un seul commit WAL)"""
+        rows = [(self._key(key), json.dumps(value)) for key, value in items.items()]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO state (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                rows
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def delete(self, key):
+        self._connect().execute("DELETE FROM state WHERE key = ?", (self._key(key),))
+    
+    def update(self, key, fn, default=None):
+        """Lecture-modification-écriture dans une transaction IMMEDIATE"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM state WHERE key = ?", (self._key(key),)).fetchone()
+            value = fn(json.loads(row[0]) if row else default)
+            conn.execute(
+                "INSERT INTO state (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (self._key(key), json.dumps(value))
+            )
+            conn.execute("COMMIT")
+            return value
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def incr(self, key, amount=1):
+        return self.update(key, lambda value: (value or 0) + amount, 0)
+    
+    def keys(self, prefix=''):
+        """Clés commençant par `prefix` (parcours de l'index de clé primaire)"""
+        start = self._key(prefix)
+        rows = self._connect().execute(
+            "SELECT key FROM state WHERE key >= ? AND key < ?", (start, start + '\U0010ffff')
+        ).fetchall()
+        return [key[len(self.namespace):] for key, in rows]
+    
+    def lock(self, name, timeout=None):
+        """Verrou nommé partagé entre tous les workers utilisant ce fichier"""
+        safe_name = hashlib.md5(self._key(name).encode()).hexdigest()[:16]
+        return FileLock(f"{self.path}.{safe_name}.lock", timeout)
+    
+    def describe(self):
+        count = self._connect().execute("SELECT COUNT(*) FROM state").fetchone()[0]
+        return {'backend': self.name, 'namespace': self.namespace, 'path': self.path, 'keys': count}
+
+class StateFullError(MemoryError):
+    """Écriture refusée : l'état ne tient plus dans le segment de mémoire partagée"""
+
+class SharedMemoryState:
+    """État partagé dans un segment de mémoire partagée (JSON + verrou fichier).
+    
+    Adapté aux petits états (compteurs, listes de proxies fonctionnels) :
+    chaque opération relit et réécrit tout le segment sous verrou. Le
+    segment a une taille fixe (STATE_SHM_SIZE_MB); une écriture qui le
+    ferait déborder lève StateFullError et laisse l'état inchangé.
+    """
+    
+    name = 'shm'
+    bounded = True  # taille fixe : les grosses listes y sont plafonnées
+    HEADER = 4  # longueur du JSON (uint32)
+    
+    def __init__(self, segment='benbot_state', size=None, namespace=''):
+        from multiprocessing import shared_memory
         
-        if MemoryService24h.is_expired():
-            MemoryService24h.init_conversation()
+        self.segment = segment
+        self.size = size or STATE_SHM_SIZE_MB * 1024 * 1024
+        self.namespace = namespace
+        self._lock_path = os.path.join(tempfile.gettempdir(), f"{segment}.lock")
+        with FileLock(self._lock_path):
+            try:
+                self._shm = shared_memory.SharedMemory(name=segment, create=True, size=self.size)
+                self._shm.buf[:self.HEADER] = (0).to_bytes(self.HEADER, 'little')
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=segment)
+        # Le segment doit survivre à la fin d'un worker
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        except Exception:
+            pass
+    
+    def _read(self):
+        length = int.from_bytes(bytes(self._shm.buf[:self.HEADER]), 'little')
+        if not length:
+            return {}
+        return json.loads(bytes(self._shm.buf[self.HEADER:self.HEADER + length]).decode('utf-8'))
+    
+    def _write(self, data, key=None):
+        payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        if len(payload) + self.HEADER > self._shm.size:
+            culprit = f", clé {key!r} : {len(json.dumps(data.get(key)))} octets" if key is not None else ''
+            raise StateFullError(f"Segment {self.segment} plein ({len(payload)} octets > {self._shm.size}{culprit}); "
+                                 f"augmenter STATE_SHM_SIZE_MB ou passer à STATE_BACKEND=sqlite")
+        self._shm.buf[self.HEADER:self.HEADER + len(payload)] = payload
+        self._shm.buf[:self.HEADER] = len(payload).to_bytes(self.HEADER, 'little')
+    
+    def _key(self, key):
+        return f"{self.namespace}{key}"
+    
+    def get(self, key, default=None):
+        with FileLock(self._lock_path):
+            return self._read().get(self._key(key), default)
+    
+    def set(self, key, value):
+        self.update(key, lambda _: value)
+    
+    def set_many(self, items):
+        with FileLock(self._lock_path):
+            data = self._read()
+            data.update((self._key(key), value) for key, value in items.items())
+            self._write(data)
+    
+    def delete(self, key):
+        with FileLock(self._lock_path):
+            data = self._read()
+            if data.pop(self._key(key), None) is not None:
+                self._write(data)
+    
+    def update(self, key, fn, default=None):
+        with FileLock(self._lock_path):
+            data = self._read()
+            value = fn(data.get(self._key(key), default))
+            data[self._key(key)] = value
+            self._write(data, self._key(key))
+            return value
+    
+    def incr(self, key, amount=1):
+        return self.update(key, lambda value: (value or 0) + amount, 0)
+    
+    def keys(self, prefix=''):
+        start = self._key(prefix)
+        with FileLock(self._lock_path):
+            return [key[len(self.namespace):] for key in self._read() if key.startswith(start)]
+    
+    def lock(self, name, timeout=None):
+        safe_name = hashlib.md5(self._key(name).encode()).hexdigest()[:16]
+        return FileLock(os.path.join(tempfile.gettempdir(), f"{self.segment}.{safe_name}.lock"), timeout)
+    
+    def describe(self):
+        with FileLock(self._lock_path):
+            length = int.from_bytes(bytes(self._shm.buf[:self.HEADER]), 'little')
+            keys = len(self._read())
+        return {'backend': self.name, 'namespace': self.namespace, 'segment': self.segment,
+                'used_bytes': length, 'size_bytes': self.size, 'keys': keys}
+
+def create_state_backend(kind=None, path=None, partition=None):
+    """Construit le backend d'état depuis la configuration (STATE_BACKEND...)"""
+    kind = (kind or STATE_BACKEND).lower()
+    partition = (partition or STATE_PARTITION).lower()
+    # 'worker' : chaque processus garde ses propres clés (partitionnement volontaire)
+    namespace = f"pid{os.getpid()}:" if partition == 'worker' else ''
+    
+    if kind == 'sqlite':
+        return SQLiteState(path or STATE_PATH or os.path.join(tempfile.gettempdir(), 'benbot_state.db'), namespace)
+    if kind == 'shm':
+        return SharedMemoryState(path or STATE_PATH or 'benbot_state', namespace=namespace)
+    return InProcessState(namespace)
+
+# ============================================
+# STOCKAGE RÉPARTI DES SESSIONS (SHARDS)
+# ============================================
+
+def new_conversation_id():
+    """Identifiant sans collision : secondes (hex, triable) + 80 bits aléatoires"""
+    return f"{int(time.time()):08x}{os.urandom(10).hex()}"
+
+class ShardedStore:
+    """Clés réparties sur plusieurs backends d'état par hachage de rendez-vous.
+    
+    Chaque clé appartient au shard de plus haut score hash(shard, clé) :
+    ajouter ou retirer un shard ne déplace que les clés concernées (~1/N).
+    Les écritures prennent le verrou de leur seul shard; avec des fichiers
+    SQLite, deux shards n'ont jamais de verrou d'écriture commun. Tant qu'un
+    rebalancement est en attente (au démarrage, le nombre de shards a pu
+    changer; après add_shard), une clé absente de son shard est cherchée sur
+    les autres et déplacée à la lecture; rebalance() déplace le reste. Les
+    ajouts et retraits remplacent la table des shards sans la modifier : les
+    lectures concurrentes travaillent sur un instantané cohérent.
+    """
+    
+    def __init__(self, shards, migrating=True):
+        self.shards = OrderedDict(shards)  # nom -> backend d'état (remplacé, jamais modifié)
+        self._locks = {name: threading.Lock() for name in self.shards}
+        self._retired = {}  # shards en cours de retrait, encore lus
+        self._membership = threading.Lock()
+        self._epoch = 0
+        self.migrating = migrating
+        self._stats = Counter()
+    
+    @staticmethod
+    def _score(shard, key):
+        digest = hashlib.blake2b(f"{shard}\0{key}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+    
+    def owner(self, key, shards=None):
+        return max(shards or self.shards, key=lambda shard: self._score(shard, key))
+    
+    def get(self, key, default=None):
+        shards = self.shards
+        owner = self.owner(key, shards)
+        value = shards[owner].get(key)
+        if value is not None:
+            return value
+        if not self.migrating and not self._retired:
+            return default
+        # Clé encore sur son ancien shard : déplacée à la lecture
+        for name, backend in list(shards.items()) + list(self._retired.items()):
+            if name != owner:
+                value = backend.get(key)
+                if value is not None:
+                    return self._move(key, (name, backend), (owner, shards[owner]), value)
+        return default
+    
+    def set(self, key, value):
+        shards = self.shards
+        owner = self.owner(key, shards)
+        with self._locks[owner]:
+            shards[owner].set(key, value)
+        self._stats[f'writes:{owner}'] += 1
+    
+    def set_many(self, items):
+        """Écritures groupées par shard : une transaction par shard concerné"""
+        shards = self.shards
+        by_owner = {}
+        for key, value in items.items():
+            by_owner.setdefault(self.owner(key, shards), {})[key] = value
+        for owner, batch in by_owner.items():
+            with self._locks[owner]:
+                shards[owner].set_many(batch)
+            self._stats[f'writes:{owner}'] += len(batch)
+            self._stats['transactions'] += 1
+    
+    def delete(self, key):
+        for name, backend in list(self.shards.items()) + list(self._retired.items()):
+            with self._locks[name]:
+                backend.delete(key)
+    
+    def _move(self, key, source, target, value):
+        """Copie vers `target` sans écraser une valeur plus récente, puis supprime de `source`"""
+        (source, source_backend), (target, target_backend) = source, target
+        with self._locks[target]:
+            value = target_backend.update(key, lambda current: value if current is None else current)
+        with self._locks[source]:
+            source_backend.delete(key)
+        self._stats['moved'] += 1
+        return value
+    
+    def add_shard(self, name, backend):
+        """Ajoute un shard à chaud : ses clés arrivent à la lecture ou par rebalance()"""
+        with self._membership:
+            self._locks = dict(self._locks, **{name: threading.Lock()})
+            self._epoch += 1
+            self.migrating = True
+            self.shards = OrderedDict(list(self.shards.items()) + [(name, backend)])
+    
+    def remove_shard(self, name):
+        """Retire un shard après avoir déplacé toutes ses clés (lu jusque-là)"""
+        with self._membership:
+            backend = self.shards[name]
+            self._retired = dict(self._retired, **{name: backend})
+            self.shards = OrderedDict((other, shard) for other, shard in self.shards.items() if other != name)
+        shards = self.shards
+        for key in backend.keys():
+            value = backend.get(key)
+            if value is not None:
+                target = self.owner(key, shards)
+                with self._locks[target]:
+                    shards[target].update(key, lambda current: value if current is None else current)
+                self._stats['moved'] += 1
+        with self._membership:
+            self._retired = {other: shard for other, shard in self._retired.items() if other != name}
+            self._locks = {other: lock for other, lock in self._locks.items() if other != name}
+        return backend
+    
+    def rebalance(self, prefix='', expired=None):
+        """Déplace les clés mal placées (et supprime celles pour qui `expired(valeur)`)"""
+        epoch = self._epoch
+        shards = self.shards
+        moved = purged = 0
+        for name, backend in shards.items():
+            for key in backend.keys(prefix):
+                value = backend.get(key)
+                if value is None:
+                    continue
+                if expired is not None and expired(value):
+                    with self._locks[name]:
+                        backend.delete(key)
+                    purged += 1
+                elif self.owner(key, shards) != name:
+                    owner = self.owner(key, shards)
+                    self._move(key, (name, backend), (owner, shards[owner]), value)
+                    moved += 1
+        with self._membership:
+            if self._epoch == epoch:  # aucun shard ajouté entre-temps
+                self.migrating = False
+        return {'moved': moved, 'purged': purged}
+    
+    def describe(self):
+        return {
+            'shards': {name: backend.describe() for name, backend in self.shards.items()},
+            'migrating': self.migrating,
+            'moved': self._stats['moved'],
+            'writes': {name: self._stats[f'writes:{name}'] for name in self.shards},
+            'batched_transactions': self._stats['transactions']
+        }
+
+def create_session_store(count=None, path=None, write_behind_ms=None):
+    """Shards SQLite (un fichier par shard) si `path`, sinon instances en mémoire du processus.
+    
+    Avec `write_behind_ms` (défaut SESSION_WRITE_BEHIND_MS) non nul, les
+    écritures passent par un WriteBehindStore.
+    """
+    count = count or SESSION_SHARDS
+    path = path or SESSION_SHARD_PATH
+    write_behind_ms = SESSION_WRITE_BEHIND_MS if write_behind_ms is None else write_behind_ms
+    if path:
+        os.makedirs(path, exist_ok=True)
+        store = ShardedStore((f'shard{i}', SQLiteState(os.path.join(path, f'sessions-{i}.db')))
+                             for i in range(count))
+    else:
+        store = ShardedStore((f'shard{i}', InProcessState()) for i in range(count))
+    if write_behind_ms > 0:
+        return WriteBehindStore(store, interval=write_behind_ms / 1000)
+    return store
+
+class WriteBehindStore:
+    """Écritures de sessions différées et regroupées devant un ShardedStore.
+    
+    set() et delete() ne touchent que le tampon du processus. Un thread
+    l'écrit par lots (une transaction par shard) toutes les `interval`
+    secondes, ou dès `max_pending` clés en attente; flush() est aussi
+    appelé à l'arrêt du processus. Plusieurs écritures d'une même session
+    entre deux vidages n'en font qu'une. Les lectures passent d'abord par le
+    tampon : un worker relit toujours ses propres écritures, les autres
+    voient la session au plus `interval` secondes plus tard.
+    """
+    
+    def __init__(self, store, interval=None, max_pending=None):
+        self.store = store
+        self.interval = SESSION_WRITE_BEHIND_MS / 1000 if interval is None else interval
+        self.max_pending = max_pending or SESSION_WRITE_BEHIND_MAX
+        self._pending = OrderedDict()  # clé -> JSON (None : suppression)
+        self._flushing = {}  # lot en cours d'écriture, encore visible en lecture
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stats = Counter()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+    
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._pending:
+                text = self._pending[key]
+            elif key in self._flushing:
+                text = self._flushing[key]
+            else:
+                text = False
+        if text is False:
+            return self.store.get(key, default)
+        # Copie indépendante : la requête peut modifier la session pendant un vidage
+        return default if text is None else json.loads(text)
+    
+    def _buffer(self, key, text):
+        self._ensure_started()
+        with self._lock:
+            self._stats['buffered'] += 1
+            if key in self._pending:
+                self._stats['coalesced'] += 1
+            self._pending[key] = text
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+    
+    def set(self, key, value):
+        self._buffer(key, json.dumps(value))
+    
+    def delete(self, key):
+        self._buffer(key, None)
+    
+    def flush(self):
+        """Écrit le tampon : set_many groupé par shard, puis les suppressions"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, OrderedDict()
+                self._flushing = batch
+            if not batch:
+                return 0
+            try:
+                writes = {key: json.loads(text) for key, text in batch.items() if text is not None}
+                if writes:
+                    self.store.set_many(writes)
+                for key in [key for key, text in batch.items() if text is None]:
+                    self.store.delete(key)
+            except Exception:
+                # Remis en attente sans écraser les écritures arrivées depuis
+                with self._lock:
+                    for key, text in batch.items():
+                        self._pending.setdefault(key, text)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['written'] += len(batch)
+            return len(batch)
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Écriture des sessions: {str(e)}")
+    
+    def _ensure_started(self):
+        """Démarre le thread de vidage dans ce processus (après un fork aussi)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._flush_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='session-write-behind', daemon=True)
+            self._thread.start()
+    
+    def add_shard(self, name, backend):
+        self.flush()
+        self.store.add_shard(name, backend)
+    
+    def remove_shard(self, name):
+        self.flush()
+        return self.store.remove_shard(name)
+    
+    def rebalance(self, prefix='', expired=None):
+        self.flush()
+        return self.store.rebalance(prefix, expired)
+    
+    def describe(self):
+        with self._lock:
+            stats = {
+                'interval_ms': round(self.interval * 1000),
+                'pending': len(self._pending),
+                'buffered': self._stats['buffered'],
+                'coalesced': self._stats['coalesced'],
+                'flushes': self._stats['flushes'],
+                'written': self._stats['written']
+            }
+        return dict(self.store.describe(), write_behind=stats)
+
+class ServerSession(SecureCookieSession):
+    """Session dont le contenu reste côté serveur; le cookie ne porte que l'identifiant signé"""
+    
+    def __init__(self, initial=None, sid=None, new=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.new = new
+
+class ShardedSessionInterface(ProfiledSessionInterface):
+    """Sessions stockées dans un ShardedStore (conversation hors du cookie de 4 Ko)"""
+    
+    KEY_PREFIX = 'session:'
+    MAINTENANCE_INTERVAL = 3600  # rebalancement + purge des sessions expirées
+    BOOKKEEPING = frozenset(('_permanent', 'last_activity'))  # posées à chaque requête, sans contenu
+    session_class = ServerSession
+    
+    def __init__(self, store):
+        self.store = store
+        self._maintenance = None
+        self._pid = None
+        self._lock = threading.Lock()
+    
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='benbot-session-id')
+    
+    def load_session(self, app, request):
+        self._ensure_maintenance()
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                record = self.store.get(self.KEY_PREFIX + sid)
+                if record and record['expires_at'] > time.time():
+                    return self.session_class(record['data'], sid=sid)
+        return self.session_class(sid=os.urandom(16).hex(), new=True)
+    
+    def store_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
         
-        session['conversation']['messages'].append({
-            'id': len(session['conversation']['messages']),
-            'role': role,
-            'content': content,
-            'timestamp': time.time(),
-            'time_str': datetime.now().strftime('%H:%M'),
-            'date_str': datetime.now().strftime('%d/%m/%Y')
-        })
+        if session.accessed:
+            response.vary.add('Cookie')
         
-        session['conversation']['message_count'] += 1
+        # Session sans contenu : ni fiche ni cookie (un visiteur sans conversation ne coûte rien)
+        if not session.keys() - self.BOOKKEEPING:
+            if session.modified and not session.new:
+                self.store.delete(self.KEY_PREFIX + session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
         
-        # Garder seulement les 50 derniers messages
-        if len(session['conversation']['messages']) > 50:
-            session['conversation']['messages'] = session['conversation']['messages'][-50:]
+        if not self.should_set_cookie(app, session):
+            return
         
-        session.modified = True
-        return session['conversation']
+        # Écriture seulement si le contenu a changé (pas au simple renouvellement du cookie)
+        if session.modified:
+            lifetime = app.permanent_session_lifetime.total_seconds()
+            self.store.set(self.KEY_PREFIX + session.sid,
+                           {'data': dict(session), 'expires_at': time.time() + lifetime})
+        response.set_cookie(name, self._signer(app).sign(session.sid).decode(),
+                            expires=self.get_expiration_time(app, session), httponly=httponly,
+                            domain=domain, path=path, secure=secure, samesite=samesite)
+        response.vary.add('Cookie')
+    
+    def maintain(self):
+        """Rebalancement des shards et purge des sessions expirées"""
+        now = time.time()
+        return self.store.rebalance(self.KEY_PREFIX, expired=lambda record: record.get('expires_at', 0) < now)
+    
+    def _run_maintenance(self):
+        while True:
+            try:
+                result = self.maintain()
+                if result['moved'] or result['purged']:
+                    print(f"🗂️ Sessions: {result['moved']} déplacées, {result['purged']} expirées supprimées")
+            except Exception as e:
+                print(f"❌ Maintenance des sessions: {str(e)}")
+            time.sleep(self.MAINTENANCE_INTERVAL)
+    
+    def _ensure_maintenance(self):
+        """Démarre le thread de maintenance dans ce processus (après un fork aussi)"""
+        if self._maintenance is not None and self._maintenance.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._maintenance is not None and self._maintenance.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._maintenance = threading.Thread(target=self._run_maintenance, name='session-maintenance',
+                                                 daemon=True)
+            self._maintenance.start()
+
+# ============================================
+# PRÉ-FILTRAGE ASYNCHRONE DES PROXIES (SOCKETS BRUTES)
+# ============================================
+
+class AsyncProxyScreener:
+    """Pré-filtre des milliers de candidats par connexions TCP non bloquantes.
+    
+    Seuls les proxies qui acceptent une connexion dans `timeout` passent à la
+    validation HTTP complète (VPNService.probe_proxy). Un nombre fixe de
+    coroutines consomme la liste : la mémoire reste constante quelle que soit
+    la taille de la liste de candidats.
+    """
+    
+    def __init__(self, concurrency=500, timeout=0.8, budget=None):
+        self.concurrency = self.max_concurrency(concurrency)
+        self.timeout = timeout
+        self.budget = budget  # durée max du pré-filtrage (secondes)
+        self.last_stats = None
     
     @staticmethod
-    def get_context(limit=10):
-        """Récupère le contexte de conversation"""
-        if MemoryService24h.is_expired():
-            return []
+    def max_concurrency(requested):
+        """Borne la concurrence selon la limite de descripteurs du processus"""
+        try:
+            import resource
+            soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+            if soft != resource.RLIM_INFINITY:
+                return max(1, min(requested, soft - 128))
+        except (ImportError, ValueError, OSError):
+            pass
+        return max(1, requested)
+    
+    @staticmethod
+    def parse(proxy):
+        """'ip:port' -> ('ip', port) ou None"""
+        try:
+            host, port = proxy.rsplit(':', 1)
+            port = int(port)
+        except (ValueError, AttributeError):
+            return None
+        if not 0 < port < 65536:
+            return None
+        return host, port
+    
+    async def _connect(self, loop, address):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        start = loop.time()
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, address), self.timeout)
+            return int((loop.time() - start) * 1000)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        finally:
+            sock.close()
+    
+    async def _run(self, candidates, stop_after):
+        loop = asyncio.get_running_loop()
+        deadline = None if self.budget is None else loop.time() + self.budget
+        pending = iter(candidates)
+        passed = []
+        counters = {'checked': 0, 'invalid': 0, 'stopped': None}
         
-        conversation = session.get('conversation', {})
-        messages = conversation.get('messages', [])
-        return messages[-limit:]
+        async def worker():
+            # L'itérateur est partagé : la boucle asyncio est mono-thread
+            for proxy in pending:
+                if counters['stopped']:
+                    return
+                if deadline is not None and loop.time() > deadline:
+                    counters['stopped'] = 'budget'
+                    return
+                address = self.parse(proxy)
+                if address is None:
+                    counters['invalid'] += 1
+                    continue
+                latency = await self._connect(loop, address)
+                counters['checked'] += 1
+                if latency is not None:
+                    passed.append((proxy, latency))
+                    if stop_after and len(passed) >= stop_after:
+                        counters['stopped'] = 'enough'
+        
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return passed, counters
+    
+    def screen(self, candidates, stop_after=None):
+        """Retourne [(proxy, latence_connexion_ms)] triés du plus rapide au plus lent"""
+        start = time.perf_counter()
+        passed, counters = asyncio.run(self._run(candidates, stop_after))
+        duration = time.perf_counter() - start
+        passed.sort(key=lambda item: item[1])
+        self.last_stats = {
+            'candidates': len(candidates),
+            'checked': counters['checked'],
+            'invalid': counters['invalid'],
+            'passed': len(passed),
+            'stopped': counters['stopped'],
+            'concurrency': self.concurrency,
+            'duration': round(duration, 3),
+            'rate_per_second': round(counters['checked'] / duration, 1) if duration > 0 else 0.0
+        }
+        return passed
+
+# ============================================
+# SOURCES DE PROXIES - CONFIGURATION ET PLANIFICATION ADAPTATIVE
+# ============================================
+
+def load_proxy_sources(path=None):
+    """Charge la liste des sources depuis le fichier de configuration JSON"""
+    path = path or PROXY_SOURCES_FILE
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"❌ Sources de proxies illisibles ({path}): {str(e)}")
+        return []
+    
+    sources = []
+    for entry in data.get('sources', []):
+        if entry.get('enabled', True) and entry.get('url'):
+            sources.append({
+                'name': entry.get('name') or hashlib.md5(entry['url'].encode()).hexdigest()[:10],
+                'url': entry['url'],
+                'parser': entry.get('parser', 'default'),
+                'group': entry.get('group', 'global')
+            })
+    return sources
+
+class ProxySourceScheduler:
+    """Statistiques par source (rendement, recouvrement, latence, taux de
+    proxies fonctionnels) et planification des rafraîchissements.
+    
+    Les sources productives sont rechargées à chaque cycle; les sources en
+    échec, vides ou qui ne font que dupliquer les autres sont espacées.
+    La dernière liste de chaque source est gardée dans l'état partagé en
+    entier, sauf sur un backend de taille fixe (shm) où seules ses
+    BOUNDED_MAX_PROXIES premières entrées sont gardées
+    (PROXY_SOURCE_MAX_PROXIES impose un plafond sur tous les backends).
+    """
+    
+    BASE_INTERVAL = 600  # = VPNService.CACHE_DURATION
+    MAX_PROXIES = int(os.environ.get('PROXY_SOURCE_MAX_PROXIES', '0'))  # par source, 0 : sans plafond
+    BOUNDED_MAX_PROXIES = 5000  # par source, backend de taille fixe
+    MIN_INTERVAL = 300
+    MAX_INTERVAL = 6 * 3600
+    OVERLAP_THRESHOLD = 0.9  # au-delà : source considérée comme doublon
+    EWMA_ALPHA = 0.3
+    
+    def __init__(self, state):
+        self.state = state
     
     @staticmethod
-    def get_conversation_summary():
-        """Résumé de la conversation"""
-        if MemoryService24h.is_expired():
+    def source_id(source):
+        return source.get('name') or hashlib.md5(source['url'].encode()).hexdigest()[:10]
+    
+    def get_all_stats(self):
+        return self.state.get('vpn:sources:stats') or {}
+    
+    def get_proxies(self, source):
+        """Dernière liste connue d'une source"""
+        return self.state.get(f"vpn:sources:proxies:{self.source_id(source)}") or []
+    
+    def max_proxies(self):
+        """Plafond par source (0 : liste complète)"""
+        if self.MAX_PROXIES:
+            return self.MAX_PROXIES
+        return self.BOUNDED_MAX_PROXIES if getattr(self.state, 'bounded', False) else 0
+    
+    def due_sources(self, sources, now=None, force=False):
+        """Sources à recharger maintenant (toutes si force ou jamais chargées)"""
+        now = time.time() if now is None else now
+        stats = self.get_all_stats()
+        due = []
+        for source in sources:
+            entry = stats.get(self.source_id(source))
+            if force or entry is None or now >= entry.get('next_fetch', 0):
+                due.append(source)
+        return due
+    
+    def _ewma(self, previous, value):
+        if previous is None:
+            return value
+        return previous + self.EWMA_ALPHA * (value - previous)
+    
+    def next_interval(self, entry):
+        """Intervalle avant le prochain chargement d'après la qualité de la source"""
+        if entry.get('consecutive_failures'):
+            return min(self.MAX_INTERVAL, self.BASE_INTERVAL * 2 ** entry['consecutive_failures'])
+        if entry.get('empty_streak'):
+            return min(self.MAX_INTERVAL, self.BASE_INTERVAL * 2 ** entry['empty_streak'])
+        
+        # Une source vaut par ce qu'elle est seule à apporter ou par sa couverture
+        # (une liste « mère » recoupe toutes les autres mais reste indispensable)
+        unique_ratio = 1 - entry.get('overlap_ratio', 0)
+        coverage = entry.get('coverage', 1.0)
+        tested = entry.get('tested', 0)
+        working_ratio = entry.get('working', 0) / tested if tested else 0.05
+        # Un taux de 10% de proxies fonctionnels est déjà excellent pour des listes publiques
+        score = 0.6 * max(unique_ratio, coverage) + 0.4 * min(1.0, working_ratio * 10)
+        interval = self.BASE_INTERVAL * (1 + 3 * (1 - score))
+        if entry.get('overlap_ratio', 0) >= self.OVERLAP_THRESHOLD and coverage < 0.5:
+            interval *= 2
+        return int(max(self.MIN_INTERVAL, min(self.MAX_INTERVAL, interval)))
+    
+    def validators(self, source):
+        """ETag / Last-Modified du dernier chargement (si sa liste est encore connue)"""
+        entry = self.get_all_stats().get(self.source_id(source)) or {}
+        if not self.state.get(f"vpn:sources:proxies:{self.source_id(source)}"):
             return None
+        return {'etag': entry.get('etag'), 'last_modified': entry.get('last_modified')}
+    
+    def record_fetch(self, source, fetch):
+        """Enregistre le résultat d'un chargement (proxies, octets, latence, erreur)
+        et retourne le diff avec la liste précédente ({'added', 'removed'})"""
+        source_id = self.source_id(source)
+        now = time.time()
+        diff = {'added': [], 'removed': []}
+        if fetch.get('not_modified'):
+            fetch = dict(fetch, proxies=self.get_proxies(source))
+        elif fetch.get('error') is None:
+            limit = self.max_proxies()
+            truncated = max(0, len(fetch['proxies']) - limit) if limit else 0
+            if truncated:
+                print(f"⚠️ Source {source_id}: {truncated} proxies ignorés "
+                      f"(plafond de {limit} par source, backend {self.state.name})")
+                fetch = dict(fetch, proxies=fetch['proxies'][:limit])
+            fetch = dict(fetch, truncated=truncated)
+            previous = set(self.get_proxies(source))
+            current = set(fetch['proxies'])
+            try:
+                self.state.set(f"vpn:sources:proxies:{source_id}", fetch['proxies'])
+                diff = {'added': list(current - previous), 'removed': list(previous - current)}
+            except StateFullError as e:
+                # L'ancienne liste reste en place; la source est réessayée plus tard
+                print(f"❌ Source {source_id}: {str(e)}")
+                fetch = dict(fetch, error='state_full', proxies=None)
         
-        conv = session.get('conversation', {})
-        messages = conv.get('messages', [])
+        def update(stats):
+            stats = dict(stats or {})
+            entry = dict(stats.get(source_id) or {'name': source_id, 'url': source['url'], 'fetches': 0,
+                                                   'failures': 0, 'bytes_total': 0, 'tested': 0, 'working': 0})
+            entry['fetches'] += 1
+            entry['last_fetch'] = now
+            entry['latency_ms'] = round(self._ewma(entry.get('latency_ms'), fetch['latency_ms']), 1)
+            entry['bytes_total'] += fetch.get('bytes', 0)
+            entry['last_bytes'] = fetch.get('bytes', 0)
+            if fetch.get('error') is not None:
+                entry['failures'] += 1
+                entry['consecutive_failures'] = entry.get('consecutive_failures', 0) + 1
+                entry['last_error'] = fetch['error']
+            else:
+                entry['consecutive_failures'] = 0
+                if fetch.get('not_modified'):
+                    entry['not_modified'] = entry.get('not_modified', 0) + 1
+                else:
+                    entry['last_bytes_full'] = fetch.get('bytes', 0)
+                entry['etag'] = fetch.get('etag') or entry.get('etag')
+                entry['last_modified'] = fetch.get('last_modified') or entry.get('last_modified')
+                entry['last_added'] = len(diff['added'])
+                entry['last_removed'] = len(diff['removed'])
+                entry['last_truncated'] = fetch.get('truncated', 0)
+                entry['last_yield'] = len(fetch['proxies'])
+                entry['yield_avg'] = round(self._ewma(entry.get('yield_avg'), len(fetch['proxies'])), 1)
+                entry['empty_streak'] = 0 if fetch['proxies'] else entry.get('empty_streak', 0) + 1
+            entry['interval'] = self.next_interval(entry)
+            entry['next_fetch'] = now + entry['interval']
+            stats[source_id] = entry
+            return stats
         
-        if messages and len(messages) > 0:
-            start_time = messages[0].get('timestamp', time.time())
-            duration = time.time() - start_time
-            hours = int(duration // 3600)
-            minutes = int((duration % 3600) // 60)
-        else:
-            hours, minutes = 0, 0
+        self.state.update('vpn:sources:stats', update)
+        return diff
+    
+    def record_skip(self, sources):
+        """Compte les chargements évités (bande passante économisée)"""
+        def update(stats):
+            stats = dict(stats or {})
+            for source in sources:
+                source_id = self.source_id(source)
+                if source_id in stats:
+                    entry = dict(stats[source_id])
+                    entry['skipped'] = entry.get('skipped', 0) + 1
+                    stats[source_id] = entry
+            return stats
         
+        if sources:
+            self.state.update('vpn:sources:stats', update)
+    
+    def record_overlap(self, lists):
+        """Recouvrement de chaque source avec l'union des autres ({id: [proxies]})"""
+        counts = {}
+        for proxies in lists.values():
+            for proxy in set(proxies):
+                counts[proxy] = counts.get(proxy, 0) + 1
+        
+        def update(stats):
+            stats = dict(stats or {})
+            for source_id, proxies in lists.items():
+                if source_id not in stats:
+                    continue
+                unique_set = set(proxies)
+                unique = sum(1 for proxy in unique_set if counts[proxy] == 1)
+                entry = dict(stats[source_id])
+                entry['unique'] = unique
+                entry['overlap_ratio'] = round(1 - unique / len(unique_set), 3) if unique_set else 0.0
+                entry['coverage'] = round(len(unique_set) / len(counts), 3) if counts else 0.0
+                entry['interval'] = self.next_interval(entry)
+                entry['next_fetch'] = entry.get('last_fetch', 0) + entry['interval']
+                stats[source_id] = entry
+            return stats
+        
+        self.state.update('vpn:sources:stats', update)
+    
+    def record_results(self, sources, tested, working):
+        """Attribue les proxies testés/fonctionnels aux sources qui les listent"""
+        tested = set(tested)
+        working = set(working)
+        if not tested:
+            return
+        hits = {}
+        for source in sources:
+            proxies = set(self.get_proxies(source))
+            source_tested = len(tested & proxies)
+            if source_tested:
+                hits[self.source_id(source)] = (source_tested, len(working & proxies))
+        
+        def update(stats):
+            stats = dict(stats or {})
+            for source_id, (source_tested, source_working) in hits.items():
+                if source_id in stats:
+                    entry = dict(stats[source_id])
+                    entry['tested'] = entry.get('tested', 0) + source_tested
+                    entry['working'] = entry.get('working', 0) + source_working
+                    entry['working_ratio'] = round(entry['working'] / entry['tested'], 4)
+                    stats[source_id] = entry
+            return stats
+        
+        if hits:
+            self.state.update('vpn:sources:stats', update)
+    
+    def report(self, sources):
+        """Vue d'ensemble pour l'API"""
+        stats = self.get_all_stats()
+        now = time.time()
+        rows = []
+        bytes_saved = 0
+        for source in sources:
+            entry = stats.get(self.source_id(source), {})
+            full_size = entry.get('last_bytes_full', entry.get('last_bytes', 0))
+            bytes_saved += (entry.get('skipped', 0) + entry.get('not_modified', 0)) * full_size
+            rows.append({
+                'name': self.source_id(source),
+                'group': source.get('group'),
+                'fetches': entry.get('fetches', 0),
+                'skipped': entry.get('skipped', 0),
+                'failures': entry.get('failures', 0),
+                'not_modified': entry.get('not_modified', 0),
+                'last_added': entry.get('last_added'),
+                'last_removed': entry.get('last_removed'),
+                'last_yield': entry.get('last_yield'),
+                'unique': entry.get('unique'),
+                'overlap_ratio': entry.get('overlap_ratio'),
+                'coverage': entry.get('coverage'),
+                'latency_ms': entry.get('latency_ms'),
+                'working_ratio': entry.get('working_ratio'),
+                'interval': entry.get('interval'),
+                'next_fetch_in': int(entry['next_fetch'] - now) if entry.get('next_fetch') else 0
+            })
+        rows.sort(key=lambda row: (row['unique'] or 0), reverse=True)
         return {
-            'id': conv.get('id'),
-            'message_count': len(messages),
-            'duration': f"{hours}h{minutes}min",
-            'created_at': datetime.fromtimestamp(conv.get('created_at', time.time())).strftime('%H:%M %d/%m/%Y'),
-            'expires_at': datetime.fromtimestamp(conv.get('expires_at', time.time())).strftime('%H:%M %d/%m/%Y'),
-            'time_remaining': int(conv.get('expires_at', 0) - time.time())
+            'sources': rows,
+            'bytes_total': sum(entry.get('bytes_total', 0) for entry in stats.values()),
+            'bytes_saved_estimate': bytes_saved
         }
+
+class ProxyLivenessQueue:
+    """File de validation persistante ordonnée par probabilité de fonctionner.
+    
+    Le score combine, pour chaque candidat :
+    - l'historique de ses tests (succès / échecs, avec demi-vie)
+    - la qualité des sources qui le listent et leur nombre
+    - le taux de succès observé sur son port
+    - la fraîcheur de son apparition dans les listes
+    L'historique vit dans l'état partagé et survit aux redémarrages.
+    """
+    
+    HALF_LIFE = 6 * 3600  # poids d'un ancien test divisé par 2 toutes les 6h
+    DEFAULT_PRIOR = 0.05
+    PRIOR_WEIGHT = 2.0  # tests « virtuels » accordés à l'a priori
+    PORT_SMOOTHING = 20.0
+    FRESH_WINDOW = 3600
+    HISTORY_MAX = 20000
+    
+    def __init__(self, state, sources):
+        self.state = state
+        self.sources = sources
     
     @staticmethod
-    def remember_info(key, value):
-        """Mémorise une information utilisateur"""
-        if MemoryService24h.is_expired():
-            MemoryService24h.init_conversation()
+    def port_of(proxy):
+        return proxy.rsplit(':', 1)[-1]
+    
+    def _decay(self, entry, now):
+        factor = 0.5 ** (max(0.0, now - entry.get('t', now)) / self.HALF_LIFE)
+        return entry.get('ok', 0.0) * factor, entry.get('fail', 0.0) * factor
+    
+    def _source_priors(self, source_list):
+        """A priori et multiplicité par proxy d'après les sources qui le listent"""
+        stats = self.sources.get_all_stats()
+        priors = {}
+        counts = {}
+        for source in source_list:
+            entry = stats.get(self.sources.source_id(source)) or {}
+            # Laplace : une source jamais évaluée reste proche de l'a priori global
+            prior = (entry.get('working', 0) + self.DEFAULT_PRIOR * 20) / (entry.get('tested', 0) + 20)
+            for proxy in self.sources.get_proxies(source):
+                counts[proxy] = counts.get(proxy, 0) + 1
+                if prior > priors.get(proxy, 0):
+                    priors[proxy] = prior
+        return priors, counts
+    
+    def score_all(self, candidates, source_list, now=None):
+        """{proxy: (score, composantes)} pour chaque candidat"""
+        now = time.time() if now is None else now
+        history = self.state.get('vpn:proxy_history') or {}
+        ports = self.state.get('vpn:port_stats') or {}
+        first_seen = self.state.get('vpn:proxy_first_seen') or {}
+        priors, counts = self._source_priors(source_list)
         
-        if 'user_info' not in session['conversation']:
-            session['conversation']['user_info'] = {}
+        port_ok = sum(ok for ok, _ in ports.values())
+        port_tested = sum(tested for _, tested in ports.values())
+        global_rate = (port_ok + self.DEFAULT_PRIOR * self.PORT_SMOOTHING) / (port_tested + self.PORT_SMOOTHING)
         
-        session['conversation']['user_info'][key] = {
-            'value': value,
-            'timestamp': time.time()
+        scores = {}
+        for proxy in candidates:
+            listed = counts.get(proxy, 1)
+            prior = priors.get(proxy, self.DEFAULT_PRIOR)
+            # Listé par plusieurs sources : « ou » bruité des a priori
+            prior = 1 - (1 - prior) ** (1 + 0.5 * (listed - 1))
+            
+            ok, fail = self._decay(history[proxy], now) if proxy in history else (0.0, 0.0)
+            liveness = (ok + self.PRIOR_WEIGHT * prior) / (ok + fail + self.PRIOR_WEIGHT)
+            
+            port_hits, port_tests = ports.get(self.port_of(proxy), (0, 0))
+            port_rate = (port_hits + global_rate * self.PORT_SMOOTHING) / (port_tests + self.PORT_SMOOTHING)
+            port_factor = min(5.0, max(0.2, port_rate / global_rate))
+            
+            age = now - first_seen.get(proxy, now - self.FRESH_WINDOW * 24)
+            freshness = 1 + 0.5 * math.exp(-age / self.FRESH_WINDOW)
+            
+            scores[proxy] = (min(1.0, liveness * port_factor * freshness), {
+                'prior': round(prior, 4),
+                'sources': listed,
+                'history': [round(ok, 2), round(fail, 2)],
+                'port_factor': round(port_factor, 3),
+                'freshness': round(freshness, 3)
+            })
+        return scores
+    
+    def rank(self, candidates, source_list):
+        """Candidats du plus prometteur au moins prometteur (ex æquo mélangés)"""
+        scores = self.score_all(candidates, source_list)
+        shuffled = list(candidates)
+        random.shuffle(shuffled)
+        return sorted(shuffled, key=lambda proxy: scores[proxy][0], reverse=True)
+    
+    def top(self, candidates, source_list, limit=20):
+        """Tête de la file, avec le détail du score"""
+        scores = self.score_all(candidates, source_list)
+        ordered = sorted(candidates, key=lambda proxy: scores[proxy][0], reverse=True)[:limit]
+        return [{'proxy': proxy, 'score': round(scores[proxy][0], 4), **scores[proxy][1]}
+                for proxy in ordered]
+    
+    def record_seen(self, added, removed):
+        """Date d'apparition des nouveaux candidats; oubli des proxies retirés"""
+        now = time.time()
+        removed = set(removed)
+        
+        def update(seen):
+            seen = {proxy: t for proxy, t in (seen or {}).items() if proxy not in removed}
+            for proxy in added:
+                seen.setdefault(proxy, now)
+            return seen
+        
+        self.state.update('vpn:proxy_first_seen', update)
+    
+    def record_results(self, results):
+        """Ajoute les résultats d'un scan [(proxy, fonctionne)] à l'historique"""
+        if not results:
+            return
+        now = time.time()
+        
+        def update_history(history):
+            history = dict(history or {})
+            for proxy, working in results:
+                ok, fail = self._decay(history[proxy], now) if proxy in history else (0.0, 0.0)
+                history[proxy] = {'ok': ok + (1 if working else 0), 'fail': fail + (0 if working else 1), 't': now}
+            if len(history) > self.HISTORY_MAX:
+                recent = sorted(history.items(), key=lambda item: item[1]['t'], reverse=True)
+                history = dict(recent[:self.HISTORY_MAX])
+            return history
+        
+        def update_ports(ports):
+            ports = dict(ports or {})
+            for proxy, working in results:
+                ok, tested = ports.get(self.port_of(proxy), (0, 0))
+                ports[self.port_of(proxy)] = (ok + (1 if working else 0), tested + 1)
+            return ports
+        
+        self.state.update('vpn:proxy_history', update_history)
+        self.state.update('vpn:port_stats', update_ports)
+
+class HealthHistory:
+    """Séries temporelles de santé des proxies et de performance des scans.
+    
+    - anneaux bornés d'échantillons bruts (un par scan, un par test de proxy)
+    - agrégats par tranches de 5 min / 1 h / 1 jour, à rétention fixe
+    Tout vit dans l'état partagé : la mémoire reste bornée quel que soit l'uptime.
+    """
+    
+    SCAN_RING = 500
+    PROBE_RING = 5000
+    # résolution -> (taille de la tranche en secondes, nombre de tranches conservées)
+    RESOLUTIONS = {
+        '5m': (300, 288),     # 24h
+        '1h': (3600, 168),    # 7 jours
+        '1d': (86400, 90)     # 3 mois
+    }
+    
+    def __init__(self, state):
+        self.state = state
+    
+    @staticmethod
+    def _empty_bucket(start):
+        return {'t': start, 'scans': 0, 'duration_sum': 0.0, 'duration_max': 0.0,
+                'candidates_sum': 0, 'tested': 0, 'working': 0,
+                'latency_sum': 0, 'latency_count': 0, 'latency_min': None, 'latency_max': None}
+    
+    def _rollup(self, now, scan=None, latencies=()):
+        """Ajoute un scan et/ou des latences aux tranches de chaque résolution"""
+        for resolution, (size, keep) in self.RESOLUTIONS.items():
+            start = int(now // size * size)
+            
+            def update(buckets, start=start, size=size, keep=keep):
+                buckets = dict(buckets or {})
+                bucket = dict(buckets.get(str(start)) or self._empty_bucket(start))
+                if scan:
+                    bucket['scans'] += 1
+                    bucket['duration_sum'] = round(bucket['duration_sum'] + scan['duration'], 3)
+                    bucket['duration_max'] = max(bucket['duration_max'], scan['duration'])
+                    bucket['candidates_sum'] += scan['candidates']
+                    bucket['tested'] += scan['tested']
+                    bucket['working'] += scan['working']
+                for latency in latencies:
+                    bucket['latency_sum'] += latency
+                    bucket['latency_count'] += 1
+                    bucket['latency_min'] = latency if bucket['latency_min'] is None else min(bucket['latency_min'], latency)
+                    bucket['latency_max'] = latency if bucket['latency_max'] is None else max(bucket['latency_max'], latency)
+                buckets[str(start)] = bucket
+                oldest = start - size * (keep - 1)
+                return {key: value for key, value in buckets.items() if value['t'] >= oldest}
+            
+            self.state.update(f'vpn:ts:{resolution}', update)
+    
+    def record_scan(self, scan, probes):
+        """Enregistre un scan ({'duration', 'candidates', 'tested', 'working', ...})
+        et ses tests [(proxy, fonctionne, latence_ms)]"""
+        now = time.time()
+        sample = dict(scan, t=round(now, 3))
+        self.state.update('vpn:ts:scans', lambda ring: (ring or [])[-(self.SCAN_RING - 1):] + [sample])
+        if probes:
+            rows = [[round(now, 3), proxy, 1 if working else 0, latency] for proxy, working, latency in probes]
+            self.state.update('vpn:ts:probes', lambda ring: ((ring or []) + rows)[-self.PROBE_RING:])
+        self._rollup(now, scan, [latency for _, working, latency in probes if working and latency is not None])
+    
+    @staticmethod
+    def _summarize(bucket):
+        return {
+            't': bucket['t'],
+            'scans': bucket['scans'],
+            'duration_avg': round(bucket['duration_sum'] / bucket['scans'], 3) if bucket['scans'] else None,
+            'duration_max': bucket['duration_max'],
+            'candidates_avg': round(bucket['candidates_sum'] / bucket['scans']) if bucket['scans'] else None,
+            'tested': bucket['tested'],
+            'working': bucket['working'],
+            'success_rate': round(bucket['working'] / bucket['tested'], 4) if bucket['tested'] else None,
+            'latency_avg': round(bucket['latency_sum'] / bucket['latency_count']) if bucket['latency_count'] else None,
+            'latency_min': bucket['latency_min'],
+            'latency_max': bucket['latency_max']
+        }
+    
+    def query(self, resolution='1h', since=None, until=None):
+        """Série agrégée, de la plus ancienne à la plus récente tranche"""
+        if resolution == 'raw':
+            rows = self.state.get('vpn:ts:scans') or []
+        else:
+            rows = [self._summarize(bucket) for bucket in (self.state.get(f'vpn:ts:{resolution}') or {}).values()]
+        return sorted((row for row in rows
+                       if (since is None or row['t'] >= since) and (until is None or row['t'] <= until)),
+                      key=lambda row: row['t'])
+    
+    def query_proxy(self, proxy, since=None):
+        """Échantillons bruts d'un proxy encore présents dans l'anneau"""
+        samples = [{'t': t, 'working': bool(ok), 'latency': latency}
+                   for t, candidate, ok, latency in self.state.get('vpn:ts:probes') or []
+                   if candidate == proxy and (since is None or t >= since)]
+        latencies = [sample['latency'] for sample in samples if sample['working'] and sample['latency'] is not None]
+        return {
+            'proxy': proxy,
+            'samples': samples,
+            'tested': len(samples),
+            'success_rate': round(sum(sample['working'] for sample in samples) / len(samples), 4) if samples else None,
+            'latency_avg': round(sum(latencies) / len(latencies)) if latencies else None
         }
-        session.modified = True
+    
+    def window(self, seconds=86400):
+        """Résumé glissant (par défaut 24h) à partir des tranches de 5 min"""
+        size, _ = self.RESOLUTIONS['5m']
+        since = time.time() - seconds - size
+        total = self._empty_bucket(since)
+        for bucket in (self.state.get('vpn:ts:5m') or {}).values():
+            if bucket['t'] < since:
+                continue
+            for key in ('scans', 'duration_sum', 'candidates_sum', 'tested', 'working', 'latency_sum', 'latency_count'):
+                total[key] += bucket[key]
+            total['duration_max'] = max(total['duration_max'], bucket['duration_max'])
+            for key, pick in (('latency_min', min), ('latency_max', max)):
+                if bucket[key] is not None:
+                    total[key] = bucket[key] if total[key] is None else pick(total[key], bucket[key])
+        summary = self._summarize(total)
+        summary.pop('t')
+        return summary
+
+# ============================================
+# SERVICE VPN AMÉLIORÉ - TEST AUTOMATIQUE MULTI-PROXIES
+# ============================================
+
+class VPNService:
+    """Service VPN avec test automatique de proxies mondiaux.
+    
+    Caches et statistiques vivent dans le backend d'état injecté
+    (clés 'vpn:*'), partagé ou non entre workers selon le backend.
+    """
+    
+    CACHE_DURATION = 600  # 10 minutes (rechargement fréquent)
+    REFRESH_LOCK_TIMEOUT = 120  # attente max d'un rafraîchissement par un autre worker
+    
+    # URLs de test (remplaçables pour les benchmarks locaux)
+    TEST_URLS = [
+        'http://httpbin.org/ip',
+        'http://api.ipify.org',
+        'http://ip-api.com/json',
+        'http://ifconfig.me/ip',
+        'http://icanhazip.com'
+    ]
+    GEO_URL = 'http://ip-api.com/json/{ip}'
+    IP_ECHO_URL = 'https://api.ipify.org?format=json'
+    HEADERS_ECHO_URL = 'http://httpbin.org/headers'
+    CONNECT_TARGET = 'api.ipify.org:443'
+    
+    # Pipeline de test adaptatif
+    CONNECT_TIMEOUT = 1.0  # étape TCP: un proxy mort est éliminé en 1s max
+    PROBE_HTTPS = True  # tester le tunnel CONNECT des proxies fonctionnels
+    PROBE_ANONYMITY = False  # requête supplémentaire, désactivée par défaut
+    
+    # Pré-filtrage asynchrone de tous les candidats avant validation HTTP
+    PRESCREEN = os.environ.get('VPN_PRESCREEN', 'true').lower() == 'true'
+    PRESCREEN_CONCURRENCY = int(os.environ.get('VPN_PRESCREEN_CONCURRENCY', 500))
+    PRESCREEN_TIMEOUT = 0.8
+    PRESCREEN_BUDGET = 45  # secondes, sous le --timeout 120 de gunicorn
+    PRESCREEN_OVERSAMPLE = 3  # candidats retenus = max_tests x 3
+    
+    # Ordre de test : 'priority' (file par probabilité de fonctionner) ou 'random'
+    ORDERING = os.environ.get('VPN_ORDERING', 'priority')
+    
+    # 🌍 SOURCES DE PROXIES PAR PAYS ET MONDIALES (proxy_sources.json)
+    PROXY_SOURCES = load_proxy_sources()
+    
+    @classmethod
+    def test_proxy(cls, proxy, timeout=3):
+        """Teste si un proxy est fonctionnel avec vérification multiple et retourne pays + latence"""
+        result = cls.probe_proxy(proxy, timeout=timeout)
+        if result['working']:
+            return True, result['latency'], result['country']
+        return False, 0, None
+    
+    @classmethod
+    def _tcp_connect(cls, host, port, timeout):
+        """Étape 1 : simple connexion TCP au proxy"""
+        sock = socket.create_connection((host, port), timeout=timeout)
+        sock.close()
+    
+    @classmethod
+    def _https_connect(cls, host, port, timeout):
+        """Étape 3a : le proxy accepte-t-il un tunnel CONNECT (HTTPS) ?"""
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.settimeout(timeout)
+            sock.sendall(
+                f"CONNECT {cls.CONNECT_TARGET} HTTP/1.1\r\n"
+                f"Host: {cls.CONNECT_TARGET}\r\n\r\n".encode('ascii')
+            )
+            status_line = sock.recv(128).split(b'\r\n', 1)[0].decode('latin-1')
+        parts = status_line.split()
+        return len(parts) >= 2 and parts[1] == '200'
+    
+    @classmethod
+    def _check_anonymity(cls, proxies, timeout):
+        """Étape 3b : niveau d'anonymat d'après les en-têtes vus par la cible"""
+        response = requests.get(cls.HEADERS_ECHO_URL, proxies=proxies, timeout=timeout)
+        headers = {k.lower(): v for k, v in response.json().get('headers', {}).items()}
+        if 'x-forwarded-for' in headers or 'x-real-ip' in headers:
+            return 'transparent'
+        if 'via' in headers or 'forwarded' in headers:
+            return 'anonymous'
+        return 'elite'
+    
+    @classmethod
+    def probe_proxy(cls, proxy, timeout=3, connect_timeout=None, check_https=None, check_anonymity=None):
+        """Pipeline de test adaptatif : TCP -> HTTP -> (HTTPS CONNECT, anonymat).
+        
+        Chaque étape peut éliminer le proxy sans lancer les suivantes; un proxy
+        mort coûte donc au plus `connect_timeout` au lieu de 5 x `timeout`.
+        """
+        connect_timeout = cls.CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        check_https = cls.PROBE_HTTPS if check_https is None else check_https
+        check_anonymity = cls.PROBE_ANONYMITY if check_anonymity is None else check_anonymity
+        
+        result = {
+            'proxy': proxy,
+            'working': False,
+            'latency': 0,
+            'country': None,
+            'failed_stage': None,
+            'stages': {},
+            'protocols': {'http': False, 'https': None},
+            'anonymity': None
+        }
+        
+        def timed(stage, fn, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                result['stages'][stage] = int((time.perf_counter() - start) * 1000)
+        
+        try:
+            host, port = proxy.rsplit(':', 1)
+            port = int(port)
+        except ValueError:
+            result['failed_stage'] = 'parse'
+            return result
+        
+        # ✅ ÉTAPE 1: connexion TCP rapide
+        try:
+            timed('tcp', cls._tcp_connect, host, port, min(connect_timeout, timeout))
+        except OSError:
+            result['failed_stage'] = 'tcp'
+            return result
+        
+        # ✅ ÉTAPE 2: une requête HTTP via le proxy
+        proxies = {
+            'http': f'http://{proxy}',
+            'https': f'http://{proxy}'
+        }
+        
+        def http_request():
+            for url in cls.TEST_URLS:
+                response = requests.get(
+                    url,
+                    proxies=proxies,
+                    timeout=timeout,
+                    headers={
+                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                        'Accept': 'application/json',
+                        'Connection': 'keep-alive'
+                    },
+                    verify=False
+                )
+                if response.status_code == 200:
+                    return True
+                # Le proxy répond mais la cible non : essayer la cible suivante
+            return False
+        
+        try:
+            if not timed('http', http_request):
+                result['failed_stage'] = 'http'
+                return result
+        except Exception:
+            result['failed_stage'] = 'http'
+            return result
+        
+        result['working'] = True
+        result['latency'] = result['stages']['http']
+        result['protocols']['http'] = True
+        
+        # ✅ ÉTAPE 3: vérifications optionnelles
+        if check_https:
+            try:
+                result['protocols']['https'] = timed('https', cls._https_connect, host, port, timeout)
+            except OSError:
+                result['protocols']['https'] = False
+        
+        if check_anonymity:
+            try:
+                result['anonymity'] = timed('anonymity', cls._check_anonymity, proxies, timeout)
+            except Exception:
+                result['anonymity'] = None
+        
+        # Récupérer le pays du proxy
+        country = "Inconnu"
+        try:
+            ip_response = timed('geo', requests.get, cls.GEO_URL.format(ip=host), timeout=2)
+            if ip_response.status_code == 200:
+                ip_data = ip_response.json()
+                country = ip_data.get('country', 'Inconnu')
+        except Exception:
+            pass
+        result['country'] = country
+        
+        return result
+    
+    @staticmethod
+    def iter_proxies(lines, parser='default'):
+        """Extrait les 'ip:port' valides ligne par ligne (texte ou flux)"""
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            
+            # Différents formats de parsing
+            if parser == 'github':
+                # Format GitHub raw
+                if ':' not in line or line.startswith('#'):
+                    continue
+                candidates = [line.split()[0]]
+            elif parser == 'speedx':
+                # Format SpeedX
+                candidates = [line]
+            else:
+                # Format proxyscrape / par défaut (une ligne ou séparés par des espaces)
+                candidates = line.split()
+            
+            # Nettoyer les proxies
+            for proxy in candidates:
+                parts = proxy.split(':')
+                if len(parts) == 2 and parts[0].count('.') == 3 and parts[1].isdigit():
+                    yield proxy
+    
+    @classmethod
+    def parse_proxy_list(cls, text, parser='default'):
+        """Extrait les 'ip:port' valides d'une liste texte"""
+        return list(cls.iter_proxies(text.splitlines(), parser))
+    
+    @classmethod
+    def fetch_source(cls, source, validators=None):
+        """Charge une source : proxies, taille, latence et éventuelle erreur.
+        
+        `validators` ({'etag', 'last_modified'}) rend la requête conditionnelle :
+        sur 304, `not_modified` est vrai et `proxies` vaut None. La réponse est
+        décodée en flux, ligne par ligne, sans matérialiser le texte complet.
+        """
+        start = time.perf_counter()
+        result = {'proxies': [], 'bytes': 0, 'latency_ms': 0, 'error': None,
+                  'not_modified': False, 'etag': None, 'last_modified': None}
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        try:
+            with requests.get(source['url'], headers=headers, timeout=15, stream=True) as response:
+                result['etag'] = response.headers.get('ETag')
+                result['last_modified'] = response.headers.get('Last-Modified')
+                if response.status_code == 304:
+                    result['not_modified'] = True
+                    result['proxies'] = None
+                elif response.status_code == 200:
+                    received = [0]
+                    
+                    def lines():
+                        for raw in response.iter_lines(chunk_size=65536):
+                            received[0] += len(raw) + 1
+                            yield raw.decode('utf-8', 'ignore')
+                    
+                    result['proxies'] = list(cls.iter_proxies(lines(), source.get('parser', 'default')))
+                    result['bytes'] = received[0]
+                else:
+                    result['error'] = f"HTTP {response.status_code}"
+        except Exception as e:
+            result['error'] = type(e).__name__
+            if DEBUG_MODE:
+                print(f"⚠️ Source indisponible: {source['url'][:30]}...")
+        result['latency_ms'] = int((time.perf_counter() - start) * 1000)
+        return result
+    
+    @classmethod
+    def get_proxies_from_source(cls, url, parser='default'):
+        """Récupère les proxies depuis différentes sources"""
+        return cls.fetch_source({'url': url, 'parser': parser})['proxies']
+    
+    def __init__(self, state):
+        self.state = state
+        self.sources = ProxySourceScheduler(state)
+        self.queue = ProxyLivenessQueue(state, self.sources)
+        self.history = HealthHistory(state)
+    
+    def get_proxies_cache(self):
+        """Liste brute des proxies en cache"""
+        return self.state.get('vpn:proxies_cache') or []
+    
+    def get_working_cache(self):
+        """Proxies fonctionnels connus"""
+        return self.state.get('vpn:working_cache') or []
+    
+    def get_all_proxies(self, force_refresh=False):
+        """Récupère des proxies depuis TOUTES les sources disponibles dans le monde"""
+        
+        requested_at = time.time()
+        cached = self.state.get('vpn:proxies_cache')
+        if (not force_refresh and 
+            cached and 
+            requested_at - self.state.get('vpn:cache_timestamp', 0) < self.CACHE_DURATION):
+            return cached
+        
+        # Un seul worker rafraîchit à la fois; les autres réutilisent son résultat
+        with self.state.lock('vpn:refresh', timeout=self.REFRESH_LOCK_TIMEOUT):
+            if self.state.get('vpn:cache_timestamp', 0) >= requested_at:
+                return self.state.get('vpn:proxies_cache') or []
+            
+            print("\n🌍 RECHERCHE DE PROXIES DANS LE MONDE ENTIER...")
+            print("=" * 50)
+            
+            # Ne recharger que les sources dues; les autres gardent leur dernière liste
+            due = self.sources.due_sources(self.PROXY_SOURCES)
+            due_ids = {self.sources.source_id(source) for source in due}
+            changed = False
+            for source in due:
+                fetch = self.fetch_source(source, self.sources.validators(source))
+                diff = self.sources.record_fetch(source, fetch)
+                changed = changed or bool(diff['added'] or diff['removed'])
+                if DEBUG_MODE:
+                    status = 'inchangée (304)' if fetch['not_modified'] else f"+{len(diff['added'])}/-{len(diff['removed'])}"
+                    print(f"📦 {source['url'][:50]}... {status}")
+            self.sources.record_skip([source for source in self.PROXY_SOURCES
+                                      if self.sources.source_id(source) not in due_ids])
+            
+            lists = {self.sources.source_id(source): self.sources.get_proxies(source)
+                     for source in self.PROXY_SOURCES}
+            previous = self.state.get('vpn:proxies_cache')
+            if changed or previous is None:
+                self.sources.record_overlap(lists)
+                
+                # Dédupliquer puis fusionner par diff avec la liste précédente
+                merged = {proxy for proxies in lists.values() for proxy in proxies}
+                previous_set = set(previous or [])
+                added = merged - previous_set
+                removed = previous_set - merged
+                all_proxies = [proxy for proxy in (previous or []) if proxy not in removed] + list(added)
+                try:
+                    self.merge_candidates(added, removed)
+                    self.state.set('vpn:proxies_cache', all_proxies)
+                except StateFullError as e:
+                    # Candidats servis depuis ce processus; sans cache, le prochain cycle refait la fusion
+                    print(f"❌ Candidats non enregistrés: {str(e)}")
+                    self.state.delete('vpn:proxies_cache')
+            else:
+                all_proxies = previous
+                added = removed = ()
+            
+            print(f"\n📊 TOTAL BRUT: {len(all_proxies)} proxies uniques "
+                  f"(+{len(added)}/-{len(removed)}, {len(due)}/{len(self.PROXY_SOURCES)} sources rechargées)")
+            self.state.set('vpn:last_refresh', {
+                'fetched': len(due),
+                'added': len(added),
+                'removed': len(removed),
+                'total': len(all_proxies),
+                'timestamp': time.time()
+            })
+            self.state.set('vpn:cache_timestamp', time.time())
+        
+        return all_proxies
+    
+    def merge_candidates(self, added, removed):
+        """Nouveaux proxies -> date d'apparition (bonus de fraîcheur); proxies disparus des listes -> retirés"""
+        removed = set(removed)
+        if removed:
+            self.state.update(
+                'vpn:working_cache',
+                lambda cache: [proxy for proxy in (cache or []) if proxy not in removed]
+            )
+        self.queue.record_seen(added, removed)
+    
+    def find_working_proxies(self, limit=50, max_tests=100, ordering=None, on_progress=None):
+        """Trouve automatiquement les proxies qui fonctionnent dans le monde.
+        
+        `on_progress(tested, total, working)` est appelé après chaque test;
+        s'il retourne False, le scan s'arrête (annulation d'une tâche).
+        """
+        ordering = ordering or self.ORDERING
+        scan_start = time.time()
+        
+        print("\n🔍 RECHERCHE DE PROXIES FONCTIONNELS...")
+        print("=" * 50)
+        
+        # Récupérer tous les proxies (copie : le cache est partagé)
+        with Profiler.span('vpn.fetch_sources'):
+            all_proxies = list(self.get_all_proxies(force_refresh=True))
+        
+        if not all_proxies:
+            print("❌ Aucun proxy trouvé!")
+            return []
+        
+        # Les plus prometteurs d'abord (ou échantillon aléatoire pour comparaison)
+        with Profiler.span('vpn.rank'):
+            if ordering == 'priority':
+                all_proxies = self.queue.rank(all_proxies, self.PROXY_SOURCES)
+            else:
+                random.shuffle(all_proxies)
+        position = {proxy: i for i, proxy in enumerate(all_proxies)}
+        candidates = len(all_proxies)
+        
+        # Pré-filtrer par connexion TCP, puis garder les plus rapides
+        if self.PRESCREEN:
+            screener = AsyncProxyScreener(
+                concurrency=self.PRESCREEN_CONCURRENCY,
+                timeout=self.PRESCREEN_TIMEOUT,
+                budget=self.PRESCREEN_BUDGET
+            )
+            with Profiler.span('vpn.prescreen'):
+                passed = screener.screen(all_proxies, stop_after=max_tests * self.PRESCREEN_OVERSAMPLE)
+            self.state.set('vpn:last_prescreen', screener.last_stats)
+            print(f"⚡ Pré-filtrage: {len(passed)}/{screener.last_stats['checked']} joignables "
+                  f"en {screener.last_stats['duration']:.1f}s")
+            # Le pré-filtrage trie par latence : on revient à l'ordre de la file
+            all_proxies = sorted((proxy for proxy, _ in passed), key=position.__getitem__)
+        
+        # Limiter le nombre de tests pour la performance
+        to_test = all_proxies[:max_tests]
+        
+        working_proxies = []
+        tested = []
+        results = []
+        start_time = time.time()
+        
+        print(f"🧪 Test de {len(to_test)} proxies...\n")
+        
+        for i, proxy in enumerate(to_test, 1):
+            print(f"  Test {i}/{len(to_test)}: {proxy}", end=" ")
+            
+            with Profiler.span('vpn.probe'):
+                probe = self.probe_proxy(proxy, timeout=3)
+            is_working, latency, country = probe['working'], probe['latency'], probe['country']
+            self.state.incr('vpn:total_tested')
+            tested.append(proxy)
+            results.append((proxy, is_working, latency))
+            
+            if is_working:
+                working_proxies.append({
+                    'proxy': proxy,
+                    'latency': latency,
+                    'country': country or 'Inconnu',
+                    'protocols': probe['protocols'],
+                    'anonymity': probe['anonymity'],
+                    'stages': probe['stages']
+                })
+                self.state.incr('vpn:total_working')
+                self.state.update('vpn:working_cache', lambda cache: (cache or []) + [proxy])
+                
+                # Compter par pays
+                if country:
+                    self.state.update(
+                        'vpn:proxy_countries',
+                        lambda countries: {**(countries or {}), country: (countries or {}).get(country, 0) + 1}
+                    )
+                
+                print(f"✅ {latency}ms - {country}")
+            else:
+                failed_stage = probe['failed_stage']
+                self.state.update(
+                    'vpn:failed_stages',
+                    lambda stages: {**(stages or {}), failed_stage: (stages or {}).get(failed_stage, 0) + 1}
+                )
+                print(f"❌ ({failed_stage})")
+            
+            # Limiter le nombre de proxies fonctionnels trouvés
+            if len(working_proxies) >= limit:
+                print(f"\n✅ Limite de {limit} proxies fonctionnels atteinte!")
+                break
+            
+            if on_progress is not None and on_progress(i, len(to_test), working_proxies) is False:
+                print("\n⏹️ Scan interrompu")
+                break
+        
+        last_test_duration = time.time() - start_time
+        self.state.set('vpn:last_test_duration', last_test_duration)
+        
+        with Profiler.span('vpn.record'):
+            # Qualité des sources : quelles listes ont fourni des proxies fonctionnels
+            self.sources.record_results(self.PROXY_SOURCES, tested,
+                                        [item['proxy'] for item in working_proxies])
+            self.queue.record_results([(proxy, working) for proxy, working, _ in results])
+            self.state.set('vpn:last_scan', {
+                'ordering': ordering,
+                'tested': len(tested),
+                'working': len(working_proxies),
+                'hit_rate': round(len(working_proxies) / len(tested), 4) if tested else 0.0,
+                'limit_reached': len(working_proxies) >= limit,
+                'timestamp': time.time()
+            })
+            self.history.record_scan({
+                'duration': round(time.time() - scan_start, 3),
+                'test_duration': round(last_test_duration, 3),
+                'candidates': candidates,
+                'tested': len(tested),
+                'working': len(working_proxies),
+                'ordering': ordering
+            }, results)
+        
+        # Trier par latence (les plus rapides d'abord)
+        working_proxies.sort(key=lambda x: x['latency'])
+        
+        stats = self.get_stats()
+        print(f"\n✅ RECHERCHE TERMINÉE!")
+        print(f"   - Temps: {last_test_duration:.1f} secondes")
+        print(f"   - Proxies testés: {stats['total_tested']}")
+        print(f"   - Proxies fonctionnels: {stats['total_working']}")
+        print(f"   - Taux de succès: {stats['success_rate']}")
+        
+        # Afficher la répartition par pays
+        if stats['countries']:
+            print("\n🌍 RÉPARTITION PAR PAYS:")
+            for country, count in sorted(stats['countries'].items(), key=lambda x: x[1], reverse=True)[:5]:
+                print(f"   - {country}: {count}")
+        
+        return working_proxies
+    
+    def get_working_proxy(self, force_refresh=False):
+        """Retourne un proxy 100% fonctionnel (testé en temps réel)"""
+        
+        # Si on a des proxies en cache et pas de rafraîchissement forcé
+        working_cache = self.get_working_cache()
+        if working_cache and not force_refresh:
+            proxy = random.choice(working_cache)
+            # Vérifier rapidement qu'il fonctionne encore
+            is_working, _, _ = self.test_proxy(proxy, timeout=2)
+            if is_working:
+                return proxy
+        
+        # Sinon, lancer une recherche de nouveaux proxies
+        working = self.find_working_proxies(limit=10, max_tests=50)
+        
+        if working:
+            # Mettre à jour le cache
+            working_cache = [w['proxy'] for w in working]
+            self.state.set('vpn:working_cache', working_cache)
+            return working_cache[0]
+        
+        return None
+    
+    def get_ip_info(self, use_vpn=True):
+        """Obtient les infos IP avec ou sans VPN"""
+        try:
+            if use_vpn:
+                proxy = self.get_working_proxy()
+                if proxy:
+                    proxies = {
+                        'http': f'http://{proxy}',
+                        'https': f'http://{proxy}'
+                    }
+                    response = requests.get(
+                        self.IP_ECHO_URL,
+                        proxies=proxies,
+                        timeout=5,
+                        headers={'User-Agent': 'Mozilla/5.0'}
+                    )
+                    if response.status_code == 200:
+                        return {
+                            'success': True,
+                            'ip': response.json().get('ip'),
+                            'proxy': proxy,
+                            'method': 'VPN'
+                        }
+            
+            # Fallback direct
+            response = requests.get(
+                self.IP_ECHO_URL,
+                timeout=3
+            )
+            return {
+                'success': True,
+                'ip': response.json().get('ip'),
+                'proxy': None,
+                'method': 'Direct'
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'method': 'Échec'
+            }
+    
+    def get_stats(self):
+        """Retourne les statistiques du service VPN"""
+        total_tested = self.state.get('vpn:total_tested', 0)
+        total_working = self.state.get('vpn:total_working', 0)
+        return {
+            'total_tested': total_tested,
+            'total_working': total_working,
+            'success_rate': f"{total_working/total_tested*100:.1f}%" if total_tested > 0 else "0%",
+            'last_test_duration': f"{self.state.get('vpn:last_test_duration', 0):.1f}s",
+            'cache_size': len(self.get_proxies_cache()),
+            'working_cache': len(self.get_working_cache()),
+            'countries': self.state.get('vpn:proxy_countries') or {},
+            'failed_stages': self.state.get('vpn:failed_stages') or {},
+            'last_prescreen': self.state.get('vpn:last_prescreen'),
+            'sources': len(self.PROXY_SOURCES),
+            'last_refresh': self.state.get('vpn:last_refresh'),
+            'last_scan': self.state.get('vpn:last_scan'),
+            'last_24h': self.history.window()
+        }
+    
+    def get_queue(self, limit=20):
+        """Tête de la file de validation avec le détail des scores"""
+        return self.queue.top(self.get_proxies_cache(), self.PROXY_SOURCES, limit)
+    
+    def get_source_stats(self):
+        """Qualité et planification de chaque source de proxies"""
+        return self.sources.report(self.PROXY_SOURCES)
+
+# ============================================
+# TÂCHES DE SCAN ASYNCHRONES - FILE À PRIORITÉS
+# ============================================
+
+class ScanJobQueue:
+    """Scans de proxies exécutés hors requête par un petit pool de workers.
+    
+    POST crée une tâche et répond immédiatement; un scan identique déjà en
+    file ou en cours est réutilisé. Les fiches (statut, progression, proxies
+    trouvés jusque-là, résultat) sont dans l'état partagé : n'importe quel
+    worker peut répondre au polling. L'exécution reste dans le processus qui
+    a accepté la tâche. Une tâche dont le processus a disparu (redémarrage,
+    crash) est reprise par le prochain processus qui la voit si elle était
+    encore en file, marquée en échec si elle tournait déjà.
+    """
+    
+    WORKERS = int(os.environ.get('SCAN_JOB_WORKERS', '2'))
+    MAX_QUEUED = int(os.environ.get('SCAN_JOB_MAX_QUEUED', '20'))
+    RESULT_TTL = int(os.environ.get('SCAN_JOB_TTL', '3600'))  # fiches terminées gardées 1h
+    MAX_TESTS = int(os.environ.get('SCAN_MAX_TESTS', '2000'))
+    LEASE = int(os.environ.get('SCAN_JOB_LEASE', '120'))  # secondes sans progression avant abandon
+    MAX_LIMIT = 200
+    PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+    PROGRESS_INTERVAL = 0.5  # secondes entre deux écritures de progression
+    FINISHED = ('done', 'failed', 'cancelled')
+    
+    def __init__(self, vpn, state):
+        self.vpn = vpn
+        self.state = state
+        self._heap = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._pid = None
+    
+    @staticmethod
+    def _key(job_id):
+        return f'vpn:job:{job_id}'
+    
+    @classmethod
+    def normalize(cls, params):
+        """Paramètres bornés d'un scan; ValueError si invalides"""
+        limit = int(params.get('limit', 50))
+        max_tests = int(params.get('max_tests', 100))
+        ordering = params.get('ordering')
+        if ordering not in (None, 'priority', 'random'):
+            raise ValueError("ordering: 'priority' ou 'random'")
+        return {
+            'limit': max(1, min(limit, cls.MAX_LIMIT)),
+            'max_tests': max(1, min(max_tests, cls.MAX_TESTS)),
+            'ordering': ordering
+        }
+    
+    def get(self, job_id):
+        job = self.state.get(self._key(job_id))
+        if job is not None and job.get('expires_at') and job['expires_at'] < time.time():
+            self.state.delete(self._key(job_id))
+            return None
+        if job is not None and self._stale(job):
+            return self._recover(job_id)
+        return job
+    
+    @staticmethod
+    def _alive(pid):
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except (PermissionError, TypeError):
+            return True
+        return True
+    
+    def _stale(self, job, now=None):
+        """Tâche non terminée dont le processus est mort, ou qui ne progresse plus depuis LEASE"""
+        if job['status'] in self.FINISHED:
+            return False
+        if not self._alive(job.get('pid')):
+            return True
+        now = now or time.time()
+        return job['status'] == 'running' and now - (job.get('heartbeat_at') or job['started_at']) > self.LEASE
+    
+    def _recover(self, job_id):
+        """Reprend ici une tâche orpheline encore en file, met en échec un scan interrompu"""
+        now = time.time()
+        adopted = []
+        
+        def recover(job):
+            if not job or not self._stale(job, now):
+                return job
+            if job['status'] == 'queued':
+                adopted.append(job)
+                return dict(job, pid=os.getpid())
+            return dict(job, status='failed', finished_at=now, expires_at=now + self.RESULT_TTL,
+                        error=f"worker perdu (pid {job.get('pid')})")
+        
+        job = self.state.update(self._key(job_id), recover)
+        if adopted:
+            print(f"♻️ Tâche de scan {job_id} reprise (pid {adopted[0].get('pid')} disparu)")
+            with self._cond:
+                self._seq += 1
+                heapq.heappush(self._heap, (self.PRIORITIES[job['priority']], self._seq, job_id))
+                self._ensure_started()
+                self._cond.notify()
+        elif job and job['status'] == 'failed':
+            print(f"⚠️ Tâche de scan {job_id}: {job['error']}")
+        return job
+    
+    def _update(self, job_id, **changes):
+        return self.state.update(self._key(job_id), lambda job: dict(job, **changes) if job else job)
+    
+    def _purge(self):
+        """Oublie les fiches expirées (verrou de l'index déjà pris)"""
+        now = time.time()
+        kept = []
+        for job_id in self.state.get('vpn:jobs', []):
+            job = self.state.get(self._key(job_id))
+            if job is None or (job.get('expires_at') and job['expires_at'] < now):
+                self.state.delete(self._key(job_id))
+            else:
+                if self._stale(job, now):
+                    self._recover(job_id)
+                kept.append(job_id)
+        self.state.set('vpn:jobs', kept)
+        return kept
+    
+    def submit(self, params, priority='normal'):
+        """(fiche, dédupliquée) - nouvelle tâche ou tâche identique existante"""
+        if priority not in self.PRIORITIES:
+            raise ValueError(f"priority: {', '.join(self.PRIORITIES)}")
+        params = self.normalize(params)
+        dedupe_key = f"{params['limit']}:{params['max_tests']}:{params['ordering'] or self.vpn.ORDERING}"
+        
+        with self.state.lock('vpn:jobs'):
+            jobs = self._purge()
+            pending = 0
+            for job_id in jobs:
+                job = self.state.get(self._key(job_id))
+                if job['status'] in self.FINISHED:
+                    continue
+                pending += 1
+                if job['dedupe_key'] == dedupe_key:
+                    if self.PRIORITIES[priority] < self.PRIORITIES[job['priority']]:
+                        job = self._update(job_id, priority=priority)
+                        self._reprioritize(job_id, priority)
+                    return job, True
+            if pending >= self.MAX_QUEUED:
+                raise OverflowError(f"{pending} scans déjà en file (max {self.MAX_QUEUED})")
+            
+            job = {
+                'id': os.urandom(8).hex(),
+                'status': 'queued',
+                'priority': priority,
+                'params': params,
+                'dedupe_key': dedupe_key,
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'expires_at': None,
+                'progress': {'tested': 0, 'total': params['max_tests'], 'working': 0},
+                'partial': [],
+                'result': None,
+                'error': None,
+                'cancel_requested': False,
+                'pid': os.getpid(),
+                'heartbeat_at': None
+            }
+            self.state.set(self._key(job['id']), job)
+            self.state.set('vpn:jobs', jobs + [job['id']])
+        
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._heap, (self.PRIORITIES[priority], self._seq, job['id']))
+            self._ensure_started()
+            self._cond.notify()
+        return job, False
+    
+    def _reprioritize(self, job_id, priority):
+        with self._cond:
+            for i, (_, seq, queued_id) in enumerate(self._heap):
+                if queued_id == job_id:
+                    self._heap[i] = (self.PRIORITIES[priority], seq, job_id)
+                    heapq.heapify(self._heap)
+                    break
+    
+    def cancel(self, job_id):
+        """Annule une tâche en file, ou demande l'arrêt d'un scan en cours"""
+        job = self.get(job_id)
+        if job is None or job['status'] in self.FINISHED:
+            return job
+        if job['status'] == 'queued':
+            return self._finish(job_id, 'cancelled')
+        return self._update(job_id, cancel_requested=True)
+    
+    def list(self):
+        with self.state.lock('vpn:jobs'):
+            jobs = self._purge()
+        return [job for job in (self.state.get(self._key(job_id)) for job_id in jobs) if job]
+    
+    def _finish(self, job_id, status, **changes):
+        now = time.time()
+        return self._update(job_id, status=status, finished_at=now, expires_at=now + self.RESULT_TTL, **changes)
+    
+    def _ensure_started(self):
+        """Démarre les workers dans ce processus, après un fork aussi (condition déjà prise)"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._threads = []
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.WORKERS:
+            thread = threading.Thread(target=self._worker, name=f'scan-job-{len(self._threads)}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job_id = heapq.heappop(self._heap)
+            self.run(job_id)
+    
+    def run(self, job_id):
+        """Exécute une tâche (worker du pool)"""
+        job = self.get(job_id)
+        if job is None or job['status'] != 'queued':
+            return  # annulée ou expirée entre-temps
+        params = job['params']
+        now = time.time()
+        self._update(job_id, status='running', started_at=now, heartbeat_at=now, pid=os.getpid())
+        reported = {'at': 0.0, 'working': 0}
+        
+        def on_progress(tested, total, working):
+            # Écriture à chaque proxy trouvé, sinon au plus toutes les PROGRESS_INTERVAL secondes
+            now = time.time()
+            if now - reported['at'] < self.PROGRESS_INTERVAL and len(working) == reported['working']:
+                return True
+            reported.update(at=now, working=len(working))
+            current = self._update(job_id, progress={'tested': tested, 'total': total, 'working': len(working)},
+                                   partial=[item['proxy'] for item in working], heartbeat_at=now)
+            return not (current or {}).get('cancel_requested')
+        
+        try:
+            with Profiler.span('vpn.job'):
+                working = self.vpn.find_working_proxies(limit=params['limit'], max_tests=params['max_tests'],
+                                                        ordering=params['ordering'], on_progress=on_progress)
+            current = self.get(job_id) or {}
+            scan = self.state.get('vpn:last_scan') or {}
+            self._finish(
+                job_id,
+                'cancelled' if current.get('cancel_requested') else 'done',
+                partial=[item['proxy'] for item in working],
+                progress={'tested': scan.get('tested', 0), 'total': params['max_tests'], 'working': len(working)},
+                result={'working': working[:20], 'count': len(working), 'scan': scan}
+            )
+        except Exception as e:
+            print(f"❌ Tâche de scan {job_id}: {str(e)}")
+            self._finish(job_id, 'failed', error=str(e))
+    
+    def wait(self, job_id, timeout):
+        """Attend la fin d'une tâche au plus `timeout` secondes (polling de l'état)"""
+        deadline = time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in self.FINISHED or time.time() >= deadline:
+                return job
+            time.sleep(0.1)
+    
+    def get_stats(self):
+        with self._cond:
+            queued_here = len(self._heap)
+        jobs = self.list()
+        statuses = Counter(job['status'] for job in jobs)
+        return {
+            'workers': self.WORKERS,
+            'queued_in_process': queued_here,
+            'jobs': dict(statuses),
+            'max_queued': self.MAX_QUEUED,
+            'result_ttl': self.RESULT_TTL
+        }
+
+# ============================================
+# SERVICE DE MÉMOIRE 24H
+# ============================================
+
+@bp.before_app_request
+def make_session_permanent():
+    """Active la session permanente pour 24h"""
+    session.permanent = True
+    if 'last_activity' not in session:
+        session['last_activity'] = time.time()
+
+class DetachedSession(dict):
+    """Stockage de conversation hors cookie (API batch, rejeu) au format de la session"""
+    
+    modified = False
+
+class MemoryService24h:
+    """Service de mémoire avec expiration 24h.
+    
+    Chaque méthode travaille sur la session Flask, ou sur `store` si fourni
+    (un DetachedSession par exemple) pour traiter des conversations sans cookie.
+    """
+    
+    @staticmethod
+    def init_conversation(store=None):
+        """Initialise une nouvelle conversation"""
+        store = session if store is None else store
+        if 'conversation' not in store:
+            store['conversation'] = {
+                'id': new_conversation_id(),
+                'created_at': time.time(),
+                'expires_at': time.time() + 86400,  # 24h en secondes
+                'messages': [],
+                'user_info': {},
+                'topics': [],
+                'message_count': 0
+            }
+            store.modified = True
+        return store['conversation']
+    
+    @staticmethod
+    def is_expired(store=None):
+        """Vérifie si la session a expiré (24h)"""
+        store = session if store is None else store
+        if 'conversation' not in store:
+            return True
+        
+        expires_at = store['conversation'].get('expires_at', 0)
+        if time.time() > expires_at:
+            store.pop('conversation', None)
+            store.modified = True
+            return True
+        return False
+    
+    @staticmethod
+    def add_message(role, content, store=None):
+        """Ajoute un message à la conversation"""
+        store = session if store is None else store
+        MemoryService24h.init_conversation(store)
+        
+        if MemoryService24h.is_expired(store):
+            MemoryService24h.init_conversation(store)
+        
+        # Identifiant croissant, stable malgré la troncature (synchronisation client)
+        store['conversation']['messages'].append({
+            'id': store['conversation']['message_count'],
+            'role': role,
+            'content': content,
+            'timestamp': time.time(),
+            'time_str': datetime.now().strftime('%H:%M'),
+            'date_str': datetime.now().strftime('%d/%m/%Y')
+        })
+        
+        store['conversation']['message_count'] += 1
+        
+        # Garder seulement les 50 derniers messages
+        if len(store['conversation']['messages']) > 50:
+            store['conversation']['messages'] = store['conversation']['messages'][-50:]
+        
+        # Mettre à jour l'historique pré-rendu de manière incrémentale
+        PromptBuilder.append_history(
+            store['conversation']['id'],
+            store['conversation']['message_count'],
+            role,
+            content
+        )
+        
+        # Indexer le message pour la recherche (au-delà des 50 gardés en session)
+        message = store['conversation']['messages'][-1]
+        try:
+            ConversationIndex.add(store['conversation']['id'], message['id'], role, content, message['timestamp'])
+        except sqlite3.Error as e:
+            print(f"❌ Index mémoire: {str(e)}")
+        SemanticIndex.add(store['conversation']['id'], message['id'], role, content)
+        
+        store.modified = True
+        return store['conversation']
+    
+    @staticmethod
+    def get_context(limit=10, store=None):
+        """Récupère le contexte de conversation"""
+        store = session if store is None else store
+        if MemoryService24h.is_expired(store):
+            return []
+        
+        conversation = store.get('conversation', {})
+        messages = conversation.get('messages', [])
+        return messages[-limit:]
+    
+    @staticmethod
+    def get_messages_after(after_id=-1, store=None):
+        """Messages d'identifiant > after_id et indicateur de trou (messages tronqués)"""
+        store = session if store is None else store
+        if MemoryService24h.is_expired(store):
+            return [], False
+        
+        messages = store.get('conversation', {}).get('messages', [])
+        # Le client a manqué des messages déjà sortis de la fenêtre des 50 derniers
+        gap = bool(messages) and after_id < messages[0]['id'] - 1
+        return [message for message in messages if message['id'] > after_id], gap
+    
+    @staticmethod
+    def get_conversation_summary(store=None):
+        """Résumé de la conversation"""
+        store = session if store is None else store
+        if MemoryService24h.is_expired(store):
+            return None
+        
+        conv = store.get('conversation', {})
+        messages = conv.get('messages', [])
+        
+        if messages and len(messages) > 0:
+            start_time = messages[0].get('timestamp', time.time())
+            duration = time.time() - start_time
+            hours = int(duration // 3600)
+            minutes = int((duration % 3600) // 60)
+        else:
+            hours, minutes = 0, 0
+        
+        return {
+            'id': conv.get('id'),
+            'message_count': len(messages),
+            'duration': f"{hours}h{minutes}min",
+            'created_at': datetime.fromtimestamp(conv.get('created_at', time.time())).strftime('%H:%M %d/%m/%Y'),
+            'expires_at': datetime.fromtimestamp(conv.get('expires_at', time.time())).strftime('%H:%M %d/%m/%Y'),
+            'time_remaining': int(conv.get('expires_at', 0) - time.time())
+        }
+    
+    @staticmethod
+    def remember_info(key, value, store=None):
+        """Mémorise une information utilisateur"""
+        store = session if store is None else store
+        if MemoryService24h.is_expired(store):
+            MemoryService24h.init_conversation(store)
+        
+        if 'user_info' not in store['conversation']:
+            store['conversation']['user_info'] = {}
+        
+        store['conversation']['user_info'][key] = {
+            'value': value,
+            'timestamp': time.time()
+        }
+        store.modified = True
+    
+    @staticmethod
+    def get_user_info(key=None, store=None):
+        """Récupère les informations utilisateur"""
+        store = session if store is None else store
+        if MemoryService24h.is_expired(store):
+            return None
+        
+        user_info = store.get('conversation', {}).get('user_info', {})
+        if key:
+            info = user_info.get(key, {})
+            return info.get('value') if info else None
+        return {k: v['value'] for k, v in user_info.items()}
+    
+    @staticmethod
+    def add_topic(topic, store=None):
+        """Ajoute un sujet de discussion"""
+        store = session if store is None else store
+        if MemoryService24h.is_expired(store):
+            MemoryService24h.init_conversation(store)
+        
+        if 'topics' not in store['conversation']:
+            store['conversation']['topics'] = []
+        
+        if topic not in store['conversation']['topics']:
+            store['conversation']['topics'].append(topic)
+            if len(store['conversation']['topics']) > 10:
+                store['conversation']['topics'] = store['conversation']['topics'][-10:]
+        
+        store.modified = True
+    
+    @staticmethod
+    def clear(store=None):
+        """Efface la conversation"""
+        store = session if store is None else store
+        conversation = store.pop('conversation', None)
+        if conversation:
+            PromptBuilder.forget(conversation.get('id'))
+            ConversationIndex.forget(conversation.get('id'))
+            SemanticIndex.forget(conversation.get('id'))
+        store.modified = True
+
+# ============================================
+# CONSTRUCTION DES PROMPTS - TEMPLATES PRÉCOMPILÉS
+# ============================================
+
+def compile_template(template):
+    """Précompile un template '{champ}' en format C '%(champ)s' (rendu sans parsing)"""
+    parts = []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        parts.append(literal.replace('%', '%%'))
+        if field is not None:
+            parts.append(f'%({field})s')
+    compiled = ''.join(parts)
+    
+    def render(**values):
+        return compiled % values
+    
+    return render
+
+class PromptBuilder:
+    """Construit les prompts Gemini avec un préfixe statique mis en cache
+    et un historique rendu de manière incrémentale par conversation"""
+    
+    SYSTEM_INSTRUCTION = (
+        "Tu es BenBot, un assistant IA amical et serviable.\n"
+        "Réponds en français de manière naturelle, chaleureuse et utile."
+    )
+    STATIC_PREFIX = SYSTEM_INSTRUCTION + "\n\n"
+    
+    BODY = compile_template("{memory_context}\nHistorique de la conversation:\n{history}\nBenBot:")
+    HISTORY_LINE = compile_template("{role}: {content}\n")
+    NAME_LINE = compile_template("L'utilisateur s'appelle {name}. ")
+    TOPICS_LINE = compile_template("Sujets discutés récemment: {topics}. ")
+    DURATION_LINE = compile_template("Conversation active depuis {duration}. ")
+    RECALL_HEADER = "\nPassages plus anciens de la conversation liés à la question:\n"
+    
+    ROLE_LABELS = {'user': 'Utilisateur'}
+    DEFAULT_ROLE_LABEL = 'BenBot'
+    
+    HISTORY_LIMIT = 8
+    MAX_BUFFERED_LINES = 50  # Même limite que les messages en session
+    MAX_CONVERSATIONS = 1000  # Buffers gardés en mémoire (LRU)
+    
+    _buffers = OrderedDict()  # id conversation -> {'count': int, 'lines': deque}
+    _lock = threading.Lock()
+    _supports_system_instruction = None
+    
+    @classmethod
+    def render_line(cls, role, content):
+        """Rend une ligne d'historique"""
+        return cls.HISTORY_LINE(role=cls.ROLE_LABELS.get(role, cls.DEFAULT_ROLE_LABEL), content=content)
+    
+    @classmethod
+    def _store(cls, conversation_id, buffer):
+        """Enregistre un buffer en respectant la limite LRU (verrou déjà pris)"""
+        cls._buffers[conversation_id] = buffer
+        cls._buffers.move_to_end(conversation_id)
+        while len(cls._buffers) > cls.MAX_CONVERSATIONS:
+            cls._buffers.popitem(last=False)
+    
+    @classmethod
+    def append_history(cls, conversation_id, message_count, role, content):
+        """Ajoute un message rendu au buffer de la conversation"""
+        line = cls.render_line(role, content)
+        with cls._lock:
+            buffer = cls._buffers.get(conversation_id)
+            if buffer is not None and buffer['count'] == message_count - 1:
+                buffer['lines'].append(line)
+                buffer['count'] = message_count
+                cls._buffers.move_to_end(conversation_id)
+            elif message_count == 1:
+                cls._store(conversation_id, {
+                    'count': 1,
+                    'lines': deque([line], maxlen=cls.MAX_BUFFERED_LINES)
+                })
+            else:
+                # Buffer absent ou désynchronisé (autre worker) : reconstruit à la lecture
+                cls._buffers.pop(conversation_id, None)
+    
+    @classmethod
+    def render_history(cls, conversation, limit=None):
+        """Retourne les `limit` dernières lignes d'historique déjà rendues"""
+        limit = cls.HISTORY_LIMIT if limit is None else limit
+        conversation_id = conversation.get('id')
+        message_count = conversation.get('message_count', 0)
+        
+        with cls._lock:
+            buffer = cls._buffers.get(conversation_id)
+            if buffer is None or buffer['count'] != message_count:
+                lines = deque(
+                    (cls.render_line(m['role'], m['content']) for m in conversation.get('messages', [])),
+                    maxlen=cls.MAX_BUFFERED_LINES
+                )
+                buffer = {'count': message_count, 'lines': lines}
+                cls._store(conversation_id, buffer)
+            else:
+                cls._buffers.move_to_end(conversation_id)
+            
+            lines = buffer['lines']
+            if limit >= len(lines):
+                return ''.join(lines)
+            return ''.join(islice(lines, len(lines) - limit, None))
+    
+    @classmethod
+    def render_memory_context(cls, user_info, topics, summary):
+        """Rend le contexte mémoire (prénom, sujets, durée)"""
+        memory_context = ""
+        
+        if user_info and 'prenom' in user_info:
+            memory_context += cls.NAME_LINE(name=user_info['prenom'])
+        
+        if topics:
+            memory_context += cls.TOPICS_LINE(topics=', '.join(topics[-3:]))
+        
+        if summary and summary['time_remaining'] > 0:
+            hours_left = summary['time_remaining'] // 3600
+            if hours_left > 0:
+                memory_context += cls.DURATION_LINE(duration=summary['duration'])
+        
+        return memory_context
+    
+    @classmethod
+    def supports_system_instruction(cls):
+        """Vérifie si le SDK installé accepte `system_instruction`"""
+        if cls._supports_system_instruction is None:
+            try:
+                params = inspect.signature(genai.GenerativeModel.__init__).parameters
+                cls._supports_system_instruction = 'system_instruction' in params
+            except (TypeError, ValueError):
+                cls._supports_system_instruction = False
+        return cls._supports_system_instruction
+    
+    @classmethod
+    def render_recalled(cls, recalled):
+        """Rend les tours anciens retrouvés par les index de la mémoire"""
+        if not recalled:
+            return ""
+        return cls.RECALL_HEADER + ''.join(cls.render_line(m['role'], m['content']) for m in recalled)
+    
+    @classmethod
+    def build(cls, conversation, user_info, topics, summary, history_limit=None, recalled=None):
+        """Retourne (system_instruction, prompt) pour Gemini"""
+        body = cls.BODY(
+            memory_context=cls.render_memory_context(user_info, topics, summary) + cls.render_recalled(recalled),
+            history=cls.render_history(conversation, history_limit)
+        )
+        
+        if cls.supports_system_instruction():
+            return cls.SYSTEM_INSTRUCTION, body
+        return None, cls.STATIC_PREFIX + body
+    
+    @classmethod
+    def forget(cls, conversation_id):
+        """Supprime le buffer d'une conversation"""
+        with cls._lock:
+            cls._buffers.pop(conversation_id, None)
+    
+    @classmethod
+    def get_stats(cls):
+        """Statistiques des buffers d'historique"""
+        with cls._lock:
+            return {
+                'buffered_conversations': len(cls._buffers),
+                'system_instruction': bool(cls._supports_system_instruction)
+            }
+
+# ============================================
+# RECHERCHE PLEIN TEXTE DANS LA MÉMOIRE (SQLITE FTS5)
+# ============================================
+
+class ConversationIndex:
+    """Index inversé des messages, alimenté par MemoryService24h.add_message.
+    
+    La session ne garde que les 50 derniers messages; l'index conserve toute
+    la conversation (24h) pour la recherche et le rappel de tours anciens
+    dans le prompt. Sans FTS5, repli sur une recherche LIKE (lente).
+    """
+    
+    RETENTION = 86400  # comme la mémoire 24h
+    PURGE_EVERY = 1000  # insertions entre deux purges
+    RECALL_LIMIT = 3
+    COMMON_RATIO = 0.2  # mot présent dans plus de 20% des messages : peu discriminant
+    MIN_WORD_LENGTH = 3
+    STOPWORDS = frozenset(
+        "les des une est pas que qui pour dans sur avec son ses mais ton tes mon mes "
+        "moi toi lui elle nous vous ils elles ces cet cette aux par plus tout tous "
+        "comme bien fait faire etre être avoir suis sont était quoi quel quelle "
+        "the and you are for what".split()
+    )
+    
+    _conn = None
+    _fts5 = None
+    _path = None
+    _lock = threading.Lock()
+    _inserts = 0
+    
+    @classmethod
+    def default_path(cls):
+        if MEMORY_INDEX_PATH:
+            return MEMORY_INDEX_PATH
+        if STATE_BACKEND == 'sqlite':
+            return (STATE_PATH or os.path.join(tempfile.gettempdir(), 'benbot_state.db')) + '.fts'
+        return ':memory:'
+    
+    @classmethod
+    def configure(cls, path=None):
+        """(Ré)ouvre l'index sur `path` (':memory:' = propre au processus)"""
+        with cls._lock:
+            if cls._conn is not None:
+                cls._conn.close()
+            cls._path = path or cls.default_path()
+            conn = sqlite3.connect(cls._path, timeout=30, isolation_level=None, check_same_thread=False)
+            if cls._path != ':memory:':
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS memory_fts USING fts5("
+                    "content, conversation_id, message_id UNINDEXED, role UNINDEXED, ts UNINDEXED, "
+                    "tokenize = 'unicode61 remove_diacritics 2')"
+                )
+                cls._fts5 = True
+            except sqlite3.OperationalError:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS memory_fts ("
+                    "content TEXT, conversation_id TEXT, message_id INTEGER, role TEXT, ts REAL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS memory_fts_conv ON memory_fts (conversation_id)")
+                cls._fts5 = False
+                print("⚠️ SQLite sans FTS5 : recherche mémoire par LIKE")
+            if cls._fts5:
+                # Fréquence des termes dans l'index (élagage des mots trop courants)
+                conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS memory_vocab USING fts5vocab(memory_fts, 'row')")
+            cls._conn = conn
+    
+    @classmethod
+    def _connection(cls):
+        if cls._conn is None:
+            cls.configure()
+        return cls._conn
+    
+    @classmethod
+    def keywords(cls, text):
+        """Mots significatifs d'un texte (minuscules, sans mots vides)"""
+        seen = []
+        for word in re.findall(r"\w+", text.lower()):
+            if len(word) >= cls.MIN_WORD_LENGTH and word not in cls.STOPWORDS and word not in seen:
+                seen.append(word)
+        return seen
+    
+    @staticmethod
+    def _fold(word):
+        """Forme du mot telle que stockée par le tokenizer (sans accents)"""
+        return ''.join(c for c in unicodedata.normalize('NFKD', word) if not unicodedata.combining(c))
+    
+    @classmethod
+    def _rare_words(cls, conn, words):
+        """Mots assez rares pour être classés par bm25 sans parcourir tout l'index"""
+        # Bornes de rowid (ORDER BY rowid est servi par l'index, MIN/MAX non)
+        low, high = conn.execute(
+            "SELECT (SELECT rowid FROM memory_fts ORDER BY rowid LIMIT 1), "
+            "(SELECT rowid FROM memory_fts ORDER BY rowid DESC LIMIT 1)"
+        ).fetchone()
+        if low is None:
+            return words
+        threshold = (high - low + 1) * cls.COMMON_RATIO
+        folded = {cls._fold(word): word for word in words}
+        placeholders = ','.join('?' for _ in folded)
+        counts = dict(conn.execute(
+            f"SELECT term, doc FROM memory_vocab WHERE term IN ({placeholders})", list(folded)
+        ).fetchall())
+        return [word for term, word in folded.items() if counts.get(term, 0) <= threshold]
+    
+    @staticmethod
+    def _phrase(value):
+        return '"' + str(value).replace('"', '""') + '"'
+    
+    @classmethod
+    def add(cls, conversation_id, message_id, role, content, timestamp=None):
+        conn = cls._connection()
+        with cls._lock:
+            conn.execute(
+                "INSERT INTO memory_fts (content, conversation_id, message_id, role, ts) VALUES (?, ?, ?, ?, ?)",
+                (content, conversation_id, message_id, role, timestamp or time.time())
+            )
+            cls._inserts += 1
+            purge = cls._inserts % cls.PURGE_EVERY == 0
+        if purge:
+            cls.purge()
+    
+    @classmethod
+    def search(cls, conversation_id, query, limit=10, before_id=None):
+        """Messages de la conversation contenant les mots de `query`, les plus pertinents d'abord"""
+        words = cls.keywords(query)
+        if not conversation_id or not words:
+            return []
+        conn = cls._connection()
+        before = before_id if before_id is not None else 2 ** 62
+        
+        with cls._lock:
+            if cls._fts5:
+                # Classement bm25 sur les mots discriminants; si la requête n'a que des
+                # mots courants, les correspondances les plus récentes (rowid décroissant)
+                rare = cls._rare_words(conn, words)
+                order = "bm25(memory_fts)" if rare else "rowid DESC"
+                # Filtre sur la conversation dans l'index lui-même (intersection des listes)
+                match = (f"conversation_id : {cls._phrase(conversation_id)} AND content : ("
+                         + ' OR '.join(cls._phrase(word) + '*' for word in rare or words) + ')')
+                rows = conn.execute(
+                    "SELECT message_id, role, content, ts, "
+                    "snippet(memory_fts, 0, '[', ']', '…', 12), bm25(memory_fts) "
+                    "FROM memory_fts WHERE memory_fts MATCH ? AND conversation_id = ? "
+                    f"AND CAST(message_id AS INTEGER) < ? ORDER BY {order} LIMIT ?",
+                    (match, conversation_id, before, limit)
+                ).fetchall()
+            else:
+                clause = ' OR '.join('content LIKE ?' for _ in words)
+                rows = conn.execute(
+                    f"SELECT message_id, role, content, ts, substr(content, 1, 80), 0 FROM memory_fts "
+                    f"WHERE conversation_id = ? AND message_id < ? AND ({clause}) "
+                    f"ORDER BY message_id DESC LIMIT ?",
+                    (conversation_id, before, *[f'%{word}%' for word in words], limit)
+                ).fetchall()
+        
+        return [{
+            'id': int(message_id),
+            'role': role,
+            'content': content,
+            'timestamp': ts,
+            'snippet': snippet,
+            'score': round(-score, 3)
+        } for message_id, role, content, ts, snippet, score in rows]
+    
+    @classmethod
+    def recall(cls, conversation, query, exclude_recent=None, limit=None):
+        """Tours anciens pertinents, hors des derniers messages déjà dans le prompt"""
+        exclude_recent = PromptBuilder.HISTORY_LIMIT if exclude_recent is None else exclude_recent
+        limit = cls.RECALL_LIMIT if limit is None else limit
+        messages = conversation.get('messages') or []
+        if not messages:
+            return []
+        before_id = messages[-1]['id'] - exclude_recent + 1
+        if before_id <= 0:
+            return []
+        try:
+            found = cls.search(conversation.get('id'), query, limit, before_id)
+        except sqlite3.Error as e:
+            print(f"❌ Index mémoire: {str(e)}")
+            return []
+        # Ordre chronologique dans le prompt
+        return sorted(found, key=lambda message: message['id'])
+    
+    @classmethod
+    def forget(cls, conversation_id):
+        conn = cls._connection()
+        with cls._lock:
+            if cls._fts5:
+                conn.execute("DELETE FROM memory_fts WHERE memory_fts MATCH ? AND conversation_id = ?",
+                             (f"conversation_id : {cls._phrase(conversation_id)}", conversation_id))
+            else:
+                conn.execute("DELETE FROM memory_fts WHERE conversation_id = ?", (conversation_id,))
+    
+    @classmethod
+    def purge(cls, now=None):
+        """Supprime les messages de plus de 24h"""
+        conn = cls._connection()
+        with cls._lock:
+            conn.execute("DELETE FROM memory_fts WHERE ts < ?", ((now or time.time()) - cls.RETENTION,))
+    
+    @classmethod
+    def get_stats(cls):
+        conn = cls._connection()
+        with cls._lock:
+            rows = conn.execute("SELECT COUNT(*) FROM memory_fts").fetchone()[0]
+        return {'path': cls._path, 'fts5': cls._fts5, 'messages': rows}
+
+# ============================================
+# RAPPEL SÉMANTIQUE LOCAL (VECTEURS DE N-GRAMMES HACHÉS)
+# ============================================
+
+class SemanticIndex:
+    """Vecteurs de n-grammes de caractères hachés, calculés à l'ajout de chaque message.
+    
+    Complète ConversationIndex (mots exacts) : retrouve les tours proches par la forme
+    des mots (pluriels, conjugaisons, fautes de frappe). Une matrice float32 par
+    conversation, agrandie par doublement; la recherche est un produit matriciel.
+    NumPy est importé au premier vecteur (pas au démarrage à froid); sans
+    NumPy, repli sur des vecteurs creux en Python pur.
+    Index propre au processus, recomplété depuis la session si un autre worker
+    a traité des messages.
+    """
+    
+    DIM = 256
+    NGRAM = 3
+    MIN_SIMILARITY = 0.25
+    RECALL_LIMIT = 3
+    MAX_TOTAL_ROWS = 100000  # lignes allouées (~100 Mo en float32), toutes conversations confondues
+    INITIAL_CAPACITY = 4  # la plupart des conversations n'ont que 1-2 messages; doublement ensuite
+    
+    _entries = OrderedDict()  # id conversation -> {'ids', 'messages', 'vectors', 'size'}
+    _total = 0  # lignes allouées (capacité des matrices, pas seulement les vecteurs remplis)
+    _lock = threading.Lock()
+    _numpy = None  # module NumPy après le premier vecteur, False s'il est absent
+    
+    @classmethod
+    def features(cls, text):
+        """Mots significatifs et leurs trigrammes de caractères (sans accents)"""
+        features = Counter()
+        for word in re.findall(r"\w+", text.lower()):
+            if len(word) < 2 or word in ConversationIndex.STOPWORDS:
+                continue
+            word = ConversationIndex._fold(word)
+            features['w:' + word] += 1
+            padded = f' {word} '
+            for i in range(len(padded) - cls.NGRAM + 1):
+                features[padded[i:i + cls.NGRAM]] += 1
+        return features
+    
+    @classmethod
+    def embed(cls, text):
+        """Vecteur creux normalisé {indice: poids} (hachage signé, tf sous-linéaire)"""
+        vector = {}
+        for feature, count in cls.features(text).items():
+            h = zlib.crc32(feature.encode('utf-8'))
+            index = h % cls.DIM
+            weight = (1 + math.log(count)) * (1 if h & 0x80000000 else -1)
+            vector[index] = vector.get(index, 0.0) + weight
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        if not norm:
+            return {}
+        return {index: w / norm for index, w in vector.items()}
+    
+    @classmethod
+    def numpy(cls):
+        """Module NumPy, importé au premier usage (None : repli Python pur)"""
+        if cls._numpy is None:
+            try:
+                import numpy
+                cls._numpy = numpy
+            except ImportError:
+                print("⚠️ NumPy absent : rappel sémantique en Python pur (plus lent)")
+                cls._numpy = False
+        return cls._numpy or None
+    
+    @staticmethod
+    def _rows(entry):
+        """Lignes réservées par une conversation (capacité de la matrice NumPy)"""
+        return len(entry['vectors'])
+    
+    @classmethod
+    def _entry(cls, conversation_id):
+        """Entrée existante ou nouvelle, comptée dans le budget dès son allocation (verrou déjà pris)"""
+        entry = cls._entries.get(conversation_id)
+        if entry is None:
+            np = cls.numpy()
+            vectors = np.zeros((cls.INITIAL_CAPACITY, cls.DIM), dtype=np.float32) if np is not None else []
+            entry = cls._entries[conversation_id] = {'ids': [], 'messages': [], 'vectors': vectors, 'size': 0}
+            cls._total += cls._rows(entry)
+        cls._entries.move_to_end(conversation_id)
+        return entry
+    
+    @classmethod
+    def _append(cls, entry, message_id, role, content):
+        """Ajoute un vecteur à la conversation (verrou déjà pris)"""
+        if entry['ids'] and message_id <= entry['ids'][-1]:
+            return
+        vector = cls.embed(content)
+        np = cls.numpy()
+        if np is not None:
+            if entry['size'] == len(entry['vectors']):
+                grown = np.zeros((len(entry['vectors']) * 2, cls.DIM), dtype=np.float32)
+                grown[:entry['size']] = entry['vectors']
+                cls._total += len(grown) - len(entry['vectors'])
+                entry['vectors'] = grown
+            row = entry['vectors'][entry['size']]
+            for index, weight in vector.items():
+                row[index] = weight
+        else:
+            entry['vectors'].append(vector)
+            cls._total += 1
+        entry['ids'].append(message_id)
+        entry['messages'].append((role, content))
+        entry['size'] += 1
+    
+    @classmethod
+    def _evict(cls):
+        """Libère les conversations les moins récentes au-delà du budget (verrou déjà pris)"""
+        while cls._total > cls.MAX_TOTAL_ROWS and len(cls._entries) > 1:
+            _, entry = cls._entries.popitem(last=False)
+            cls._total -= cls._rows(entry)
+    
+    @classmethod
+    def add(cls, conversation_id, message_id, role, content):
+        """Vectorise un message au moment où il est ajouté à la conversation"""
+        with cls._lock:
+            entry = cls._entry(conversation_id)
+            cls._append(entry, message_id, role, content)
+            cls._evict()
+    
+    @classmethod
+    def _sync(cls, conversation):
+        """Entrée de la conversation, complétée avec les messages de session manquants"""
+        entry = cls._entry(conversation.get('id'))
+        last_id = entry['ids'][-1] if entry['ids'] else -1
+        for message in conversation.get('messages') or []:
+            if message['id'] > last_id:
+                cls._append(entry, message['id'], message['role'], message['content'])
+        cls._evict()
+        return entry
+    
+    @classmethod
+    def search(cls, conversation, query, limit=None, before_id=None):
+        """Tours de la conversation les plus proches de `query` (similarité cosinus)"""
+        limit = cls.RECALL_LIMIT if limit is None else limit
+        vector = cls.embed(query)
+        if not vector or not conversation.get('id'):
+            return []
+        
+        with cls._lock:
+            entry = cls._sync(conversation)
+            count = entry['size'] if before_id is None else bisect.bisect_left(entry['ids'], before_id)
+            if count <= 0:
+                return []
+            
+            np = cls.numpy()
+            if np is not None:
+                dense = np.zeros(cls.DIM, dtype=np.float32)
+                for index, weight in vector.items():
+                    dense[index] = weight
+                scores = entry['vectors'][:count] @ dense
+                top = np.argpartition(-scores, limit - 1)[:limit] if count > limit else np.arange(count)
+                ranked = sorted(((float(scores[i]), int(i)) for i in top), reverse=True)
+            else:
+                scored = ((sum(weight * row.get(index, 0.0) for index, weight in vector.items()), i)
+                          for i, row in enumerate(islice(entry['vectors'], count)))
+                ranked = heapq.nlargest(limit, scored)
+            
+            return [{
+                'id': entry['ids'][i],
+                'role': entry['messages'][i][0],
+                'content': entry['messages'][i][1],
+                'similarity': round(score, 3)
+            } for score, i in ranked if score >= cls.MIN_SIMILARITY]
+    
+    @classmethod
+    def recall(cls, conversation, query, exclude_recent=None, limit=None):
+        """Tours anciens proches de la question, hors des derniers messages déjà dans le prompt"""
+        exclude_recent = PromptBuilder.HISTORY_LIMIT if exclude_recent is None else exclude_recent
+        messages = conversation.get('messages') or []
+        if not messages:
+            return []
+        before_id = messages[-1]['id'] - exclude_recent + 1
+        if before_id <= 0:
+            return []
+        return sorted(cls.search(conversation, query, limit, before_id), key=lambda message: message['id'])
+    
+    @classmethod
+    def forget(cls, conversation_id):
+        with cls._lock:
+            entry = cls._entries.pop(conversation_id, None)
+            if entry is not None:
+                cls._total -= cls._rows(entry)
+    
+    @classmethod
+    def get_stats(cls):
+        with cls._lock:
+            return {
+                'backend': {None: 'non chargé', False: 'python'}.get(cls._numpy, 'numpy'),
+                'conversations': len(cls._entries),
+                'vectors': sum(entry['size'] for entry in cls._entries.values()),
+                'allocated_rows': cls._total,
+                'max_rows': cls.MAX_TOTAL_ROWS,
+                'dimensions': cls.DIM
+            }
+
+def recall_past_turns(conversation, query):
+    """Tours anciens pour le prompt : mots exacts (FTS5) puis proximité (n-grammes), sans doublons"""
+    recalled = {}
+    for message in ConversationIndex.recall(conversation, query) + SemanticIndex.recall(conversation, query):
+        recalled.setdefault(message['id'], message)
+    return [recalled[message_id] for message_id in sorted(recalled)]
+
+# ============================================
+# SERVICE GEMINI - DÉTECTION AUTOMATIQUE
+# ============================================
+
+class GeminiService:
+    """Service Gemini avec détection automatique des modèles.
+    
+    La liste des modèles est mise en cache dans le backend d'état injecté
+    (clés 'gemini:*') : avec un backend partagé, un seul worker interroge l'API.
+    """
+    
+    CACHE_DURATION = 3600  # 1 heure
+    
+    # Auto-test des modèles : en parallèle, délai maximal par modèle
+    SELF_TEST_CONCURRENCY = 8
+    SELF_TEST_TIMEOUT = 15
+    SELF_TEST_TTL = 1800  # résultats servis depuis l'instantané pendant 30 min
+    LATENCY_SAMPLES = 50  # latences conservées par modèle
+    SLOW_P95_MS = 8000  # au-delà, un modèle moins prioritaire mais plus rapide passe devant
+    
+    def __init__(self, state):
+        self.state = state
+        self.usage = UsageLedger(state)
+    
+    def _cached_models(self, requested_at):
+        models = self.state.get('gemini:available_models')
+        if models is not None and requested_at - self.state.get('gemini:last_check', 0) < self.CACHE_DURATION:
+            return models
+        return None
+    
+    def get_available_models(self, force_refresh=False):
+        """Liste les modèles Gemini disponibles"""
+        
+        current_time = time.time()
+        if not force_refresh:
+            models = self._cached_models(current_time)
+            if models is not None:
+                return models
+        
+        if not GEMINI_API_KEY:
+            return []
+        
+        with self.state.lock('gemini:models', timeout=30):
+            # Un autre worker a peut-être rechargé pendant l'attente
+            if self.state.get('gemini:last_check', 0) >= current_time:
+                return self.state.get('gemini:available_models') or []
+            
+            try:
+                models = []
+                
+                for model in genai.list_models():
+                    if 'generateContent' in model.supported_generation_methods:
+                        models.append({
+                            'name': model.name,
+                            'display_name': model.display_name,
+                            'methods': list(model.supported_generation_methods)
+                        })
+                        print(f"📋 Modèle trouvé: {model.name}")
+                
+                self.state.set('gemini:available_models', models)
+                self.state.set('gemini:last_check', time.time())
+                return models
+                
+            except Exception as e:
+                print(f"❌ Erreur chargement modèles: {str(e)}")
+                return []
+    
+    @staticmethod
+    def _percentile(values, p):
+        """Percentile par interpolation linéaire"""
+        values = sorted(values)
+        if not values:
+            return None
+        k = (len(values) - 1) * p / 100.0
+        low = int(k)
+        high = min(low + 1, len(values) - 1)
+        return round(values[low] + (values[high] - values[low]) * (k - low), 1)
+    
+    def _test_model(self, name):
+        prompt = "Dis 'OK' en un mot"
+        start = time.perf_counter()
+        test_model = genai.GenerativeModel(name)
+        test_response = test_model.generate_content(
+            prompt,
+            generation_config={"max_output_tokens": 10}
+        )
+        latency = (time.perf_counter() - start) * 1000
+        text = test_response.text
+        # Appel réel facturé : compté dans le budget du jour comme les autres
+        self.usage.record(None, name, *self.usage.count(test_response, prompt, text), action='self_test')
+        return bool(text), latency
+    
+    def record_test(self, name, ok, latency_ms=None):
+        """Mémorise le résultat d'un test (les latences alimentent get_best_model)"""
+        def update(health):
+            health = dict(health or {})
+            entry = dict(health.get(name) or {'latencies': []})
+            entry['ok'] = ok
+            entry['checked_at'] = time.time()
+            if latency_ms is not None:
+                entry['latencies'] = (entry['latencies'] + [round(latency_ms, 1)])[-self.LATENCY_SAMPLES:]
+            health[name] = entry
+            return health
+        
+        self.state.update('gemini:model_health', update)
+    
+    def get_model_health(self):
+        """{modèle: {ok, p50, p95, samples, checked_at}}"""
+        return {
+            name: {
+                'ok': entry['ok'],
+                'p50': self._percentile(entry['latencies'], 50),
+                'p95': self._percentile(entry['latencies'], 95),
+                'samples': len(entry['latencies']),
+                'checked_at': entry['checked_at']
+            }
+            for name, entry in (self.state.get('gemini:model_health') or {}).items()
+        }
+    
+    def self_test(self):
+        """Teste tous les modèles compatibles en parallèle (délai maximal par modèle)"""
+        result = {'models': [], 'error': None}
+        if not GEMINI_API_KEY:
+            result['error'] = 'Clé API manquante'
+            return result
+        
+        try:
+            models = []
+            for model in genai.list_models():
+                models.append({
+                    'name': model.name,
+                    'display_name': model.display_name,
+                    'supports_generate': 'generateContent' in model.supported_generation_methods,
+                    'methods': list(model.supported_generation_methods)
+                })
+            
+            testable = [model for model in models if model['supports_generate']]
+            if testable:
+                pool = ThreadPoolExecutor(max_workers=min(self.SELF_TEST_CONCURRENCY, len(testable)),
+                                          thread_name_prefix='gemini-self-test')
+                futures = [(model, pool.submit(self._test_model, model['name'])) for model in testable]
+                # Tous les tests partent ensemble : un délai commun borne chacun d'eux
+                deadline = time.monotonic() + self.SELF_TEST_TIMEOUT
+                for model_info, future in futures:
+                    try:
+                        ok, latency = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                        model_info['test'] = '✅ OK' if ok else '⚠️ Vide'
+                        model_info['latency_ms'] = round(latency, 1)
+                        self.record_test(model_info['name'], ok, latency)
+                    except FutureTimeoutError:
+                        model_info['test'] = f'⏱️ Délai dépassé ({self.SELF_TEST_TIMEOUT}s)'
+                        self.record_test(model_info['name'], False)
+                    except Exception as e:
+                        model_info['test'] = f'❌ {str(e)[:50]}'
+                        self.record_test(model_info['name'], False)
+                # Les tests bloqués continuent dans leur thread sans retenir le collecteur
+                pool.shutdown(wait=False)
+            
+            health = self.get_model_health()
+            for model_info in models:
+                if model_info['name'] in health:
+                    model_info['p50_ms'] = health[model_info['name']]['p50']
+                    model_info['p95_ms'] = health[model_info['name']]['p95']
+            
+            result['models'] = models
+            result['count'] = len(models)
+            
+        except Exception as e:
+            result['error'] = str(e)
+        
+        return result
+    
+    def get_best_model(self):
+        """Sélectionne le meilleur modèle disponible"""
+        
+        models = self.get_available_models()
+        
+        if not models:
+            return None
+        
+        # Liste des modèles préférés par ordre de priorité
+        preferred_names = [
+            'models/gemini-1.5-pro',
+            'models/gemini-1.5-flash',
+            'models/gemini-1.0-pro',
+            'models/gemini-pro',
+            'gemini-1.5-pro',
+            'gemini-1.5-flash',
+            'gemini-1.0-pro',
+            'gemini-pro'
+        ]
+        
+        names = [model['name'] for model in models]
+        ranked = [name for name in preferred_names if name in names]
+        ranked += [name for name in names if name not in ranked]
+        
+        # Résultats des auto-tests : écarter les modèles en échec, puis les trop lents
+        health = self.get_model_health()
+        healthy = [name for name in ranked if health.get(name, {}).get('ok', True)] or ranked
+        fast = [name for name in healthy
+                if (health.get(name, {}).get('p95') or 0) <= self.SLOW_P95_MS]
+        
+        if fast:
+            selected = fast[0]
+        else:
+            selected = min(healthy, key=lambda name: health[name]['p95'])
+        
+        if selected in preferred_names:
+            print(f"✅ Modèle sélectionné: {selected}")
+        else:
+            print(f"⚠️ Modèle par défaut: {selected}")
+        return selected
+
+# ============================================
+# PRÉCHAUFFAGE (IMPORT DIFFÉRÉ DU SDK)
+# ============================================
+
+def warm_up(gemini):
+    """Charge le SDK Gemini et la liste des modèles avant la première requête"""
+    start = time.perf_counter()
+    if isinstance(genai, LazyGenAI):
+        genai.load()
+    models = gemini.get_available_models() if GEMINI_API_KEY else []
+    return {
+        'sdk_load_time': round(genai.load_time, 3) if getattr(genai, 'load_time', None) else None,
+        'models': len(models),
+        'duration': round(time.perf_counter() - start, 3)
+    }
+
+def get_sdk_status():
+    """Indique si le SDK Gemini est déjà chargé dans ce processus"""
+    return {
+        'loaded': getattr(genai, 'loaded', True),
+        'load_time': round(genai.load_time, 3) if getattr(genai, 'load_time', None) else None
+    }
+
+# ============================================
+# COALESCENCE DES REQUÊTES GEMINI EN COURS
+# ============================================
+
+class _InflightCall:
+    """Appel Gemini en cours partagé entre plusieurs requêtes identiques"""
+
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class GeminiCoalescer:
+    """Fusionne les appels generate_content identiques lancés en même temps.
+
+    Ce n'est pas un cache : une fois l'appel terminé, la clé est retirée et
+    la requête suivante repart vers Gemini. Seuls les doublons concurrents
+    partagent le même appel amont.
+    """
+
+    _inflight = {}
+    _lock = threading.Lock()
+    WAIT_TIMEOUT = 30  # secondes d'attente max pour les requêtes en attente
+
+    # Statistiques
+    _leaders = 0
+    _coalesced = 0
+    _timeouts = 0
+    _errors = 0
+
+    @staticmethod
+    def make_key(model_name, prompt, generation_config):
+        """Clé = modèle + prompt complet + configuration de génération"""
+        payload = json.dumps(
+            [model_name, prompt, generation_config],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def run(cls, key, fn, timeout=None):
+        """Exécute fn() une seule fois pour tous les appels concurrents de même clé"""
+        with cls._lock:
+            call = cls._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _InflightCall()
+                cls._inflight[key] = call
+                cls._leaders += 1
+            else:
+                call.waiters += 1
+                cls._coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                with cls._lock:
+                    cls._errors += 1
+            finally:
+                with cls._lock:
+                    cls._inflight.pop(key, None)
+                call.event.set()
+        else:
+            wait_timeout = cls.WAIT_TIMEOUT if timeout is None else timeout
+            if not call.event.wait(wait_timeout):
+                with cls._lock:
+                    cls._timeouts += 1
+                raise TimeoutError(f"Appel Gemini partagé non terminé après {wait_timeout}s")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    @classmethod
+    def generate(cls, model_name, prompt, generation_config, system_instruction=None, timeout=None):
+        """generate_content avec fusion des appels identiques en cours"""
+        key = cls.make_key(model_name, [system_instruction, prompt], generation_config)
+
+        def call_gemini():
+            if system_instruction:
+                model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+            else:
+                model = genai.GenerativeModel(model_name)
+            return model.generate_content(prompt, generation_config=generation_config)
+
+        return cls.run(key, call_gemini, timeout=timeout)
+
+    @classmethod
+    def get_stats(cls):
+        """Retourne les statistiques de coalescence"""
+        with cls._lock:
+            total = cls._leaders + cls._coalesced
+            return {
+                'upstream_calls': cls._leaders,
+                'coalesced': cls._coalesced,
+                'timeouts': cls._timeouts,
+                'errors': cls._errors,
+                'in_flight': len(cls._inflight),
+                'saved_rate': f"{cls._coalesced/total*100:.1f}%" if total > 0 else "0%"
+            }
+
+# ============================================
+# CONSOMMATION DE TOKENS ET BUDGETS
+# ============================================
+
+class UsageLedger:
+    """Comptabilité des tokens Gemini par conversation, par modèle et par jour.
+    
+    Les comptes viennent de `usage_metadata` quand la réponse en fournit,
+    sinon ils sont estimés (~4 caractères par token). Avant chaque appel,
+    plan() adapte la génération au budget restant de la conversation et au
+    budget global du jour (état partagé, tous workers) : réponses plus
+    courtes et modèle moins cher quand il devient faible, refus à zéro.
+    Un budget à 0 désactive la limite.
+    """
+    
+    SESSION_BUDGET = int(os.environ.get('USAGE_SESSION_BUDGET', '200000'))  # tokens par conversation (24h)
+    DAILY_BUDGET = int(os.environ.get('USAGE_DAILY_BUDGET', '5000000'))  # tokens par jour (UTC)
+    LOW_RATIO = 0.2  # sous 20% restants : modèle économique et réponses courtes
+    LOW_MAX_TOKENS = 256
+    MIN_OUTPUT_TOKENS = 32
+    CHARS_PER_TOKEN = 4
+    HISTORY_DAYS = 7
+    # Prix indicatifs en dollars par million de tokens (entrée, sortie)
+    PRICES = {
+        'gemini-1.5-pro': (3.5, 10.5),
+        'gemini-1.5-flash': (0.35, 1.05),
+        'gemini-1.0-pro': (0.5, 1.5),
+        'gemini-pro': (0.5, 1.5)
+    }
+    DEFAULT_PRICE = (0.5, 1.5)
+    ECONOMY_MODELS = ['gemini-1.5-flash', 'gemini-1.0-pro', 'gemini-pro']
+    
+    def __init__(self, state):
+        self.state = state
+    
+    @staticmethod
+    def _day(now=None):
+        return time.strftime('%Y-%m-%d', time.gmtime(now))
+    
+    @staticmethod
+    def _short(model_name):
+        return (model_name or '').split('/')[-1]
+    
+    @classmethod
+    def estimate(cls, *texts):
+        """Nombre de tokens estimé d'après la longueur du texte"""
+        return sum(len(text or '') for text in texts) // cls.CHARS_PER_TOKEN
+    
+    @classmethod
+    def price(cls, model_name):
+        """(entrée, sortie) en $/M tokens; préfixe le plus long (gemini-1.5-flash-001...)"""
+        short = cls._short(model_name)
+        for name in sorted(cls.PRICES, key=len, reverse=True):
+            if short.startswith(name):
+                return cls.PRICES[name]
+        return cls.DEFAULT_PRICE
+    
+    @classmethod
+    def cost(cls, model_name, prompt_tokens, completion_tokens):
+        price_in, price_out = cls.price(model_name)
+        return (prompt_tokens * price_in + completion_tokens * price_out) / 1e6
+    
+    @staticmethod
+    def _remaining(budget, used):
+        return None if budget <= 0 else max(0, budget - used)
+    
+    def today(self):
+        return self.state.get(f'usage:day:{self._day()}') or {}
+    
+    def session_usage(self, conversation):
+        """Consommation et budget restant d'une conversation"""
+        usage = dict((conversation or {}).get('usage') or {})
+        used = usage.get('prompt_tokens', 0) + usage.get('completion_tokens', 0)
+        usage['budget'] = self.SESSION_BUDGET or None
+        usage['remaining'] = self._remaining(self.SESSION_BUDGET, used)
+        return usage
+    
+    def economy_model(self, model_name, available):
+        """Modèle disponible moins cher que `model_name` (None s'il n'y en a pas)"""
+        current = sum(self.price(model_name))
+        by_short = {self._short(name): name for name in available}
+        for short in self.ECONOMY_MODELS:
+            name = by_short.get(short)
+            if name and sum(self.price(name)) < current:
+                return name
+        return None
+    
+    def plan(self, conversation, model_name, prompt_tokens, max_tokens, available=()):
+        """Réglages de génération selon les budgets restants.
+        
+        Retourne {model, max_tokens, action, session_remaining, daily_remaining}
+        où action vaut 'ok', 'capped' (réponse raccourcie), 'downgraded'
+        (modèle moins cher) ou 'refused' (budget épuisé).
+        """
+        session_remaining = self.session_usage(conversation)['remaining']
+        day = self.today()
+        daily_remaining = self._remaining(self.DAILY_BUDGET,
+                                          day.get('prompt_tokens', 0) + day.get('completion_tokens', 0))
+        plan = {
+            'model': model_name,
+            'max_tokens': max_tokens,
+            'action': 'ok',
+            'session_remaining': session_remaining,
+            'daily_remaining': daily_remaining
+        }
+        
+        limits = [(remaining, budget) for remaining, budget in ((session_remaining, self.SESSION_BUDGET),
+                                                                  (daily_remaining, self.DAILY_BUDGET))
+                  if remaining is not None]
+        if not limits:
+            return plan
+        remaining = min(remaining for remaining, _ in limits)
+        if remaining < prompt_tokens + self.MIN_OUTPUT_TOKENS:
+            plan['action'] = 'refused'
+            return plan
+        
+        plan['max_tokens'] = min(max_tokens, remaining - prompt_tokens)
+        if any(remaining < budget * self.LOW_RATIO for remaining, budget in limits):
+            plan['max_tokens'] = min(plan['max_tokens'], self.LOW_MAX_TOKENS)
+            cheaper = self.economy_model(model_name, available)
+            if cheaper:
+                plan['model'] = cheaper
+                plan['action'] = 'downgraded'
+        if plan['action'] == 'ok' and plan['max_tokens'] < max_tokens:
+            plan['action'] = 'capped'
+        return plan
+    
+    def count(self, response, prompt_text, completion_text):
+        """(prompt, complétion, estimé) : usage_metadata de la réponse, sinon estimation"""
+        metadata = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(metadata, 'prompt_token_count', None)
+        completion_tokens = getattr(metadata, 'candidates_token_count', None)
+        if prompt_tokens is None or completion_tokens is None:
+            return self.estimate(prompt_text), self.estimate(completion_text), True
+        return int(prompt_tokens), int(completion_tokens), False
+    
+    def record(self, store, model_name, prompt_tokens, completion_tokens, estimated=False, action='ok'):
+        """Ajoute un appel aux compteurs de la conversation (sauf `store` None) et du jour"""
+        cost = self.cost(model_name, prompt_tokens, completion_tokens)
+        short = self._short(model_name)
+        
+        if store is not None:
+            conversation = store['conversation']
+            usage = conversation.setdefault('usage', {'prompt_tokens': 0, 'completion_tokens': 0,
+                                                      'requests': 0, 'cost': 0.0, 'models': {}})
+            usage['prompt_tokens'] += prompt_tokens
+            usage['completion_tokens'] += completion_tokens
+            usage['requests'] += 1
+            usage['cost'] = round(usage['cost'] + cost, 6)
+            usage['models'][short] = usage['models'].get(short, 0) + prompt_tokens + completion_tokens
+            store.modified = True
+        
+        def update(day):
+            day = dict(day or {})
+            for key, value in (('prompt_tokens', prompt_tokens), ('completion_tokens', completion_tokens),
+                               ('requests', 1), ('estimated', int(estimated)), (action, 1)):
+                day[key] = day.get(key, 0) + value
+            day['cost'] = round(day.get('cost', 0.0) + cost, 6)
+            models = dict(day.get('models') or {})
+            entry = dict(models.get(short) or {'prompt_tokens': 0, 'completion_tokens': 0, 'requests': 0})
+            entry['prompt_tokens'] += prompt_tokens
+            entry['completion_tokens'] += completion_tokens
+            entry['requests'] += 1
+            models[short] = entry
+            day['models'] = models
+            return day
+        
+        self.state.update(f'usage:day:{self._day()}', update)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'estimated': estimated,
+            'cost': round(cost, 6)
+        }
+    
+    def record_refusal(self):
+        def update(day):
+            day = dict(day or {})
+            day['refused'] = day.get('refused', 0) + 1
+            return day
+        
+        self.state.update(f'usage:day:{self._day()}', update)
+    
+    def get_stats(self):
+        """Totaux du jour, budgets, répartition par modèle et jours précédents"""
+        now = time.time()
+        oldest = self._day(now - self.HISTORY_DAYS * 86400)
+        history = {}
+        for key in self.state.keys('usage:day:'):
+            day = key[len('usage:day:'):]
+            if day < oldest:
+                self.state.delete(key)
+            else:
+                history[day] = self.state.get(key) or {}
+        
+        today = history.pop(self._day(now), {})
+        used = today.get('prompt_tokens', 0) + today.get('completion_tokens', 0)
+        return {
+            'day': self._day(now),
+            'prompt_tokens': today.get('prompt_tokens', 0),
+            'completion_tokens': today.get('completion_tokens', 0),
+            'requests': today.get('requests', 0),
+            'estimated_requests': today.get('estimated', 0),
+            'cost_usd': round(today.get('cost', 0.0), 4),
+            'actions': {action: today.get(action, 0) for action in ('capped', 'downgraded', 'refused', 'self_test')},
+            'models': today.get('models', {}),
+            'budgets': {
+                'session': self.SESSION_BUDGET or None,
+                'daily': self.DAILY_BUDGET or None,
+                'daily_remaining': self._remaining(self.DAILY_BUDGET, used)
+            },
+            'history': {
+                day: {'tokens': entry.get('prompt_tokens', 0) + entry.get('completion_tokens', 0),
+                      'requests': entry.get('requests', 0), 'cost_usd': round(entry.get('cost', 0.0), 4)}
+                for day, entry in sorted(history.items())
+            }
+        }
+
+# ============================================
+# INSTANTANÉS DE STATUT - COLLECTEURS EN ARRIÈRE-PLAN
+# ============================================
+
+class StatusSnapshot:
+    """Instantané du statut tenu à jour par un thread de collecte.
+    
+    Les routes de statut lisent l'instantané sans jamais attendre l'API
+    Gemini ni les proxies. Les collecteurs `shared` écrivent dans l'état
+    partagé (un seul worker rafraîchit à la fois); les autres décrivent le
+    processus courant et restent en mémoire locale. Les collecteurs
+    `on_demand` ne tournent que sur demande (request_refresh).
+    """
+    
+    TICK = 5  # secondes entre deux vérifications des collecteurs
+    
+    def __init__(self, services):
+        self.services = services
+        self.collectors = {}
+        self._local = {}
+        self._forced = set()
+        self._requested = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+    
+    def register(self, name, fn, interval, shared=True, on_demand=False):
+        self.collectors[name] = {'fn': fn, 'interval': interval, 'shared': shared, 'on_demand': on_demand}
+    
+    def get(self, name):
+        if self.collectors[name]['shared']:
+            return self.services.state.get(f'status:{name}')
+        with self._lock:
+            return self._local.get(name)
+    
+    def _store(self, name, entry):
+        if self.collectors[name]['shared']:
+            self.services.state.set(f'status:{name}', entry)
+        else:
+            with self._lock:
+                self._local[name] = entry
+    
+    def _is_due(self, name, now):
+        entry = self.get(name)
+        return entry is None or now - entry['updated_at'] >= self.collectors[name]['interval']
+    
+    def collect(self, name, force=False):
+        """Exécute un collecteur (un seul worker à la fois pour les collecteurs partagés)"""
+        collector = self.collectors[name]
+        try:
+            with self.services.state.lock(f'status:{name}', timeout=0):
+                if not force and not self._is_due(name, time.time()):
+                    return
+                start = time.perf_counter()
+                previous = self.get(name)
+                try:
+                    data, error = collector['fn'](), None
+                except Exception as e:
+                    # On garde les dernières données valides, l'erreur est signalée
+                    data, error = (previous or {}).get('data'), str(e)
+                    print(f"❌ Collecteur {name}: {error}")
+                self._store(name, {
+                    'data': data,
+                    'error': error,
+                    'updated_at': time.time(),
+                    'duration_ms': round((time.perf_counter() - start) * 1000, 1)
+                })
+        except TimeoutError:
+            pass  # un autre worker collecte déjà
+    
+    def _run(self):
+        while True:
+            with self._lock:
+                forced, self._forced = self._forced, set()
+                requested, self._requested = self._requested, set()
+            now = time.time()
+            for name, collector in self.collectors.items():
+                if name in forced:
+                    self.collect(name, force=True)
+                elif (name in requested or not collector['on_demand']) and self._is_due(name, now):
+                    self.collect(name)
+            self._wake.wait(self.TICK)
+            self._wake.clear()
+    
+    def ensure_started(self):
+        """Démarre le thread de collecte dans ce processus (après un fork aussi)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='status-collector', daemon=True)
+            self._thread.start()
+    
+    def request_refresh(self, *names, force=True):
+        """Demande un rafraîchissement en arrière-plan (sans attendre); sans `force`, seulement si périmé"""
+        with self._lock:
+            (self._forced if force else self._requested).update(names or self.collectors)
+        self.ensure_started()
+        self._wake.set()
+    
+    def snapshot(self, *names):
+        """{nom: {data, error, updated_at, age, stale}} - lecture immédiate"""
+        self.ensure_started()
+        now = time.time()
+        result = {}
+        for name in names or self.collectors:
+            entry = self.get(name)
+            if entry is None and not self.collectors[name]['shared']:
+                # Collecteurs locaux : lecture en mémoire, assez rapide pour la première fois
+                self.collect(name)
+                entry = self.get(name)
+            if entry is None:
+                result[name] = {'data': None, 'error': None, 'updated_at': None, 'age': None,
+                                'stale': True, 'pending': True}
+                continue
+            age = now - entry['updated_at']
+            result[name] = dict(entry, age=round(age, 1),
+                                stale=age > 2 * self.collectors[name]['interval'] + self.TICK)
+        return result
+
+def register_status_collectors(services):
+    """Collecteurs par défaut : modèles Gemini, tests des modèles, VPN, tâches de scan, tokens, état, mémoire"""
+    status = services.status
+    
+    def gemini():
+        models = services.gemini.get_available_models()
+        return {
+            'models_available': len(models),
+            'models': [model['name'] for model in models],
+            'selected_model': services.gemini.get_best_model()
+        }
+    
+    status.register('gemini', gemini, interval=300)
+    # Appels réels à chaque modèle : seulement à la demande de /api/gemini/debug
+    status.register('model_tests', services.gemini.self_test, interval=services.gemini.SELF_TEST_TTL,
+                    on_demand=True)
+    status.register('vpn', services.vpn.get_stats, interval=30)
+    status.register('scan_jobs', services.scan_jobs.get_stats, interval=10, shared=False)
+    status.register('usage', services.gemini.usage.get_stats, interval=10, shared=False)
+    status.register('state', services.state.describe, interval=60, shared=False)
+    if services.sessions is not None:
+        status.register('sessions', services.sessions.describe, interval=60, shared=False)
+    status.register('memory', lambda: {
+        'prompt_builder': PromptBuilder.get_stats(),
+        'memory_index': ConversationIndex.get_stats(),
+        'compression': ResponseOptimizer.get_stats(),
+        'semantic_index': SemanticIndex.get_stats(),
+        'coalescing': GeminiCoalescer.get_stats(),
+        'sdk': get_sdk_status()
+    }, interval=10, shared=False)
+
+# ============================================
+# CAPTURE DU TRAFIC POUR REJEU
+# ============================================
+
+class TrafficRecorder:
+    """Middleware WSGI qui journalise les requêtes et leurs durées (JSONL compact).
+    
+    Une ligne par requête : instant, client pseudonyme, méthode, endpoint,
+    chemin, query, quelques en-têtes, corps JSON, statut, taille et durée
+    de la réponse (de l'ouverture de session à la compression comprises).
+    Les cookies ne sont jamais écrits : le client est un pseudonyme suivi
+    de cookie en cookie, l'échantillonnage garde des conversations entières.
+    Avec TRACE_REDACT='text', les textes libres sont remplacés par un
+    bourrage de même longueur. benchmarks/replay.py rejoue ces traces.
+    """
+    
+    HEADERS = ('Content-Type', 'Accept', 'Accept-Encoding', 'If-None-Match')
+    SKIP_PREFIXES = ('/static/', '/api/debug/')
+    KEEP_FIELDS = ('priority', 'role', 'format', 'refresh')  # valeurs énumérées, jamais masquées
+    REDACT_QUERY = ('q', 'query')
+    MAX_BODY = 64 * 1024
+    MAX_CLIENTS = 10000
+    
+    def __init__(self, wsgi_app, url_map, path, sample_rate=None, redact=None, cookie_name='session'):
+        self.wsgi_app = wsgi_app
+        self.url_map = url_map
+        self.path = path
+        self.sample_rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.redact = (TRACE_REDACT if redact is None else redact) == 'text'
+        self.cookie_name = cookie_name
+        self._salt = os.urandom(8)  # pseudonymes propres à cette capture
+        self._clients = OrderedDict()  # empreinte du cookie -> client
+        self._file = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.recorded = 0
+    
+    def _open(self):
+        """Fichier ouvert par processus ({pid} dans le chemin : un fichier par worker)"""
+        if self._file is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._file = open(self.path.format(pid=self._pid), 'a', encoding='utf-8', buffering=1)
+        return self._file
+    
+    def _fingerprint(self, cookie):
+        return hashlib.blake2b(cookie.encode(), key=self._salt, digest_size=8).hexdigest()
+    
+    def _client(self, cookie):
+        """Pseudonyme stable d'un navigateur, même si son cookie change à chaque réponse"""
+        if not cookie:
+            return os.urandom(6).hex()
+        with self._lock:
+            client = self._clients.get(self._fingerprint(cookie))
+        return client or self._fingerprint(cookie)[:12]
+    
+    def _follow(self, client, headers):
+        """Associe le nouveau cookie posé par la réponse au même client"""
+        prefix = f'{self.cookie_name}='
+        for name, value in headers:
+            if name.lower() == 'set-cookie' and value.startswith(prefix):
+                cookie = value[len(prefix):].split(';', 1)[0]
+                with self._lock:
+                    self._clients[self._fingerprint(cookie)] = client
+                    while len(self._clients) > self.MAX_CLIENTS:
+                        self._clients.popitem(last=False)
+    
+    def _sampled(self, client):
+        return self.sample_rate >= 1 or int(client[:8], 16) / 0xffffffff < self.sample_rate
     
     @staticmethod
-    def get_user_info(key=None):
-        """Récupère les informations utilisateur"""
-        if MemoryService24h.is_expired():
+    def _filler(text):
+        return re.sub(r'\S', 'x', text)
+    
+    def _sanitize(self, value, field=None):
+        if isinstance(value, dict):
+            return {key: self._sanitize(item, key) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._sanitize(item, field) for item in value]
+        if isinstance(value, str) and self.redact and field not in self.KEEP_FIELDS:
+            return self._filler(value)
+        return value
+    
+    def _endpoint(self, method, path):
+        try:
+            return self.url_map.bind('localhost').match(path, method)[0]
+        except Exception:
             return None
-        
-        user_info = session.get('conversation', {}).get('user_info', {})
-        if key:
-            info = user_info.get(key, {})
-            return info.get('value') if info else None
-        return {k: v['value'] for k, v in user_info.items()}
     
-    @staticmethod
-    def add_topic(topic):
-        """Ajoute un sujet de discussion"""
-        if MemoryService24h.is_expired():
-            MemoryService24h.init_conversation()
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(self.SKIP_PREFIXES):
+            return self.wsgi_app(environ, start_response)
+        
+        start = time.perf_counter()
+        client = self._client(parse_cookie(environ).get(self.cookie_name))
+        if not self._sampled(client):
+            # Cookie suivi quand même : la suite de la conversation reste hors échantillon
+            def follow(status, headers, exc_info=None):
+                self._follow(client, headers)
+                return start_response(status, headers, exc_info)
+            return self.wsgi_app(environ, follow)
         
-        if 'topics' not in session['conversation']:
-            session['conversation']['topics'] = []
+        body = None
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        if 0 < length <= self.MAX_BODY and 'json' in environ.get('CONTENT_TYPE', ''):
+            raw = environ['wsgi.input'].read(length)
+            environ['wsgi.input'] = io.BytesIO(raw)
+            try:
+                body = self._sanitize(json.loads(raw))
+            except ValueError:
+                body = None
         
-        if topic not in session['conversation']['topics']:
-            session['conversation']['topics'].append(topic)
-            if len(session['conversation']['topics']) > 10:
-                session['conversation']['topics'] = session['conversation']['topics'][-10:]
+        query = parse_qsl(environ.get('QUERY_STRING', ''), keep_blank_values=True)
+        record = {
+            't': round(time.time(), 3),
+            'c': client,
+            'm': environ.get('REQUEST_METHOD', 'GET'),
+            'e': self._endpoint(environ.get('REQUEST_METHOD', 'GET'), path),
+            'p': path,
+            'q': urlencode([(key, self._filler(value) if self.redact and key in self.REDACT_QUERY else value)
+                            for key, value in query]),
+            'h': {name: environ[key] for name, key in
+                  ((name, 'HTTP_' + name.upper().replace('-', '_')) for name in self.HEADERS)
+                  if key in environ},
+            'b': body
+        }
+        if 'CONTENT_TYPE' in environ:
+            record['h']['Content-Type'] = environ['CONTENT_TYPE']
+        
+        def capture(status, headers, exc_info=None):
+            record['s'] = int(status.split(' ', 1)[0])
+            self._follow(client, headers)
+            return start_response(status, headers, exc_info)
         
-        session.modified = True
+        return self._measure(self.wsgi_app(environ, capture), record, start)
     
-    @staticmethod
-    def clear():
-        """Efface la conversation"""
-        session.pop('conversation', None)
-        session.modified = True
+    def _measure(self, result, record, start):
+        """Transmet le corps de la réponse, puis écrit la ligne (durée jusqu'au dernier octet)"""
+        size = 0
+        try:
+            for chunk in result:
+                size += len(chunk)
+                yield chunk
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+            record['n'] = size
+            record['d'] = round((time.perf_counter() - start) * 1000, 2)
+            line = json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n'
+            try:
+                with self._lock:
+                    self._open().write(line)
+                    self.recorded += 1
+            except OSError as e:
+                print(f"❌ Capture du trafic: {str(e)}")
 
 # ============================================
-# SERVICE GEMINI - DÉTECTION AUTOMATIQUE
+# SERVICES DE L'APPLICATION (FABRIQUE)
 # ============================================
 
-class GeminiService:
-    """Service Gemini avec détection automatique des modèles"""
+class AppServices:
+    """Instances des services d'une application, créées par create_app()"""
     
-    _available_models = None
-    _selected_model = None
-    _last_check = 0
-    CACHE_DURATION = 3600  # 1 heure
+    def __init__(self, state, sessions=None):
+        self.state = state
+        self.sessions = sessions  # ShardedStore si les sessions sont côté serveur
+        self.vpn = VPNService(state)
+        self.scan_jobs = ScanJobQueue(self.vpn, state)
+        self.gemini = GeminiService(state)
+        self.status = StatusSnapshot(self)
+        register_status_collectors(self)
+
+def get_services():
+    """Services de l'application courante"""
+    return current_app.extensions['benbot']
+
+# Raccourcis utilisés par les routes (résolus à chaque requête)
+vpn_service = LocalProxy(lambda: get_services().vpn)
+scan_jobs = LocalProxy(lambda: get_services().scan_jobs)
+gemini_service = LocalProxy(lambda: get_services().gemini)
+
+def create_app(config=None, state=None, sessions=None):
+    """Crée l'application Flask et câble ses services.
+    
+    `state` permet d'injecter un backend d'état (InProcessState, SQLiteState,
+    SharedMemoryState); par défaut il est construit depuis STATE_BACKEND.
+    `sessions` (ShardedStore) garde les sessions côté serveur; par défaut
+    selon SESSION_STORE.
+    """
+    flask_app = Flask(__name__)
+    flask_app.config.update(APP_CONFIG)
+    if config:
+        flask_app.config.update(config)
+    flask_app.secret_key = flask_app.config['SECRET_KEY']
+    
+    if sessions is None and SESSION_STORE == 'sharded':
+        sessions = create_session_store()
+    if sessions is not None:
+        flask_app.session_interface = ShardedSessionInterface(sessions)
+    else:
+        flask_app.session_interface = ProfiledSessionInterface()
+    
+    flask_app.extensions['benbot'] = AppServices(state or create_state_backend(), sessions)
+    flask_app.register_blueprint(bp)
+    
+    if TRACE_CAPTURE_PATH:
+        flask_app.wsgi_app = TrafficRecorder(flask_app.wsgi_app, flask_app.url_map, TRACE_CAPTURE_PATH,
+                                             cookie_name=flask_app.config['SESSION_COOKIE_NAME'])
+    return flask_app
+
+# ============================================
+# OPTIMISATION DES RÉPONSES - COMPRESSION ET CACHE HTTP
+# ============================================
+
+class ResponseOptimizer:
+    """Cache-Control, ETag (304) et compression gzip/brotli des réponses.
+    
+    Les politiques de cache sont déclarées par endpoint. Les JSON ont un ETag
+    faible calculé hors du champ `timestamp` (qui change à chaque appel) :
+    un contenu identique donne un 304 sans corps. Les fichiers statiques
+    sont versionnés par empreinte (?v=) et mis en cache un an.
+    """
+    
+    POLICIES = {
+        'static': 'public, max-age=31536000, immutable',  # URL versionnée (?v=empreinte)
+        'benbot.index': 'private, no-cache',
+        'benbot.list_gemini_models': 'private, max-age=300',
+        'benbot.vpn_stats': 'private, max-age=10',
+        'benbot.vpn_sources': 'private, max-age=60',
+        'benbot.vpn_history': 'private, max-age=60',
+        'benbot.get_proxies': 'private, max-age=15',
+        'benbot.memory_status': 'private, no-cache',
+        'benbot.gemini_usage': 'private, no-cache',
+        'benbot.memory_messages': 'private, no-cache',
+        'benbot.system_status': 'private, max-age=5'
+    }
+    UNVERSIONED_STATIC = 'public, no-cache'
+    COMPRESSIBLE = ('application/json', 'application/javascript', 'text/', 'image/svg+xml')
+    MAX_SIZE = 2 * 1024 * 1024  # au-delà : envoyé tel quel
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 5
+    CACHE_ENTRIES = 64  # corps compressés gardés (réponses avec ETag)
+    
+    _compressed = OrderedDict()  # (etag, encodage) -> octets
+    _versions = {}  # chemin -> (mtime, empreinte)
+    _stats = Counter()
+    _lock = threading.Lock()
     
     @classmethod
-    def get_available_models(cls, force_refresh=False):
-        """Liste les modèles Gemini disponibles"""
-        
-        current_time = time.time()
-        if (not force_refresh and 
-            cls._available_models is not None and 
-            current_time - cls._last_check < cls.CACHE_DURATION):
-            return cls._available_models
-        
-        if not GEMINI_API_KEY:
-            return []
-        
+    def static_version(cls, path):
+        """Empreinte courte du contenu d'un fichier statique (recalculée s'il change)"""
         try:
-            genai.configure(api_key=GEMINI_API_KEY)
-            models = []
-            
-            for model in genai.list_models():
-                if 'generateContent' in model.supported_generation_methods:
-                    models.append({
-                        'name': model.name,
-                        'display_name': model.display_name,
-                        'methods': list(model.supported_generation_methods)
-                    })
-                    print(f"📋 Modèle trouvé: {model.name}")
-            
-            cls._available_models = models
-            cls._last_check = current_time
-            return models
-            
-        except Exception as e:
-            print(f"❌ Erreur chargement modèles: {str(e)}")
-            return []
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        cached = cls._versions.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'rb') as f:
+            version = hashlib.md5(f.read()).hexdigest()[:10]
+        cls._versions[path] = (mtime, version)
+        return version
+    
+    @staticmethod
+    def choose_encoding(req):
+        """'br', 'gzip' ou None selon Accept-Encoding (q=0 respecté)"""
+        accepted = req.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
     
     @classmethod
-    def get_best_model(cls):
-        """Sélectionne le meilleur modèle disponible"""
+    def compress(cls, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=cls.BROTLI_QUALITY)
+        return gzip.compress(data, compresslevel=cls.GZIP_LEVEL, mtime=0)
+    
+    @classmethod
+    def _json_etag(cls, response):
+        """ETag faible du JSON hors `timestamp`"""
+        data = response.get_data()
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            return hashlib.md5(data).hexdigest()
+        if isinstance(payload, dict):
+            payload.pop('timestamp', None)
+            data = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+        return hashlib.md5(data).hexdigest()
+    
+    @classmethod
+    def _compressible(cls, response):
+        mimetype = response.mimetype or ''
+        return (response.status_code == 200
+                and not response.is_streamed
+                and 'Content-Encoding' not in response.headers
+                and mimetype.startswith(cls.COMPRESSIBLE)
+                and COMPRESS_MIN_SIZE <= (response.content_length or 0) <= cls.MAX_SIZE)
+    
+    @classmethod
+    def process(cls, req, response):
+        """Applique politique de cache, ETag/304 et compression (after_request)"""
+        if req.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return cls._encode(req, response)
         
-        models = cls.get_available_models()
+        endpoint = req.endpoint
+        policy = cls.POLICIES.get(endpoint)
+        if endpoint == 'static' and 'v' not in req.args:
+            policy = cls.UNVERSIONED_STATIC
+        if policy is None or 'refresh' in req.args:
+            return cls._encode(req, response)
         
-        if not models:
-            return None
+        response.headers['Cache-Control'] = policy
+        if response.direct_passthrough:
+            if (response.content_length or 0) > cls.MAX_SIZE:
+                return response
+            response.direct_passthrough = False  # fichier statique : lu pour l'ETag et la compression
+            response.make_sequence()
         
-        # Liste des modèles préférés par ordre de priorité
-        preferred_names = [
-            'models/gemini-1.5-pro',
-            'models/gemini-1.5-flash',
-            'models/gemini-1.0-pro',
-            'models/gemini-pro',
-            'gemini-1.5-pro',
-            'gemini-1.5-flash',
-            'gemini-1.0-pro',
-            'gemini-pro'
-        ]
+        etag, weak = response.get_etag()
+        if etag is None and response.is_json:
+            etag, weak = cls._json_etag(response), True
+        elif etag is None:
+            etag = hashlib.md5(response.get_data()).hexdigest()
         
-        for preferred in preferred_names:
-            for model in models:
-                if model['name'] == preferred:
-                    print(f"✅ Modèle sélectionné: {preferred}")
-                    return preferred
+        # Chaque encodage est une représentation distincte : ETag suffixé
+        encoding = cls.choose_encoding(req) if cls._compressible(response) else None
+        response.set_etag(f"{etag}-{encoding}" if encoding else etag, weak=weak)
+        response.vary.add('Accept-Encoding')
+        size = response.content_length or 0
+        response.make_conditional(req)
+        if response.status_code == 304:
+            cls._count('not_modified', size)
+            return response
+        return cls._encode(req, response, encoding, cache_key=response.get_etag()[0])
+    
+    @classmethod
+    def _encode(cls, req, response, encoding=None, cache_key=None):
+        """Compresse le corps; avec `cache_key` (ETag), le résultat est réutilisé"""
+        if cache_key is None:
+            if not cls._compressible(response):
+                return response
+            encoding = cls.choose_encoding(req)
+            response.vary.add('Accept-Encoding')
+        if encoding is None:
+            return response
         
-        if models:
-            print(f"⚠️ Modèle par défaut: {models[0]['name']}")
-            return models[0]['name']
+        data = response.get_data()
+        with cls._lock:
+            body = cls._compressed.get((cache_key, encoding)) if cache_key else None
+            if body is not None:
+                cls._compressed.move_to_end((cache_key, encoding))
+        if body is None:
+            body = cls.compress(data, encoding)
+            if cache_key:
+                with cls._lock:
+                    cls._compressed[(cache_key, encoding)] = body
+                    while len(cls._compressed) > cls.CACHE_ENTRIES:
+                        cls._compressed.popitem(last=False)
         
-        return None
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        cls._count(encoding, len(data) - len(body))
+        return response
+    
+    @classmethod
+    def _count(cls, kind, saved):
+        with cls._lock:
+            cls._stats[kind] += 1
+            cls._stats['bytes_saved'] += saved
+    
+    @classmethod
+    def get_stats(cls):
+        with cls._lock:
+            return dict(cls._stats, brotli=brotli is not None, cached_bodies=len(cls._compressed))
+
+@bp.app_url_defaults
+def version_static_urls(endpoint, values):
+    """url_for('static', ...) -> ?v=<empreinte> : cache long sans risque de version périmée"""
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        version = ResponseOptimizer.static_version(os.path.join(current_app.static_folder, values['filename']))
+        if version:
+            values['v'] = version
+
+@bp.after_app_request
+def optimize_response(response):
+    """Cache HTTP et compression de toutes les réponses de l'application"""
+    with Profiler.span('response.optimize'):
+        return ResponseOptimizer.process(request, response)
 
 # ============================================
 # ROUTES PRINCIPALES
 # ============================================
 
-@app.route('/')
+@bp.route('/')
 def index():
     """Page d'accueil"""
     return render_template(
@@ -756,7 +4617,7 @@ def index():
         adsense_client_id=ADSENSE_CLIENT_ID
     )
 
-@app.route('/health')
+@bp.route('/health')
 def health():
     """Health check"""
     return jsonify({
@@ -769,164 +4630,291 @@ def health():
 # ROUTE CHAT AVEC MÉMOIRE 24H
 # ============================================
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
-    """API Gemini avec mémoire 24h et détection automatique"""
-    
-    data = request.json
-    if not data:
-        return jsonify({'error': 'Données JSON invalides'}), 400
-    
-    user_message = data.get('message', '').strip()
-    if not user_message:
-        return jsonify({'error': 'Message vide'}), 400
+def process_chat_message(user_message, gemini, max_tokens=500, temperature=0.7, store=None):
+    """Traite un message (mémoire 24h, prompt, Gemini) sur la session ou sur `store`.
     
-    # 🔥 INITIALISER LA MÉMOIRE 24H
-    MemoryService24h.init_conversation()
+    Retourne (payload, erreur) : la réponse de repli reste un succès pour
+    l'utilisateur, l'erreur est remontée à part pour l'API batch.
+    """
+    store = session if store is None else store
     
-    if MemoryService24h.is_expired():
-        MemoryService24h.init_conversation()
-    
-    # 🔥 AJOUTER LE MESSAGE UTILISATEUR
-    MemoryService24h.add_message('user', user_message)
-    
-    # 🔥 DÉTECTION DU PRÉNOM
-    if "je m'appelle" in user_message.lower() or "mon nom est" in user_message.lower() or "moi c'est" in user_message.lower():
-        words = user_message.lower().split()
-        for i, word in enumerate(words):
-            if word in ["m'appelle", "nom", "c'est"] and i + 1 < len(words):
-                name = words[i + 1].capitalize()
-                MemoryService24h.remember_info('prenom', name)
-                break
-    
-    # 🔥 DÉTECTION DES SUJETS
-    topics_keywords = {
-        'travail': ['travail', 'emploi', 'job', 'carrière', 'métier', 'profession'],
-        'etude': ['étude', 'école', 'cours', 'apprendre', 'formation', 'université'],
-        'technologie': ['ordinateur', 'programmation', 'code', 'python', 'logiciel', 'site web'],
-        'sante': ['santé', 'médecin', 'malade', 'douleur', 'bien-être'],
-        'voyage': ['voyage', 'vacances', 'pays', 'visiter', 'avion', 'hôtel']
-    }
-    
-    for topic, keywords in topics_keywords.items():
-        if any(keyword in user_message.lower() for keyword in keywords):
-            MemoryService24h.add_topic(topic)
-    
-    # Paramètres optionnels
-    max_tokens = min(int(data.get('max_tokens', 500)), 1000)
-    temperature = float(data.get('temperature', 0.7))
-    
-    try:
-        # 🔥 CONSTRUIRE LE CONTEXTE AVEC MÉMOIRE
-        context_messages = MemoryService24h.get_context(8)
-        user_info = MemoryService24h.get_user_info()
-        topics = session.get('conversation', {}).get('topics', [])
-        summary = MemoryService24h.get_conversation_summary()
-        
-        # Construire le prompt avec mémoire
-        memory_context = ""
+    with Profiler.span('memory.update'):
+        # 🔥 INITIALISER LA MÉMOIRE 24H
+        MemoryService24h.init_conversation(store)
         
-        if user_info and 'prenom' in user_info:
-            memory_context += f"L'utilisateur s'appelle {user_info['prenom']}. "
+        if MemoryService24h.is_expired(store):
+            MemoryService24h.init_conversation(store)
         
-        if topics:
-            memory_context += f"Sujets discutés récemment: {', '.join(topics[-3:])}. "
+        # 🔥 AJOUTER LE MESSAGE UTILISATEUR
+        MemoryService24h.add_message('user', user_message, store)
         
-        if summary and summary['time_remaining'] > 0:
-            hours_left = summary['time_remaining'] // 3600
-            if hours_left > 0:
-                memory_context += f"Conversation active depuis {summary['duration']}. "
+        # 🔥 DÉTECTION DU PRÉNOM
+        if "je m'appelle" in user_message.lower() or "mon nom est" in user_message.lower() or "moi c'est" in user_message.lower():
+            words = user_message.lower().split()
+            for i, word in enumerate(words):
+                if word in ["m'appelle", "nom", "c'est"] and i + 1 < len(words):
+                    name = words[i + 1].capitalize()
+                    MemoryService24h.remember_info('prenom', name, store)
+                    break
         
-        conversation_history = ""
-        for msg in context_messages:
-            role = "Utilisateur" if msg['role'] == 'user' else "BenBot"
-            conversation_history += f"{role}: {msg['content']}\n"
+        # 🔥 DÉTECTION DES SUJETS
+        topics_keywords = {
+            'travail': ['travail', 'emploi', 'job', 'carrière', 'métier', 'profession'],
+            'etude': ['étude', 'école', 'cours', 'apprendre', 'formation', 'université'],
+            'technologie': ['ordinateur', 'programmation', 'code', 'python', 'logiciel', 'site web'],
+            'sante': ['santé', 'médecin', 'malade', 'douleur', 'bien-être'],
+            'voyage': ['voyage', 'vacances', 'pays', 'visiter', 'avion', 'hôtel']
+        }
         
-        # Prompt final
-        prompt = f"""Tu es BenBot, un assistant IA amical et serviable.
-Réponds en français de manière naturelle, chaleureuse et utile.
-
-{memory_context}
-Historique de la conversation:
-{conversation_history}
-BenBot:"""
+        for topic, keywords in topics_keywords.items():
+            if any(keyword in user_message.lower() for keyword in keywords):
+                MemoryService24h.add_topic(topic, store)
+    
+    try:
+        # 🔥 CONSTRUIRE LE CONTEXTE AVEC MÉMOIRE
+        conversation = store.get('conversation', {})
+        user_info = MemoryService24h.get_user_info(store=store)
+        topics = conversation.get('topics', [])
+        summary = MemoryService24h.get_conversation_summary(store)
         
         # Générer la réponse avec Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
-        model_name = GeminiService.get_best_model()
+        with Profiler.span('gemini.select_model'):
+            model_name = gemini.get_best_model()
         
         if not model_name:
-            return jsonify({
+            return {
                 'success': True,
                 'response': f"BenBot: {user_message}",
                 'model': 'memory-only'
-            }), 200
+            }, None
         
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "temperature": temperature,
-                "max_output_tokens": max_tokens,
-                "top_p": 0.9,
-                "top_k": 40
-            }
-        )
+        # Prompt final (préfixe statique + tours anciens pertinents + historique pré-rendu)
+        with Profiler.span('memory.recall'):
+            recalled = recall_past_turns(conversation, user_message)
+        with Profiler.span('prompt.build'):
+            system_instruction, prompt = PromptBuilder.build(conversation, user_info, topics, summary,
+                                                             recalled=recalled)
         
-        if response and response.text:
-            ai_response = response.text
-            
+        # 🔥 BUDGETS DE TOKENS : RÉPONSE PLUS COURTE OU MODÈLE MOINS CHER SI NÉCESSAIRE
+        prompt_text = (system_instruction or '') + prompt
+        with Profiler.span('usage.plan'):
+            plan = gemini.usage.plan(
+                conversation, model_name, gemini.usage.estimate(prompt_text), max_tokens,
+                [model['name'] for model in gemini.get_available_models()]
+            )
+        if plan['action'] == 'refused':
+            gemini.usage.record_refusal()
+            return {
+                'success': False,
+                'error': 'Budget de tokens épuisé',
+                'response': "BenBot: J'ai atteint ma limite de réponses pour le moment, réessaie plus tard !",
+                'model': 'budget-exceeded',
+                'usage': {'action': 'refused', 'session_remaining': plan['session_remaining'],
+                          'daily_remaining': plan['daily_remaining']}
+            }, 'Budget de tokens épuisé'
+        model_name = plan['model']
+        
+        # 🔥 LES REQUÊTES IDENTIQUES EN COURS PARTAGENT UN SEUL APPEL
+        with Profiler.span('gemini.generate'):
+            response = GeminiCoalescer.generate(
+                model_name,
+                prompt,
+                {
+                    "temperature": temperature,
+                    "max_output_tokens": plan['max_tokens'],
+                    "top_p": 0.9,
+                    "top_k": 40
+                },
+                system_instruction=system_instruction
+            )
+        
+        ai_response = response.text if response else ''
+        usage = gemini.usage.record(store, model_name, *gemini.usage.count(response, prompt_text, ai_response),
+                                    action=plan['action'])
+        usage.update(action=plan['action'], max_tokens=plan['max_tokens'],
+                     session_remaining=gemini.usage.session_usage(store['conversation'])['remaining'])
+        
+        if ai_response:
             # 🔥 AJOUTER LA RÉPONSE À LA MÉMOIRE
-            MemoryService24h.add_message('assistant', ai_response)
+            MemoryService24h.add_message('assistant', ai_response, store)
             
-            return jsonify({
+            return {
                 'success': True,
                 'response': ai_response,
                 'model': model_name,
+                'usage': usage,
                 'memory': {
                     'active': True,
                     'expires_in': '24h',
                     'time_remaining': summary['time_remaining'] if summary else 86400,
-                    'message_count': session.get('conversation', {}).get('message_count', 0),
+                    'message_count': store.get('conversation', {}).get('message_count', 0),
                     'user_name': user_info.get('prenom') if user_info else None
                 },
                 'timestamp': time.time()
-            })
+            }, None
         else:
-            MemoryService24h.add_message('assistant', f"BenBot: J'ai bien reçu ton message !")
-            return jsonify({
+            MemoryService24h.add_message('assistant', f"BenBot: J'ai bien reçu ton message !", store)
+            return {
                 'success': True,
                 'response': f"BenBot: J'ai bien reçu ton message !",
-                'model': 'simple-response'
-            }), 200
+                'model': 'simple-response',
+                'usage': usage
+            }, 'Réponse vide'
             
     except Exception as e:
         print(f"❌ Erreur Gemini: {str(e)}")
         
-        MemoryService24h.add_message('assistant', f"BenBot: {user_message}")
+        MemoryService24h.add_message('assistant', f"BenBot: {user_message}", store)
         
-        return jsonify({
+        return {
             'success': True,
             'response': f"BenBot: {user_message}",
             'model': 'fallback',
             'timestamp': time.time()
-        }), 200
+        }, str(e)
+
+def generation_params(data, defaults=None):
+    """(max_tokens, temperature) bornés : 1-1000 tokens, température 0-2; ValueError si invalides"""
+    defaults = defaults or {'max_tokens': 500, 'temperature': 0.7}
+    max_tokens = int(data.get('max_tokens', defaults['max_tokens']))
+    temperature = float(data.get('temperature', defaults['temperature']))
+    if temperature != temperature:  # NaN
+        raise ValueError('Température invalide')
+    return max(1, min(max_tokens, 1000)), max(0.0, min(temperature, 2.0))
+
+@bp.route('/api/chat', methods=['POST'])
+def chat():
+    """API Gemini avec mémoire 24h et détection automatique"""
+    
+    data = request.json
+    if not data:
+        return jsonify({'error': 'Données JSON invalides'}), 400
+    
+    user_message = data.get('message', '').strip()
+    if not user_message:
+        return jsonify({'error': 'Message vide'}), 400
+    
+    # Paramètres optionnels
+    try:
+        max_tokens, temperature = generation_params(data)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Paramètres invalides'}), 400
+    
+    payload, _ = process_chat_message(user_message, gemini_service, max_tokens, temperature)
+    status = 429 if payload['model'] == 'budget-exceeded' else 200
+    
+    # Repères de synchronisation pour le cache client (IndexedDB)
+    conversation = session.get('conversation', {})
+    messages = conversation.get('messages', [])
+    payload['sync'] = {
+        'conversation_id': conversation.get('id'),
+        'messages': [{'id': message['id'], 'role': message['role'], 'timestamp': message['timestamp']}
+                     for message in messages[-2:]],
+        'last_id': messages[-1]['id'] if messages else -1
+    }
+    return jsonify(payload), status
+
+# ============================================
+# API BATCH - PLUSIEURS MESSAGES PAR REQUÊTE
+# ============================================
+
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '50'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '8'))
+
+def run_batch_item(index, item, gemini, defaults):
+    """Traite un élément du batch dans une conversation détachée"""
+    start = time.perf_counter()
+    if isinstance(item, str):
+        item = {'message': item}
+    result = {'index': index, 'id': item.get('id') if isinstance(item, dict) else None}
+    store = DetachedSession()
+    
+    try:
+        if not isinstance(item, dict):
+            raise ValueError('Élément invalide (texte ou objet attendu)')
+        user_message = str(item.get('message', '')).strip()
+        if not user_message:
+            raise ValueError('Message vide')
+        max_tokens, temperature = generation_params(item, defaults)
+        
+        # Conversation fournie : historique et infos connues rejoués dans la mémoire détachée
+        conversation = MemoryService24h.init_conversation(store)
+        conversation['id'] = f"batch-{new_conversation_id()}"
+        for message in item.get('history') or []:
+            MemoryService24h.add_message(
+                'assistant' if message.get('role') == 'assistant' else 'user',
+                str(message.get('content', '')),
+                store
+            )
+        for key, value in (item.get('user_info') or {}).items():
+            MemoryService24h.remember_info(key, value, store)
+        
+        payload, error = process_chat_message(user_message, gemini, max_tokens, temperature, store)
+        result.update({
+            'success': error is None,
+            'response': payload['response'],
+            'model': payload['model'],
+            'error': error
+        })
+    except Exception as e:
+        result.update({'success': False, 'response': None, 'model': None, 'error': str(e)})
+    finally:
+        # Conversation jetable : rien ne doit rester dans les index du processus
+        MemoryService24h.clear(store=store)
+    
+    result['duration_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+@bp.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """Plusieurs messages indépendants traités en parallèle (résultats dans l'ordre)"""
+    data = request.json
+    if not data or not isinstance(data.get('items'), list):
+        return jsonify({'error': "Champ 'items' (liste) requis"}), 400
+    
+    items = data['items']
+    if not items:
+        return jsonify({'error': 'Batch vide'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'Maximum {BATCH_MAX_ITEMS} éléments par batch'}), 413
+    
+    try:
+        max_tokens, temperature = generation_params(data)
+        defaults = {'max_tokens': max_tokens, 'temperature': temperature}
+        concurrency = max(1, min(int(data.get('concurrency', BATCH_CONCURRENCY)), BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Paramètres invalides'}), 400
+    
+    # Les threads du pool n'ont pas de contexte Flask : on leur passe le service
+    gemini = get_services().gemini
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items)), thread_name_prefix='chat-batch') as pool:
+        results = list(pool.map(lambda pair: run_batch_item(pair[0], pair[1], gemini, defaults), enumerate(items)))
+    
+    return jsonify({
+        'success': True,
+        'results': results,
+        'count': len(results),
+        'failed': sum(1 for result in results if not result['success']),
+        'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+        'timestamp': time.time()
+    })
 
 # ============================================
 # ROUTES VPN - VERSION COMPLÈTE AVEC TEST AUTOMATIQUE
 # ============================================
 
-@app.route('/api/vpn/test', methods=['GET'])
-@app.route('/api/vpn-test', methods=['GET'])
+@bp.route('/api/vpn/test', methods=['GET'])
+@bp.route('/api/vpn-test', methods=['GET'])
 def vpn_test():
     """Test VPN avec recherche automatique de proxies fonctionnels"""
     try:
         # Lancer une recherche de proxies fonctionnels
-        working_proxies = VPNService.find_working_proxies(limit=5, max_tests=30)
+        working_proxies = vpn_service.find_working_proxies(limit=5, max_tests=30)
         
-        vpn_info = VPNService.get_ip_info(use_vpn=True)
-        direct_info = VPNService.get_ip_info(use_vpn=False)
-        stats = VPNService.get_stats()
+        vpn_info = vpn_service.get_ip_info(use_vpn=True)
+        direct_info = vpn_service.get_ip_info(use_vpn=False)
+        stats = vpn_service.get_stats()
         
         return jsonify({
             'success': True,
@@ -942,7 +4930,7 @@ def vpn_test():
                 'method': direct_info.get('method', 'N/A')
             },
             'proxies': {
-                'total': len(VPNService._proxies_cache) if VPNService._proxies_cache else 0,
+                'total': len(vpn_service.get_proxies_cache()),
                 'working': len(working_proxies),
                 'tested': stats['total_tested'],
                 'success_rate': stats['success_rate']
@@ -961,29 +4949,30 @@ def vpn_test():
             'timestamp': time.time()
         }), 500
 
-@app.route('/api/vpn/proxies', methods=['GET'])
-@app.route('/api/get-proxies', methods=['GET'])
+@bp.route('/api/vpn/proxies', methods=['GET'])
+@bp.route('/api/get-proxies', methods=['GET'])
 def get_proxies():
     """Liste des proxies fonctionnels après test automatique"""
     try:
         force_refresh = request.args.get('refresh', 'false').lower() == 'true'
         
         if force_refresh:
-            working = VPNService.find_working_proxies(limit=20, max_tests=50)
+            working = vpn_service.find_working_proxies(limit=20, max_tests=50)
         else:
             # Utiliser le cache
-            if VPNService._working_cache:
-                working = [{'proxy': p, 'latency': 0, 'country': 'Inconnu'} for p in VPNService._working_cache[:20]]
+            working_cache = vpn_service.get_working_cache()
+            if working_cache:
+                working = [{'proxy': p, 'latency': 0, 'country': 'Inconnu'} for p in working_cache[:20]]
             else:
-                working = VPNService.find_working_proxies(limit=20, max_tests=50)
+                working = vpn_service.find_working_proxies(limit=20, max_tests=50)
         
         return jsonify({
             'success': True,
             'total': len(working),
             'proxies': [w['proxy'] for w in working[:20]],
             'working': working[:10],
-            'stats': VPNService.get_stats(),
-            'cached': not force_refresh and VPNService._working_cache is not None,
+            'stats': vpn_service.get_stats(),
+            'cached': not force_refresh and bool(vpn_service.get_working_cache()),
             'timestamp': time.time()
         })
         
@@ -994,41 +4983,114 @@ def get_proxies():
             'error': str(e)
         }), 500
 
-@app.route('/api/vpn/stats', methods=['GET'])
+@bp.route('/api/vpn/stats', methods=['GET'])
 def vpn_stats():
     """Statistiques du service VPN"""
     return jsonify({
         'success': True,
-        'stats': VPNService.get_stats(),
+        'stats': vpn_service.get_stats(),
         'timestamp': time.time()
     })
 
-@app.route('/api/vpn/scan', methods=['POST'])
-def vpn_scan():
-    """Lance un scan complet de proxies"""
-    try:
-        data = request.json or {}
-        limit = int(data.get('limit', 50))
-        max_tests = int(data.get('max_tests', 100))
-        
-        working = VPNService.find_working_proxies(limit=limit, max_tests=max_tests)
-        
+@bp.route('/api/vpn/sources', methods=['GET'])
+def vpn_sources():
+    """Rendement, recouvrement et prochain rechargement de chaque source"""
+    return jsonify({
+        'success': True,
+        **vpn_service.get_source_stats(),
+        'timestamp': time.time()
+    })
+
+@bp.route('/api/vpn/queue', methods=['GET'])
+def vpn_queue():
+    """Ordre de test des candidats (score de probabilité de fonctionner)"""
+    limit = max(1, min(request.args.get('limit', 20, type=int), 500))
+    return jsonify({
+        'success': True,
+        'ordering': vpn_service.ORDERING,
+        'queue': vpn_service.get_queue(limit),
+        'last_scan': vpn_service.state.get('vpn:last_scan'),
+        'timestamp': time.time()
+    })
+
+@bp.route('/api/vpn/history', methods=['GET'])
+def vpn_history():
+    """Historique des scans (raw, 5m, 1h, 1d) ou d'un proxy (?proxy=ip:port)"""
+    since = request.args.get('since', type=float)
+    until = request.args.get('until', type=float)
+    proxy = request.args.get('proxy')
+    if proxy:
+        return jsonify({'success': True, **vpn_service.history.query_proxy(proxy, since), 'timestamp': time.time()})
+    
+    resolution = request.args.get('resolution', '1h')
+    if resolution != 'raw' and resolution not in HealthHistory.RESOLUTIONS:
         return jsonify({
-            'success': True,
-            'working': working[:20],
-            'count': len(working),
-            'stats': VPNService.get_stats(),
-            'timestamp': time.time()
-        })
-        
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+            'success': False,
+            'error': f"resolution: raw, {', '.join(HealthHistory.RESOLUTIONS)}"
+        }), 400
+    return jsonify({
+        'success': True,
+        'resolution': resolution,
+        'series': vpn_service.history.query(resolution, since, until),
+        'last_24h': vpn_service.history.window(),
+        'timestamp': time.time()
+    })
+
+SCAN_WAIT_MAX = 25  # secondes d'attente max d'un résultat (bien sous le timeout gunicorn)
+
+def job_response(job, status_code=200, **extra):
+    """Fiche de tâche exposée par l'API (sans les champs internes)"""
+    public = {k: v for k, v in job.items() if k not in ('dedupe_key', 'pid', 'cancel_requested')}
+    public['poll'] = f"/api/vpn/jobs/{job['id']}"
+    return jsonify({'success': True, 'job': public, **extra}), status_code
+
+def submit_scan_job(data):
+    """Crée (ou réutilise) une tâche de scan; attend au plus `wait` secondes si demandé"""
+    try:
+        wait = float(data.get('wait', 0) or 0)
+    except (TypeError, ValueError):
+        wait = None
+    if wait is None or not 0 <= wait < float('inf'):
+        return jsonify({'success': False, 'error': f"wait: nombre de secondes entre 0 et {SCAN_WAIT_MAX}"}), 400
+    wait = min(wait, SCAN_WAIT_MAX)
+    
+    try:
+        job, deduplicated = scan_jobs.submit(data, data.get('priority', 'normal'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except OverflowError as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
+    
+    if wait > 0:
+        job = scan_jobs.wait(job['id'], wait) or job
+    status_code = 200 if job['status'] in ScanJobQueue.FINISHED else 202
+    return job_response(job, status_code, deduplicated=deduplicated)
+
+@bp.route('/api/vpn/scan', methods=['POST'])
+def vpn_scan():
+    """Lance un scan de proxies en tâche de fond (202 + identifiant à interroger)"""
+    return submit_scan_job(request.json or {})
+
+@bp.route('/api/vpn/jobs', methods=['GET', 'POST'])
+def vpn_jobs():
+    """Liste des tâches de scan, ou création (limit, max_tests, ordering, priority, wait)"""
+    if request.method == 'POST':
+        return submit_scan_job(request.json or {})
+    return jsonify({'success': True, 'jobs': scan_jobs.list(), 'stats': scan_jobs.get_stats()})
+
+@bp.route('/api/vpn/jobs/<job_id>', methods=['GET', 'DELETE'])
+def vpn_job(job_id):
+    """Statut, progression et résultats partiels d'une tâche; DELETE l'annule"""
+    job = scan_jobs.cancel(job_id) if request.method == 'DELETE' else scan_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Tâche inconnue ou expirée'}), 404
+    return job_response(job)
 
 # ============================================
 # ROUTES DE MÉMOIRE
 # ============================================
 
-@app.route('/api/memory/status', methods=['GET'])
+@bp.route('/api/memory/status', methods=['GET'])
 def memory_status():
     """Statut de la mémoire 24h"""
     if 'conversation' not in session:
@@ -1049,10 +5111,56 @@ def memory_status():
         'summary': summary,
         'user_info': user_info,
         'topics': topics,
+        'usage': gemini_service.usage.session_usage(session.get('conversation')),
         'recent_messages': MemoryService24h.get_context(4)
     })
 
-@app.route('/api/memory/clear', methods=['POST'])
+@bp.route('/api/memory/messages', methods=['GET'])
+def memory_messages():
+    """Synchronisation incrémentale : messages postérieurs à `after` (identifiant)"""
+    after = request.args.get('after', -1, type=int)
+    client_conversation = request.args.get('conversation')
+    
+    if MemoryService24h.is_expired():
+        return jsonify({'success': True, 'conversation_id': None, 'messages': [], 'last_id': -1, 'reset': True})
+    
+    conversation = session['conversation']
+    # Conversation différente (expirée, effacée) : le client repart de zéro
+    reset = bool(client_conversation) and client_conversation != conversation['id']
+    messages, gap = MemoryService24h.get_messages_after(-1 if reset else after)
+    
+    return jsonify({
+        'success': True,
+        'conversation_id': conversation['id'],
+        'messages': [{key: message[key] for key in ('id', 'role', 'content', 'timestamp')} for message in messages],
+        'last_id': messages[-1]['id'] if messages else after,
+        'reset': reset,
+        'truncated': gap,
+        'expires_at': conversation.get('expires_at')
+    })
+
+@bp.route('/api/memory/search', methods=['GET'])
+def memory_search():
+    """Recherche plein texte dans toute la conversation (24h)"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': "Paramètre 'q' manquant"}), 400
+    if MemoryService24h.is_expired():
+        return jsonify({'success': True, 'results': [], 'count': 0})
+    
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    start = time.perf_counter()
+    results = ConversationIndex.search(session['conversation']['id'], query, limit)
+    return jsonify({
+        'success': True,
+        'query': query,
+        'keywords': ConversationIndex.keywords(query),
+        'results': results,
+        'count': len(results),
+        'duration_ms': round((time.perf_counter() - start) * 1000, 2)
+    })
+
+@bp.route('/api/memory/clear', methods=['POST'])
 def memory_clear():
     """Efface la mémoire 24h"""
     MemoryService24h.clear()
@@ -1061,7 +5169,7 @@ def memory_clear():
         'message': 'Mémoire effacée'
     })
 
-@app.route('/api/memory/remember', methods=['POST'])
+@bp.route('/api/memory/remember', methods=['POST'])
 def memory_remember():
     """Mémorise une information personnalisée"""
     data = request.json
@@ -1077,7 +5185,7 @@ def memory_remember():
     
     return jsonify({'error': 'Clé ou valeur manquante'}), 400
 
-@app.route('/api/memory/time-left', methods=['GET'])
+@bp.route('/api/memory/time-left', methods=['GET'])
 def memory_time_left():
     """Temps restant sur la mémoire 24h"""
     if 'conversation' not in session:
@@ -1106,63 +5214,66 @@ def memory_time_left():
 # ROUTES GEMINI
 # ============================================
 
-@app.route('/api/gemini/models', methods=['GET'])
+@bp.route('/api/gemini/models', methods=['GET'])
 def list_gemini_models():
     """Liste tous les modèles Gemini disponibles"""
     force_refresh = request.args.get('refresh', 'false').lower() == 'true'
-    models = GeminiService.get_available_models(force_refresh=force_refresh)
+    models = gemini_service.get_available_models(force_refresh=force_refresh)
     
     return jsonify({
         'success': True,
         'count': len(models),
         'models': models,
-        'selected': GeminiService.get_best_model(),
+        'selected': gemini_service.get_best_model(),
+        'timestamp': time.time()
+    })
+
+@bp.route('/api/gemini/usage', methods=['GET'])
+def gemini_usage():
+    """Tokens consommés : conversation courante et totaux du jour par modèle"""
+    return jsonify({
+        'success': True,
+        'session': gemini_service.usage.session_usage(session.get('conversation')),
+        'global': gemini_service.usage.get_stats(),
         'timestamp': time.time()
     })
 
-@app.route('/api/gemini/debug', methods=['GET'])
+@bp.route('/api/gemini/debug', methods=['GET'])
 def debug_gemini():
-    """Debug complet Gemini"""
+    """Debug complet Gemini (tests des modèles servis depuis l'instantané)"""
+    status = get_services().status
+    # Tests relancés si demandé (clé d'administration), sinon seulement quand
+    # le dernier a plus de SELF_TEST_TTL
+    refresh = request.args.get('refresh', '').lower() == 'true'
+    if refresh and not is_admin():
+        return jsonify({'error': "Clé d'administration requise pour relancer les tests"}), 403
+    status.request_refresh('gemini', 'model_tests', force=refresh)
+    snapshot = status.snapshot('gemini', 'model_tests')
+    tests = snapshot['model_tests']
+    
     result = {
         'api_key_configured': bool(GEMINI_API_KEY),
         'api_key_prefix': GEMINI_API_KEY[:8] + '...' if GEMINI_API_KEY else None,
         'models': [],
-        'selected_model': GeminiService.get_best_model(),
-        'error': None
+        'selected_model': (snapshot['gemini']['data'] or {}).get('selected_model'),
+        'error': None,
+        'tested_at': tests['updated_at'],
+        'age': tests['age'],
+        'pending': tests.get('pending', False),
+        'refreshing': refresh or tests['age'] is None
+                      or tests['age'] >= gemini_service.SELF_TEST_TTL,
+        'health': gemini_service.get_model_health()
     }
     
     if not GEMINI_API_KEY:
         result['error'] = 'Clé API manquante'
         return jsonify(result)
     
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        for model in genai.list_models():
-            model_info = {
-                'name': model.name,
-                'display_name': model.display_name,
-                'supports_generate': 'generateContent' in model.supported_generation_methods,
-                'methods': list(model.supported_generation_methods)
-            }
-            
-            if model_info['supports_generate']:
-                try:
-                    test_model = genai.GenerativeModel(model.name)
-                    test_response = test_model.generate_content(
-                        "Dis 'OK' en un mot",
-                        generation_config={"max_output_tokens": 10}
-                    )
-                    model_info['test'] = '✅ OK' if test_response.text else '⚠️ Vide'
-                except Exception as e:
-                    model_info['test'] = f'❌ {str(e)[:50]}'
-            
-            result['models'].append(model_info)
-        
+    if tests['data']:
+        result['models'] = tests['data']['models']
         result['count'] = len(result['models'])
-        
-    except Exception as e:
-        result['error'] = str(e)
+        result['error'] = tests['data']['error']
+    result['error'] = result['error'] or tests['error']
     
     return jsonify(result)
 
@@ -1170,11 +5281,12 @@ def debug_gemini():
 # ROUTES SYSTÈME
 # ============================================
 
-@app.route('/api/system/status', methods=['GET'])
+@bp.route('/api/system/status', methods=['GET'])
 def system_status():
-    """Statut complet du système"""
-    models = GeminiService.get_available_models()
-    vpn_stats = VPNService.get_stats()
+    """Statut complet du système (instantané, sans appel externe)"""
+    snapshot = get_services().status.snapshot()
+    gemini = snapshot['gemini']['data'] or {}
+    memory = snapshot['memory']['data'] or {}
     
     return jsonify({
         'application': {
@@ -1186,36 +5298,84 @@ def system_status():
         'apis': {
             'gemini': {
                 'configured': bool(GEMINI_API_KEY),
-                'models_available': len(models),
-                'selected_model': GeminiService.get_best_model()
+                'models_available': gemini.get('models_available', 0),
+                'selected_model': gemini.get('selected_model'),
+                'coalescing': memory.get('coalescing'),
+                'prompt_builder': memory.get('prompt_builder'),
+                'sdk': memory.get('sdk'),
+                'usage': snapshot['usage']['data']
             },
             'adsense': {
                 'configured': ADSENSE_CLIENT_ID != 'ca-pub-XXXXXXXXXXXXXXXX'
             }
         },
         'vpn': {
-            'stats': vpn_stats
+            'stats': snapshot['vpn']['data'],
+            'jobs': snapshot['scan_jobs']['data']
         },
+        'state': snapshot['state']['data'],
+        'sessions': (snapshot.get('sessions') or {}).get('data'),
         'memory': {
             'active': 'conversation' in session,
             'expiration': '24h'
         },
+        'snapshot': {
+            name: {key: entry.get(key) for key in ('updated_at', 'age', 'stale', 'error', 'duration_ms')}
+            for name, entry in snapshot.items()
+        },
+        'timestamp': time.time()
+    })
+
+@bp.route('/api/system/warmup', methods=['POST'])
+def system_warmup():
+    """Précharge le SDK Gemini et la liste des modèles (clé d'administration)"""
+    if not is_admin():
+        return jsonify({'error': "Clé d'administration requise"}), 403
+    return jsonify({
+        'success': True,
+        'warmup': warm_up(gemini_service),
         'timestamp': time.time()
     })
 
+@bp.route('/api/debug/profile', methods=['GET'])
+def debug_profile():
+    """Piles agrégées au format collapsed (flamegraph.pl, speedscope) ou statistiques JSON"""
+    if not Profiler.enabled():
+        return jsonify({'error': 'Profilage désactivé (PROFILE_KEY ou PROFILE_SAMPLE_RATE)'}), 404
+    if PROFILE_KEY and (request.headers.get('X-Profile') or request.args.get('key')) != PROFILE_KEY:
+        return jsonify({'error': 'Clé de profilage requise'}), 403
+    
+    if request.args.get('format') == 'json':
+        payload = Profiler.get_stats()
+    else:
+        payload = Profiler.collapsed(request.args.get('request'))
+        if payload is None:
+            return jsonify({'error': 'Requête profilée inconnue'}), 404
+    
+    if request.args.get('reset') == '1':
+        Profiler.reset()
+    if isinstance(payload, dict):
+        return jsonify(payload)
+    return Response(payload, mimetype='text/plain')
+
+@bp.teardown_app_request
+def finish_profile(exc):
+    """Clôt un profil resté ouvert (erreur avant l'enregistrement de la session)"""
+    Profiler.finish()
+
 # ============================================
 # GESTIONNAIRES D'ERREURS
 # ============================================
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Route non trouvée'}), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     return jsonify({'error': 'Erreur interne du serveur'}), 500
 
-@app.errorhandler(429)
+@bp.app_errorhandler(429)
 def rate_limit(error):
     return jsonify({'error': 'Trop de requêtes'}), 429
 
@@ -1223,7 +5383,20 @@ def rate_limit(error):
 # DÉMARRAGE
 # ============================================
 
+app = create_app()
+
+if WARMUP_ON_START:
+    log_startup()
+    threading.Thread(
+        target=warm_up,
+        args=(app.extensions['benbot'].gemini,),
+        name='genai-warmup',
+        daemon=True
+    ).start()
+
 if __name__ == '__main__':
+    if not WARMUP_ON_START:
+        log_startup()
     port = int(os.environ.get('PORT', 5000))
     app.run(
         host='0.0.0.0',
@@ -0,0 +1,177 @@
+# ============================================
+# BENCHMARK - FUSION DES APPELS GEMINI IDENTIQUES (GeminiCoalescer)
+# - Vérifie qu'une rafale de requêtes identiques ne fait qu'un appel
+#   amont, que l'erreur de cet appel parvient à chaque requête en
+#   attente, le délai d'attente des requêtes fusionnées, la séparation
+#   des clés (modèle, paramètres, instruction système) et l'absence de
+#   cache une fois l'appel terminé
+# - Appels amont et durée d'une rafale, avec et sans fusion
+#
+# Usage: python benchmarks/bench_coalesce.py [--burst 32] [--gemini-latency 0.2] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+from fakes import FakeGenAIError, install_fake_genai  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+MODEL = 'models/gemini-1.5-flash'
+CONFIG = {'temperature': 0.7, 'max_output_tokens': 100}
+
+
+def reset():
+    coalescer = app.GeminiCoalescer
+    coalescer._inflight.clear()
+    coalescer._leaders = coalescer._coalesced = coalescer._timeouts = coalescer._errors = 0
+
+
+def burst(calls, timeout=None):
+    """Lance les appels `(args, kwargs)` ensemble; [(résultat, erreur)] dans l'ordre"""
+    barrier = threading.Barrier(len(calls))
+    outcomes = [None] * len(calls)
+
+    def call(i, args, kwargs):
+        barrier.wait()
+        try:
+            outcomes[i] = (app.GeminiCoalescer.generate(*args, timeout=timeout, **kwargs), None)
+        except Exception as e:
+            outcomes[i] = (None, e)
+
+    threads = [threading.Thread(target=call, args=(i, args, kwargs)) for i, (args, kwargs) in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def check_sharing(fake, count=16):
+    """Requêtes identiques simultanées : un seul appel amont, même réponse pour tous"""
+    reset()
+    outcomes = burst([((MODEL, 'Bonjour', CONFIG), {})] * count)
+    assert fake.calls == 1, fake.calls
+    assert all(error is None for _, error in outcomes), outcomes
+    assert len({id(result) for result, _ in outcomes}) == 1
+    stats = app.GeminiCoalescer.get_stats()
+    assert (stats['upstream_calls'], stats['coalesced'], stats['in_flight']) == (1, count - 1, 0), stats
+
+    # Pas un cache : l'appel terminé, la même requête repart vers Gemini
+    app.GeminiCoalescer.generate(MODEL, 'Bonjour', CONFIG)
+    assert fake.calls == 2, fake.calls
+
+
+def check_errors(fake, count=8):
+    """Erreur de l'appel partagé : levée dans chaque requête en attente, clé libérée"""
+    reset()
+    fake.error_rate = 1.0
+    try:
+        outcomes = burst([((MODEL, 'Erreur', CONFIG), {})] * count)
+    finally:
+        fake.error_rate = 0.0
+    assert fake.calls == 1, fake.calls
+    assert all(isinstance(error, FakeGenAIError) for _, error in outcomes), outcomes
+    stats = app.GeminiCoalescer.get_stats()
+    assert stats['errors'] == 1 and stats['in_flight'] == 0, stats
+    assert app.GeminiCoalescer.generate(MODEL, 'Erreur', CONFIG).text == fake.reply
+
+
+def check_timeout(fake):
+    """Requête fusionnée qui attend trop : TimeoutError pour elle seule"""
+    reset()
+    latency, fake.latency = fake.latency, 0.5
+    leader = {}
+    thread = threading.Thread(target=lambda: leader.update(
+        response=app.GeminiCoalescer.generate(MODEL, 'Lent', CONFIG)))
+    try:
+        thread.start()
+        while not app.GeminiCoalescer._inflight:
+            time.sleep(0.005)
+        try:
+            app.GeminiCoalescer.generate(MODEL, 'Lent', CONFIG, timeout=0.05)
+            raise AssertionError('TimeoutError attendue')
+        except TimeoutError:
+            pass
+        thread.join()
+    finally:
+        fake.latency = latency
+    assert leader['response'].text == fake.reply and fake.calls == 1, fake.calls
+    stats = app.GeminiCoalescer.get_stats()
+    assert stats['timeouts'] == 1 and stats['in_flight'] == 0, stats
+
+
+def check_keys(fake):
+    """Modèle, paramètres de génération et instruction système séparent les clés"""
+    reset()
+    variants = [
+        ((MODEL, 'Bonjour', CONFIG), {}),
+        ((MODEL, 'Bonjour', CONFIG), {}),
+        (('models/gemini-1.0-pro', 'Bonjour', CONFIG), {}),
+        ((MODEL, 'Bonjour', dict(CONFIG, temperature=0.2)), {}),
+        ((MODEL, 'Bonjour', dict(CONFIG, max_output_tokens=50)), {}),
+        ((MODEL, 'Bonjour', CONFIG), {'system_instruction': 'Tu es BenBot.'}),
+        ((MODEL, 'Bonsoir', CONFIG), {})
+    ]
+    outcomes = burst(variants)
+    assert all(error is None for _, error in outcomes), outcomes
+    assert fake.calls == len(variants) - 1, fake.calls
+    # Même configuration dans un autre ordre : même clé
+    assert app.GeminiCoalescer.make_key(MODEL, 'x', {'a': 1, 'b': 2}) == \
+        app.GeminiCoalescer.make_key(MODEL, 'x', {'b': 2, 'a': 1})
+
+
+def measure(fake, count, coalesce):
+    """Rafale de `count` requêtes identiques : appels amont et durée"""
+    reset()
+    fake.calls = 0
+    run = app.GeminiCoalescer.run
+    if not coalesce:
+        app.GeminiCoalescer.run = classmethod(lambda cls, key, fn, timeout=None: fn())
+    try:
+        start = time.perf_counter()
+        outcomes = burst([((MODEL, 'Quelle heure est-il ?', CONFIG), {})] * count)
+        duration = time.perf_counter() - start
+    finally:
+        app.GeminiCoalescer.run = run
+    assert all(error is None for _, error in outcomes)
+    return {'requests': count, 'upstream_calls': fake.calls, 'duration_ms': round(duration * 1000, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de la fusion des appels Gemini')
+    parser.add_argument('--burst', type=int, default=32)
+    parser.add_argument('--gemini-latency', type=float, default=0.2)
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    fake = install_fake_genai(app, latency=args.gemini_latency)
+    for check in (check_sharing, check_errors, check_timeout, check_keys):
+        fake.calls = 0
+        check(fake)
+    print("✅ Appel partagé, erreur transmise à chaque requête, délai d'attente et séparation des clés vérifiés")
+
+    results = {}
+    for label, coalesce in (('sans fusion', False), ('avec fusion', True)):
+        result = results[label] = measure(fake, args.burst, coalesce)
+        print(f"{label:<12} {result['requests']} requêtes -> {result['upstream_calls']} appels amont, "
+              f"{result['duration_ms']:.0f} ms")
+    reset()
+
+    path = loadgen.save_report(loadgen.build_report('coalesce', vars(args), results), args.output)
+    print(f"\n📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
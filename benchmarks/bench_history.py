@@ -0,0 +1,209 @@
+# ============================================
+# BENCHMARK - HISTORIQUE DE SANTÉ DES PROXIES (HealthHistory)
+# - Vérifie, sur une horloge simulée, les agrégats 5m / 1h / 1d des
+#   scans et des tests de proxies, la coupure de rétention de chaque
+#   résolution, les anneaux bornés d'échantillons bruts et le JSON de
+#   GET /api/vpn/history
+# - Coût d'enregistrement d'un scan et latence de l'endpoint après une
+#   semaine simulée de scans
+#
+# Usage: python benchmarks/bench_history.py [--scans 2000] [--interval 300] [--probes 20] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+T0 = 86400 * 20000  # minuit UTC, aligné sur toutes les résolutions
+
+
+class SimulatedClock:
+    """Remplace le module time d'app : time.time() renvoie `now`, le reste est réel"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+@contextlib.contextmanager
+def simulated_time(now=T0):
+    clock = SimulatedClock(now)
+    app.time = clock
+    try:
+        yield clock
+    finally:
+        app.time = time
+
+
+def scan(duration, candidates, tested, working):
+    return {'duration': duration, 'candidates': candidates, 'tested': tested, 'working': working}
+
+
+def check_rollups():
+    """Trois scans sur deux tranches de 5 min d'une même heure"""
+    history = app.HealthHistory(app.InProcessState())
+    with simulated_time() as clock:
+        clock.now = T0 + 10
+        history.record_scan(scan(2.0, 50, 3, 2), [('a:1', True, 100), ('b:1', False, None), ('c:1', True, 300)])
+        clock.now = T0 + 200
+        history.record_scan(scan(4.0, 30, 2, 1), [('a:1', True, 200), ('d:1', False, None)])
+        clock.now = T0 + 400
+        history.record_scan(scan(1.0, 10, 1, 1), [('a:1', True, 60)])
+
+        first, second = history.query('5m')
+        assert (first['t'], second['t']) == (T0, T0 + 300), (first, second)
+        assert first == {'t': T0, 'scans': 2, 'duration_avg': 3.0, 'duration_max': 4.0, 'candidates_avg': 40,
+                         'tested': 5, 'working': 3, 'success_rate': 0.6,
+                         'latency_avg': 200, 'latency_min': 100, 'latency_max': 300}, first
+        assert (second['scans'], second['latency_min'], second['latency_max']) == (1, 60, 60), second
+
+        for resolution in ('1h', '1d'):
+            [bucket] = history.query(resolution)
+            assert bucket['t'] == T0 and bucket['scans'] == 3, bucket
+            assert (bucket['tested'], bucket['working'], bucket['success_rate']) == (6, 4, round(4 / 6, 4)), bucket
+            assert (bucket['latency_avg'], bucket['latency_min'], bucket['latency_max']) == (165, 60, 300), bucket
+
+        raw = history.query('raw', since=T0 + 100)
+        assert [row['t'] for row in raw] == [T0 + 200, T0 + 400], raw
+        assert [bucket['t'] for bucket in history.query('5m', until=T0 + 299)] == [T0]
+
+        proxy = history.query_proxy('a:1')
+        assert (proxy['tested'], proxy['success_rate'], proxy['latency_avg']) == (3, 1.0, 120), proxy
+        assert history.query_proxy('b:1')['success_rate'] == 0.0
+        assert history.query_proxy('a:1', since=T0 + 100)['tested'] == 2
+
+        window = history.window()
+        assert window['scans'] == 3 and window['tested'] == 6 and 't' not in window, window
+
+
+def check_retention():
+    """Les tranches plus anciennes que la rétention de leur résolution disparaissent"""
+    history = app.HealthHistory(app.InProcessState())
+    history.SCAN_RING, history.PROBE_RING = 3, 4
+    size_5m, keep_5m = app.HealthHistory.RESOLUTIONS['5m']
+    size_1h, keep_1h = app.HealthHistory.RESOLUTIONS['1h']
+    with simulated_time() as clock:
+        for t in (T0, T0 + size_5m):
+            clock.now = t
+            history.record_scan(scan(1.0, 10, 2, 1), [('a:1', True, 100), ('b:1', False, None)])
+
+        # 24h plus tard : la première tranche de 5 min sort de la fenêtre, la seconde est à la limite
+        clock.now = T0 + size_5m * keep_5m
+        history.record_scan(scan(1.0, 10, 1, 1), [('a:1', True, 100)])
+        assert [b['t'] for b in history.query('5m')] == [T0 + size_5m, T0 + size_5m * keep_5m]
+        assert [b['t'] for b in history.query('1h')] == [T0, T0 + size_5m * keep_5m]
+        window = history.window()
+        assert window['scans'] == 2 and window['tested'] == 3, window
+
+        # 7 jours plus tard : la première heure sort, les tranches quotidiennes restent
+        clock.now = T0 + size_1h * keep_1h
+        history.record_scan(scan(1.0, 10, 1, 0), [('c:1', False, None)])
+        assert [b['t'] for b in history.query('1h')] == [T0 + size_5m * keep_5m, T0 + size_1h * keep_1h]
+        assert [b['t'] for b in history.query('1d')] == [T0, T0 + 86400, T0 + size_1h * keep_1h]
+        assert [b['t'] for b in history.query('5m')] == [T0 + size_1h * keep_1h]
+        assert history.window()['success_rate'] == 0.0
+
+    # Anneaux bruts bornés : les plus récents restent
+    assert len(history.query('raw')) == 3 and history.query('raw')[0]['t'] == T0 + size_5m
+    probes = history.state.get('vpn:ts:probes')
+    assert [row[1] for row in probes] == ['a:1', 'b:1', 'a:1', 'c:1'], probes
+
+
+def check_endpoint():
+    """GET /api/vpn/history : séries, fenêtre 24h, historique d'un proxy, erreurs"""
+    flask_app = app.create_app(state=app.InProcessState())
+    history = flask_app.extensions['benbot'].vpn.history
+    client = flask_app.test_client()
+    with simulated_time() as clock:
+        for i in range(4):
+            clock.now = T0 + i * 600
+            history.record_scan(scan(1.5, 20, 2, 1), [('a:1', True, 100 + i), ('b:1', False, None)])
+
+        body = client.get('/api/vpn/history').get_json()
+        assert body['success'] and body['resolution'] == '1h', body
+        assert body['series'] == history.query('1h') and body['last_24h'] == history.window(), body
+        assert body['last_24h']['success_rate'] == 0.5 and body['timestamp'] == clock.now, body
+
+        body = client.get(f'/api/vpn/history?resolution=5m&since={T0 + 600}&until={T0 + 1200}').get_json()
+        assert [row['t'] for row in body['series']] == [T0 + 600, T0 + 1200], body
+        assert body['series'][0]['latency_min'] == 101 and body['series'][0]['success_rate'] == 0.5, body
+
+        body = client.get('/api/vpn/history?resolution=raw').get_json()
+        assert [row['t'] for row in body['series']] == [T0 + i * 600 for i in range(4)], body
+
+        body = client.get(f'/api/vpn/history?proxy=a:1&since={T0 + 1200}').get_json()
+        assert body['success'] and body['proxy'] == 'a:1', body
+        assert body['samples'] == [{'t': T0 + 1200, 'working': True, 'latency': 102},
+                                   {'t': T0 + 1800, 'working': True, 'latency': 103}], body
+        assert (body['tested'], body['success_rate'], body['latency_avg']) == (2, 1.0, 102), body
+
+        response = client.get('/api/vpn/history?resolution=2m')
+        assert response.status_code == 400 and not response.get_json()['success']
+
+
+def measure(scans, interval, probes):
+    """`scans` scans simulés espacés de `interval` s : coût d'enregistrement et de lecture"""
+    flask_app = app.create_app(state=app.InProcessState())
+    history = flask_app.extensions['benbot'].vpn.history
+    client = flask_app.test_client()
+    rows = [(f'10.0.0.{i}:8080', i % 3 == 0, 80 + i) for i in range(probes)]
+    with simulated_time() as clock:
+        start = time.perf_counter()
+        for i in range(scans):
+            clock.now = T0 + i * interval
+            history.record_scan(scan(2.0, 100, probes, probes // 3), rows)
+        record_ms = (time.perf_counter() - start) * 1000 / scans
+
+        latencies = {}
+        for resolution in ('raw', '5m', '1h', '1d'):
+            start = time.perf_counter()
+            response = client.get(f'/api/vpn/history?resolution={resolution}')
+            latencies[resolution] = round((time.perf_counter() - start) * 1000, 2)
+            assert response.status_code == 200
+    return {'record_scan_ms': round(record_ms, 3), 'history_ms': latencies,
+            'buckets': {resolution: len(history.query(resolution)) for resolution in app.HealthHistory.RESOLUTIONS}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de l'historique de santé des proxies")
+    parser.add_argument('--scans', type=int, default=2000)
+    parser.add_argument('--interval', type=int, default=300, help='secondes simulées entre deux scans')
+    parser.add_argument('--probes', type=int, default=20, help='tests de proxy par scan')
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        check_rollups()
+        check_retention()
+        check_endpoint()
+    print("✅ Agrégats 5m/1h/1d, rétention, anneaux bornés et JSON de /api/vpn/history vérifiés")
+
+    results = measure(args.scans, args.interval, args.probes)
+    print(f"record_scan : {results['record_scan_ms']:.3f} ms par scan ({args.probes} tests)")
+    for resolution, ms in results['history_ms'].items():
+        print(f"GET /api/vpn/history?resolution={resolution:<4} {ms:.2f} ms")
+    print('Tranches conservées : ' + ', '.join(f'{r}={n}' for r, n in results['buckets'].items()))
+
+    path = loadgen.save_report(loadgen.build_report('history', vars(args), results), args.output)
+    print(f"\n📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
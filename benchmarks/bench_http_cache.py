@@ -0,0 +1,110 @@
+# ============================================
+# BENCHMARK - COMPRESSION ET CACHE HTTP DES RÉPONSES
+# - Octets par réponse : identité, gzip, brotli (requirements.txt) et
+#   revalidation (If-None-Match -> 304) pour les pages, fichiers
+#   statiques et routes JSON principales
+# - Latence sous charge avec et sans compression
+#
+# Usage: python benchmarks/bench_http_cache.py [-n 300] [-c 8] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+from fakes import install_fake_genai  # noqa: E402
+from run import scenario_get_proxies, scenario_memory_status  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+ROUTES = ['/', 'js', 'css', '/api/get-proxies', '/api/memory/status', '/api/gemini/models', '/api/vpn/stats']
+
+
+def measure_bytes(client):
+    """Taille transférée par route et par encodage; 304 à la revalidation"""
+    home = client.get('/').get_data(as_text=True)
+    static = {
+        'js': re.search(r'/static/js/script\.js\?v=\w+', home).group(0),
+        'css': re.search(r'/static/css/style\.css\?v=\w+', home).group(0)
+    }
+    encodings = [('identité', 'identity'), ('gzip', 'gzip'), ('brotli', 'br')]
+
+    results = {}
+    for route in ROUTES:
+        url = static.get(route, route)
+        sizes = {}
+        for label, accept in encodings:
+            response = client.get(url, headers={'Accept-Encoding': accept})
+            assert response.status_code == 200, (url, response.status_code)
+            sizes[label] = len(response.data)
+            assert response.headers.get('Content-Encoding') in (None, accept), (url, accept)
+            etag = response.headers.get('ETag')
+            if etag and label == 'gzip':
+                again = client.get(url, headers={'Accept-Encoding': accept, 'If-None-Match': etag})
+                sizes['304'] = len(again.data) if again.status_code == 304 else None
+        sizes['cache_control'] = response.headers.get('Cache-Control')
+        results[route] = sizes
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark compression et cache HTTP')
+    parser.add_argument('-n', '--requests', type=int, default=300)
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    assert app.brotli is not None, "brotli absent : pip install -r requirements.txt"
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    install_fake_genai(app, latency=0.0)
+    state = app.InProcessState()
+    state.set('vpn:working_cache', [f'10.0.{i // 256}.{i % 256}:8080' for i in range(200)])
+    flask_app = app.create_app(state=state)
+
+    client = flask_app.test_client()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for message in ("Je m'appelle Alice", "Je prépare un voyage au Japon", "Quel métier choisir ?"):
+            client.post('/api/chat', json={'message': message})
+        sizes = measure_bytes(client)
+
+    print(f"{'route':<22} {'identité':>9} {'gzip':>7} {'brotli':>7} {'304':>5}  Cache-Control")
+    for route, entry in sizes.items():
+        brotli_size = entry.get('brotli')
+        print(f"{route:<22} {entry['identité']:>9} {entry['gzip']:>7} "
+              f"{brotli_size if brotli_size is not None else '-':>7} "
+              f"{entry.get('304') if entry.get('304') is not None else '-':>5}  {entry['cache_control']}")
+
+    # Latence sous charge (requests envoie Accept-Encoding: gzip, deflate[, br])
+    load = {}
+    for label, min_size in (('sans compression', 10 ** 9), ('compression', app.COMPRESS_MIN_SIZE)):
+        app.COMPRESS_MIN_SIZE = min_size
+        server = loadgen.LocalServer(flask_app)
+        try:
+            for name, scenario in (('get_proxies', scenario_get_proxies), ('memory_status', scenario_memory_status)):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = loadgen.run_load(server.url, scenario, args.concurrency, args.requests,
+                                              trace_memory=False)
+                load[f'{label}:{name}'] = result
+                loadgen.print_result(f'{name} ({label})', result)
+        finally:
+            server.close()
+
+    saved = app.ResponseOptimizer.get_stats()['bytes_saved']
+    print(f"\n⚡ Octets économisés pendant le benchmark : {saved / 1024:.1f} Ko")
+    path = loadgen.save_report(loadgen.build_report('http_cache', vars(args), {'bytes': sizes, 'load': load}),
+                               args.output)
+    print(f"📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
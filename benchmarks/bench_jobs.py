@@ -0,0 +1,164 @@
+# ============================================
+# BENCHMARK - TÂCHES DE SCAN ASYNCHRONES
+# - Vérifie la déduplication, l'ordre des priorités, l'annulation, les
+#   résultats partiels, l'expiration des fiches (TTL) et la reprise des
+#   tâches laissées par un processus disparu
+# - Compare la durée de la requête POST /api/vpn/scan (réponse immédiate)
+#   à celle du scan exécuté en arrière-plan, sur des proxies lents
+#
+# Usage: python benchmarks/bench_jobs.py [--proxy-latency 0.2] [--max-tests 40] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+from fakes import FakeProxyFleet  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+
+def poll(client, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f'/api/vpn/jobs/{job_id}').get_json()['job']
+        if job['status'] in app.ScanJobQueue.FINISHED:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"tâche {job_id} non terminée")
+
+
+def check_queue(fleet):
+    """Un seul worker, bloqué : l'ordre de sortie suit les priorités"""
+    service = app.VPNService(app.InProcessState())
+    fleet.install(service)
+    jobs = app.ScanJobQueue(service, service.state)
+    jobs.WORKERS = 1
+    order = []
+    gate = threading.Event()
+    real_run = jobs.run
+
+    def run(job_id):
+        gate.wait()
+        job = jobs.get(job_id)
+        if job['status'] == 'queued':
+            order.append(job['priority'])
+        real_run(job_id)
+
+    jobs.run = run
+    first, _ = jobs.submit({'limit': 1, 'max_tests': 3})  # occupe le worker
+    time.sleep(0.1)
+    low, _ = jobs.submit({'limit': 1, 'max_tests': 4}, 'low')
+    normal, _ = jobs.submit({'limit': 1, 'max_tests': 5})
+    high, _ = jobs.submit({'limit': 1, 'max_tests': 6}, 'high')
+    again, deduplicated = jobs.submit({'limit': 1, 'max_tests': 5})
+    assert deduplicated and again['id'] == normal['id']
+    cancelled = jobs.cancel(low['id'])
+    assert cancelled['status'] == 'cancelled'
+    gate.set()
+    for job in (first, normal, high):
+        assert jobs.wait(job['id'], 30)['status'] == 'done'
+    assert order == ['normal', 'high', 'normal'], order
+
+    # TTL : fiche terminée oubliée à l'expiration
+    jobs.RESULT_TTL = 0
+    expired, _ = jobs.submit({'limit': 1, 'max_tests': 2})
+    jobs.wait(expired['id'], 30)
+    time.sleep(0.01)
+    assert jobs.get(expired['id']) is None and expired['id'] not in [j['id'] for j in jobs.list()]
+
+
+def check_orphans(fleet):
+    """Fiches d'un processus disparu : reprise si en file, échec si en cours, déduplication libérée"""
+    service = app.VPNService(app.InProcessState())
+    fleet.install(service)
+    jobs = app.ScanJobQueue(service, service.state)
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+
+    queued, _ = jobs.submit({'limit': 1, 'max_tests': 2})
+    running, _ = jobs.submit({'limit': 1, 'max_tests': 3})
+    jobs.wait(queued['id'], 30)
+    jobs.wait(running['id'], 30)
+    for job, status in ((queued, 'queued'), (running, 'running')):
+        service.state.set(jobs._key(job['id']), dict(job, status=status, pid=dead.pid, started_at=time.time(),
+                                                     finished_at=None, expires_at=None, result=None))
+    assert jobs.get(running['id'])['status'] == 'failed'
+    assert jobs.wait(queued['id'], 30)['status'] == 'done'
+    again, deduplicated = jobs.submit({'limit': 1, 'max_tests': 3})
+    assert not deduplicated and again['id'] != running['id']
+
+    # Processus vivant mais scan figé au-delà du bail
+    jobs.LEASE = 0
+    stuck = dict(jobs.wait(again['id'], 30), status='running', heartbeat_at=time.time() - 1, expires_at=None)
+    service.state.set(jobs._key(stuck['id']), stuck)
+    assert jobs.list()[-1]['status'] == 'failed'
+
+
+def check_api(client):
+    """Réponse immédiate, progression partielle, annulation d'un scan en cours"""
+    response = client.post('/api/vpn/scan', json={'limit': 50, 'max_tests': 60})
+    assert response.status_code == 202
+    job_id = response.get_json()['job']['id']
+    running = response.get_json()['job']
+    while running['progress']['tested'] == 0:  # annulation dès la première progression publiée
+        time.sleep(0.02)
+        running = client.get(f'/api/vpn/jobs/{job_id}').get_json()['job']
+    assert running['status'] == 'running', running
+    client.delete(f'/api/vpn/jobs/{job_id}')
+    job = poll(client, job_id)
+    assert job['status'] == 'cancelled' and job['progress']['tested'] < 60, job
+    assert client.post('/api/vpn/scan', json={'priority': 'urgent'}).status_code == 400
+    for wait in ('abc', -1, 'nan', 'inf', [1]):
+        assert client.post('/api/vpn/scan', json={'wait': wait}).status_code == 400, wait
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark des tâches de scan')
+    parser.add_argument('--proxy-latency', type=float, default=0.2)
+    parser.add_argument('--max-tests', type=int, default=40)
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    with FakeProxyFleet(working=5, dead=60, proxy_latency=args.proxy_latency) as fleet:
+        fleet.install(app.VPNService)
+        app.VPNService.PRESCREEN = False
+        client = app.create_app(state=app.InProcessState()).test_client()
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_queue(fleet)
+            check_orphans(fleet)
+            check_api(client)
+        print("✅ Priorités, déduplication, annulation, progression, TTL et reprise des tâches orphelines vérifiés")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            response = client.post('/api/vpn/scan', json={'limit': 50, 'max_tests': args.max_tests})
+            post_ms = (time.perf_counter() - start) * 1000
+            job = poll(client, response.get_json()['job']['id'], timeout=600)
+        scan_s = job['finished_at'] - job['started_at']
+
+    results = {
+        'post_ms': round(post_ms, 2),
+        'scan_s': round(scan_s, 2),
+        'tested': job['progress']['tested'],
+        'working': job['result']['count']
+    }
+    print(f"POST /api/vpn/scan : {post_ms:.1f} ms (HTTP {response.status_code})")
+    print(f"Scan en arrière-plan : {scan_s:.1f} s, {results['tested']} testés, {results['working']} fonctionnels")
+    path = loadgen.save_report(loadgen.build_report('jobs', vars(args), results), args.output)
+    print(f"\n📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# ============================================
+# BENCHMARK - PRÉ-FILTRAGE ASYNCHRONE DES PROXIES
+# Mesure le nombre de candidats filtrés par seconde par AsyncProxyScreener
+# sur une flotte locale (ports en écoute, ports fermés et ports qui ne
+# répondent jamais), comparé au test séquentiel historique via requests.
+#
+# Usage: python benchmarks/bench_prescreen.py [--candidates 20000] [--listeners 500] [--tarpits 200]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+from fakes import FakeListenerFarm  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from app import AsyncProxyScreener, VPNService  # noqa: E402
+
+
+def closed_ports(count, used, seed=0):
+    """Ports locaux sans écoute (connexion refusée immédiatement).
+    Hors plage éphémère pour ne pas tomber sur nos propres connexions sortantes."""
+    rng = random.Random(seed)
+    ports = set()
+    while len(ports) < count:
+        port = rng.randint(10000, 32000)
+        if port not in used:
+            ports.add(port)
+    return [f'127.0.0.1:{port}' for port in ports]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark du pré-filtrage TCP')
+    parser.add_argument('--candidates', type=int, default=20000)
+    parser.add_argument('--listeners', type=int, default=500)
+    parser.add_argument('--tarpits', type=int, default=200,
+                        help='ports qui ne répondent jamais (expiration)')
+    parser.add_argument('--concurrency', type=int, action='append',
+                        help='niveaux de concurrence (répétable, défaut: 64 256 1024)')
+    parser.add_argument('--sequential-sample', type=int, default=200,
+                        help='candidats testés avec le test séquentiel historique')
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    results = {'runs': []}
+    with FakeListenerFarm(args.listeners, args.tarpits) as farm:
+        used = {int(address.rsplit(':', 1)[1]) for address in farm.addresses + farm.tarpits}
+        closed = closed_ports(max(0, args.candidates - args.listeners - args.tarpits), used)
+        candidates = farm.addresses + farm.tarpits + closed
+        random.Random(1).shuffle(candidates)
+        print(f"🎯 {len(candidates)} candidats: {len(farm.addresses)} en écoute, "
+              f"{len(farm.tarpits)} muets, {len(closed)} fermés")
+
+        for concurrency in args.concurrency or (64, 256, 1024):
+            screener = AsyncProxyScreener(concurrency=concurrency, timeout=0.8)
+            passed = screener.screen(candidates)
+            stats = dict(screener.last_stats)
+            stats['requested_concurrency'] = concurrency
+            stats['recall'] = round(len(passed) / len(farm.addresses), 3)
+            results['runs'].append(stats)
+            print(f"⚡ concurrence {stats['concurrency']:>5}: {stats['rate_per_second']:>10.1f} candidats/s "
+                  f"({stats['passed']} joignables, {stats['duration']:.2f}s)")
+
+        # Référence : test séquentiel (VPNService.test_proxy) sur un échantillon
+        # de même composition que la liste complète
+        sample = []
+        for group in (farm.addresses, farm.tarpits, closed):
+            if group:
+                share = max(1, round(args.sequential_sample * len(group) / len(candidates)))
+                sample.extend(group[:share])
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for proxy in sample:
+                VPNService.test_proxy(proxy, timeout=0.8)
+        duration = time.perf_counter() - start
+        results['sequential'] = {
+            'candidates': len(sample),
+            'duration': round(duration, 3),
+            'rate_per_second': round(len(sample) / duration, 1) if duration > 0 else 0.0
+        }
+        print(f"🐢 test séquentiel: {results['sequential']['rate_per_second']:.1f} candidats/s")
+
+    path = loadgen.save_report(loadgen.build_report('prescreen', vars(args), results), args.output)
+    print(f"\n📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
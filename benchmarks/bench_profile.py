@@ -0,0 +1,133 @@
+# ============================================
+# BENCHMARK - PROFILEUR PAR ÉCHANTILLONNAGE
+# - Vérifie le profilage à la demande (en-tête X-Profile) : Server-Timing,
+#   spans de /api/chat et des tâches de scan, piles collapsed par requête,
+#   aucun verrou pris quand le profileur est désactivé
+# - Mesure le surcoût sous charge : profileur désactivé, activé sans
+#   requête profilée, puis toutes les requêtes profilées
+#
+# Usage: python benchmarks/bench_profile.py [-n 300] [-c 8] [--gemini-latency 0.05] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+from fakes import FakeProxyFleet, install_fake_genai  # noqa: E402
+from run import scenario_chat  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+KEY = 'bench-profile'
+
+
+class CountingLock:
+    """Verrou qui compte ses acquisitions"""
+
+    def __init__(self, lock):
+        self.lock, self.acquired = lock, 0
+
+    def __enter__(self):
+        self.acquired += 1
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc):
+        return self.lock.__exit__(*exc)
+
+
+def check_profiling(flask_app):
+    """Spans et piles d'une requête profilée; les autres ne sont pas échantillonnées"""
+    client = flask_app.test_client()
+    # Profileur désactivé : aucune prise de son verrou, fin de requête comprise;
+    # activé, la fin d'une requête non profilée ne le prend pas non plus
+    lock = app.Profiler._lock = CountingLock(app.Profiler._lock)
+    try:
+        app.PROFILE_KEY = None
+        client.post('/api/chat', json={'message': 'Bonjour'})
+        app.PROFILE_KEY = KEY
+        app.Profiler.finish()
+    finally:
+        app.PROFILE_KEY = KEY
+        app.Profiler._lock = lock.lock
+    assert lock.acquired == 0, lock.acquired
+
+    plain = client.post('/api/chat', json={'message': 'Bonjour'})
+    assert 'Server-Timing' not in plain.headers
+
+    response = client.post('/api/chat', json={'message': 'Je prépare un voyage'}, headers={'X-Profile': KEY})
+    timing = response.headers['Server-Timing']
+    for span in ('session.open', 'memory.update', 'prompt.build', 'gemini.generate', 'session.save'):
+        assert span in timing, timing
+    assert int(response.headers['X-Profile-Samples']) > 0
+
+    stacks = client.get(f"/api/debug/profile?request={response.headers['X-Profile-Id']}",
+                        headers={'X-Profile': KEY}).get_data(as_text=True)
+    assert 'POST /api/chat;' in stacks and 'span:gemini.generate' in stacks, stacks[:500]
+
+    # Scan exécuté par une tâche de fond : ses spans sont dans les agrégats, pas dans Server-Timing
+    scan = client.post('/api/vpn/scan', json={'limit': 2, 'max_tests': 10, 'wait': 25}, headers={'X-Profile': KEY})
+    assert scan.get_json()['job']['status'] == 'done', scan.get_json()
+
+    assert client.get('/api/debug/profile').status_code == 403
+    stats = client.get('/api/debug/profile?format=json&reset=1', headers={'X-Profile': KEY}).get_json()
+    assert stats['spans']['gemini.generate']['count'] >= 2
+    assert stats['spans']['vpn.probe']['count'] >= 1 and 'vpn.job' in stats['spans'], stats['spans']
+    return timing
+
+
+def load(flask_app, requests, concurrency, rate):
+    app.PROFILE_SAMPLE_RATE = rate
+    server = loadgen.LocalServer(flask_app)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return loadgen.run_load(server.url, scenario_chat, concurrency, requests, trace_memory=False)
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark du profileur')
+    parser.add_argument('-n', '--requests', type=int, default=300)
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('--gemini-latency', type=float, default=0.05)
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    install_fake_genai(app, latency=args.gemini_latency)
+    app.PROFILE_KEY = KEY
+    with FakeProxyFleet(working=3, dead=10) as fleet:
+        fleet.install(app.VPNService)
+        flask_app = app.create_app(state=app.InProcessState())
+        with contextlib.redirect_stdout(io.StringIO()):
+            timing = check_profiling(flask_app)
+    print(f"✅ Profil à la demande vérifié\n   Server-Timing: {timing}")
+
+    results = {}
+    for label, key, rate in (('désactivé', None, 0.0), ('sans profil', KEY, 0.0), ('100% profilé', KEY, 1.0)):
+        app.PROFILE_KEY = key
+        spans = app.Profiler.get_stats()['spans']
+        result = results[label] = load(flask_app, args.requests, args.concurrency, rate)
+        loadgen.print_result(label, result)
+        if key is None:  # profileur désactivé : spans sans effet
+            assert app.Profiler.get_stats()['spans'] == spans
+    app.PROFILE_SAMPLE_RATE = 0.0
+
+    samples = app.Profiler.get_stats()['samples']
+    overhead = results['100% profilé']['latency_ms']['p50'] / results['sans profil']['latency_ms']['p50'] - 1
+    print(f"\n⚡ Surcoût p50 : {overhead * 100:+.1f}%  ({samples} échantillons)")
+    path = loadgen.save_report(loadgen.build_report('profile', vars(args), results), args.output)
+    print(f"📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
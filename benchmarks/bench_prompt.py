@@ -0,0 +1,95 @@
+# ============================================
+# MICRO-BENCHMARK - CONSTRUCTION DES PROMPTS
+# Compare l'ancien prompt f-string reconstruit à chaque requête
+# avec PromptBuilder (préfixe statique + historique incrémental)
+#
+# Usage: python benchmarks/bench_prompt.py [nb_messages ...]
+# ============================================
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+from app import PromptBuilder  # noqa: E402
+
+HISTORY_WINDOWS = (8, 50)
+DEFAULT_COUNTS = (1000, 10000, 50000)
+SESSION_CAP = 50
+
+
+def legacy_prompt(messages, memory_context, limit):
+    """Reproduction de l'ancien code de /api/chat"""
+    conversation_history = ""
+    for msg in messages[-limit:]:
+        role = "Utilisateur" if msg['role'] == 'user' else "BenBot"
+        conversation_history += f"{role}: {msg['content']}\n"
+
+    return f"""Tu es BenBot, un assistant IA amical et serviable.
+Réponds en français de manière naturelle, chaleureuse et utile.
+
+{memory_context}
+Historique de la conversation:
+{conversation_history}
+BenBot:"""
+
+
+def make_message(i):
+    role = 'user' if i % 2 == 0 else 'assistant'
+    return {'id': i, 'role': role, 'content': f"Message numéro {i} " + "du texte " * 20}
+
+
+def run_legacy(count, limit):
+    conversation = {'messages': [], 'message_count': 0}
+    start = time.perf_counter()
+    for i in range(count):
+        conversation['messages'].append(make_message(i))
+        conversation['messages'] = conversation['messages'][-SESSION_CAP:]
+        legacy_prompt(conversation['messages'], "", limit)
+    return time.perf_counter() - start
+
+
+def run_builder(count, limit):
+    conversation = {'id': f'bench-{count}-{limit}', 'messages': [], 'message_count': 0}
+    start = time.perf_counter()
+    for i in range(count):
+        message = make_message(i)
+        conversation['messages'].append(message)
+        conversation['messages'] = conversation['messages'][-SESSION_CAP:]
+        conversation['message_count'] += 1
+        PromptBuilder.append_history(conversation['id'], conversation['message_count'],
+                                     message['role'], message['content'])
+        PromptBuilder.build(conversation, None, [], None, history_limit=limit)
+    PromptBuilder.forget(conversation['id'])
+    return time.perf_counter() - start
+
+
+def check_equivalence():
+    """Le nouveau prompt doit être identique à l'ancien (sans system_instruction)"""
+    conversation = {'id': 'bench-check', 'messages': [], 'message_count': 0}
+    for i in range(20):
+        message = make_message(i)
+        conversation['messages'].append(message)
+        conversation['message_count'] += 1
+        PromptBuilder.append_history('bench-check', conversation['message_count'],
+                                     message['role'], message['content'])
+    body = PromptBuilder.BODY(memory_context="", history=PromptBuilder.render_history(conversation))
+    PromptBuilder.forget('bench-check')
+    assert PromptBuilder.STATIC_PREFIX + body == legacy_prompt(conversation['messages'], "", 8)
+
+
+def main(counts):
+    check_equivalence()
+    print(f"{'messages':>10} {'fenêtre':>8} {'legacy µs/req':>14} {'builder µs/req':>15} {'gain':>6}")
+    for count in counts:
+        for limit in HISTORY_WINDOWS:
+            legacy = run_legacy(count, limit)
+            builder = run_builder(count, limit)
+            print(f"{count:>10} {limit:>8} {legacy / count * 1e6:>14.2f} "
+                  f"{builder / count * 1e6:>15.2f} {legacy / builder:>5.2f}x")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_COUNTS)
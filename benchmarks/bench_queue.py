@@ -0,0 +1,124 @@
+# ============================================
+# BENCHMARK - FILE DE VALIDATION PAR PROBABILITÉ DE FONCTIONNER
+# Monde simulé (sources de qualités différentes, ports, proxies qui
+# meurent et renaissent entre deux scans) : nombre de tests nécessaires
+# pour atteindre `limit` proxies fonctionnels, file 'priority' vs 'random'.
+# Les sondes réseau sont remplacées par la vérité du monde simulé.
+#
+# Usage: python benchmarks/bench_queue.py [--proxies 5000] [--rounds 8] [--limit 20] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+# (nom, part de proxies vivants, part de la population listée)
+SOURCES = [('bonne', 0.25, 0.15), ('moyenne', 0.08, 0.35), ('agrégateur', 0.05, 0.6),
+           ('mauvaise', 0.01, 0.4), ('morte', 0.0, 0.2)]
+LIVE_PORTS = ['8080', '3128', '80', '8888']
+
+
+class SimulatedWorld:
+    """Population de proxies avec vérité terrain et persistance entre scans"""
+
+    def __init__(self, size, seed=0):
+        self.random = random.Random(seed)
+        self.alive = {}
+        self.listings = {name: [] for name, _, _ in SOURCES}
+        for i in range(size):
+            live_bias = self.random.random() < 0.3
+            port = self.random.choice(LIVE_PORTS) if live_bias else str(self.random.randint(1024, 65000))
+            proxy = f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}:{port}'
+            alive = False
+            for name, alive_rate, reach in SOURCES:
+                if self.random.random() < reach:
+                    self.listings[name].append(proxy)
+                    # Un proxy vivant listé par une bonne source est plus probable
+                    alive = alive or self.random.random() < alive_rate * (2.0 if live_bias else 0.5)
+            self.alive[proxy] = alive
+
+    def evolve(self):
+        """Entre deux scans : 10% des vivants meurent, 1% des morts renaissent"""
+        for proxy, alive in self.alive.items():
+            if alive and self.random.random() < 0.10:
+                self.alive[proxy] = False
+            elif not alive and self.random.random() < 0.01:
+                self.alive[proxy] = True
+
+    def install(self, service):
+        service.PROXY_SOURCES = [{'name': name, 'url': f'sim://{name}', 'parser': 'default'}
+                                 for name, _, _ in SOURCES]
+        service.PRESCREEN = False
+        world = self
+
+        def fetch_source(source, validators=None):
+            return {'proxies': list(world.listings[source['name']]), 'bytes': 0, 'latency_ms': 0,
+                    'error': None, 'not_modified': False, 'etag': None, 'last_modified': None}
+
+        def probe_proxy(proxy, timeout=3, **kwargs):
+            working = world.alive[proxy]
+            return {'working': working, 'latency': 100 if working else None, 'country': None,
+                    'failed_stage': None if working else 'tcp', 'stages': {},
+                    'protocols': [], 'anonymity': None}
+
+        service.fetch_source = fetch_source
+        service.probe_proxy = probe_proxy
+
+
+def run(ordering, size, rounds, limit, seed):
+    world = SimulatedWorld(size, seed)
+    service = app.VPNService(app.InProcessState())
+    world.install(service)
+    probes = []
+    for _ in range(rounds):
+        with contextlib.redirect_stdout(io.StringIO()):
+            service.find_working_proxies(limit=limit, max_tests=size, ordering=ordering)
+        probes.append(service.state.get('vpn:last_scan')['tested'])
+        world.evolve()
+    return probes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de la file de validation')
+    parser.add_argument('--proxies', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=8)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'ordre':<9} {'1er scan':>9} {'suivants (médiane)':>19} {'taux de succès':>15}")
+    for ordering in ('random', 'priority'):
+        probes = run(ordering, args.proxies, args.rounds, args.limit, args.seed)
+        later = probes[1:] or probes
+        results[ordering] = {
+            'probes_per_scan': probes,
+            'first_scan': probes[0],
+            'median_later': statistics.median(later),
+            'hit_rate_later': round(args.limit / statistics.mean(later), 4)
+        }
+        r = results[ordering]
+        print(f"{ordering:<9} {r['first_scan']:>9} {r['median_later']:>19} {r['hit_rate_later'] * 100:>14.1f}%")
+
+    gain = results['random']['median_later'] / results['priority']['median_later']
+    print(f"\n⚡ {gain:.1f}x moins de tests pour atteindre {args.limit} proxies fonctionnels")
+    path = loadgen.save_report(loadgen.build_report('queue', vars(args), results), args.output)
+    print(f"📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
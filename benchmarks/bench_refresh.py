@@ -0,0 +1,211 @@
+# ============================================
+# BENCHMARK - RAFRAÎCHISSEMENT INCRÉMENTAL DES LISTES DE PROXIES
+# - Vérifie les requêtes conditionnelles (ETag / If-Modified-Since -> 304)
+#   et la fusion par diff (nouveaux candidats en file, disparus retirés)
+# - Vérifie les listes complètes hors shm, le plafond par source sur un
+#   segment shm (taille par défaut) et son débordement (erreur explicite,
+#   état inchangé, source réessayée plus tard)
+# - Compare les octets téléchargés et la durée d'un cycle avec et sans
+#   requêtes conditionnelles, sur des listes qui changent peu
+#
+# Usage: python benchmarks/bench_refresh.py [--proxies 20000] [--cycles 10] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from email.utils import formatdate
+from multiprocessing import resource_tracker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+from fakes import FakeProxyFleet  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+
+def make_service(fleet):
+    service = app.VPNService(app.InProcessState())
+    fleet.install(service)
+    return service
+
+
+def expire_sources(service):
+    """Rend toutes les sources dues (ignore la planification adaptative)"""
+    service.state.update('vpn:sources:stats', lambda stats: {
+        name: dict(entry, next_fetch=0) for name, entry in (stats or {}).items()
+    })
+
+
+def refresh(service):
+    expire_sources(service)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return service.get_all_proxies(force_refresh=True)
+
+
+def fake_ip(i):
+    return f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}:8080'
+
+
+def check_conditional_and_diff():
+    """304 sur liste inchangée, diff exact sur liste modifiée"""
+    with FakeProxyFleet(working=2, dead=30, sources=3, overlap=0.5) as fleet:
+        service = make_service(fleet)
+
+        first = refresh(service)
+        assert service.state.get('vpn:last_refresh')['added'] == len(first)
+        assert set(service.state.get('vpn:proxy_first_seen')) == set(first)
+
+        refresh(service)
+        assert fleet.counters.get('source_not_modified') == len(fleet.sources)
+        assert service.state.get('vpn:last_refresh')['added'] == 0
+
+        # Un proxy disparaît de toutes les listes, deux nouveaux apparaissent
+        gone = first[0]
+        new = [fake_ip(1), fake_ip(2)]
+        for name in fleet.sources:
+            fleet.update_source(name, remove=[gone])
+        fleet.update_source('list1.txt', add=new)
+        service.state.set('vpn:working_cache', [gone])
+
+        current = refresh(service)
+        last = service.state.get('vpn:last_refresh')
+        assert (last['added'], last['removed']) == (2, 1), last
+        assert gone not in current and set(new) <= set(current)
+        seen = service.state.get('vpn:proxy_first_seen')
+        assert gone not in seen and seen[new[0]] > seen[first[1]], seen
+        assert service.get_working_cache() == []
+
+        # If-Modified-Since seul (sans ETag)
+        _, modified = fleet.source_validators('list0.txt')
+        fetch = service.fetch_source(service.PROXY_SOURCES[0],
+                                     {'last_modified': formatdate(modified, usegmt=True)})
+        assert fetch['not_modified'] and fetch['proxies'] is None
+    print("✅ 304 (ETag et If-Modified-Since) et fusion par diff vérifiés")
+
+
+def drop_segment(state):
+    state._shm.close()
+    resource_tracker.register(state._shm._name, 'shared_memory')  # désinscrit à la création
+    state._shm.unlink()
+
+
+def check_capacity():
+    """Listes complètes hors shm, plafonnées sur shm ou sur demande; segment plein : erreur claire"""
+    scheduler = app.ProxySourceScheduler
+    with FakeProxyFleet(working=0, dead=0, sources=2) as fleet:
+        for s, name in enumerate(fleet.sources):
+            fleet.sources[name] = '\n'.join(fake_ip(s * 4000 + i) for i in range(4000))
+
+        # Backend en mémoire : aucune entrée perdue
+        service = make_service(fleet)
+        assert len(refresh(service)) == 8000
+        assert all(entry['last_truncated'] == 0 for entry in service.sources.get_all_stats().values())
+
+        # Plafond imposé (PROXY_SOURCE_MAX_PROXIES), tous backends
+        scheduler.MAX_PROXIES = 1000
+        try:
+            service = make_service(fleet)
+            assert len(refresh(service)) == 2000
+        finally:
+            scheduler.MAX_PROXIES = 0
+        assert all(entry['last_truncated'] == 3000 for entry in service.sources.get_all_stats().values())
+
+        # Segment shm de taille par défaut (create_state_backend) : plafond automatique
+        state = app.create_state_backend('shm', path=f'benbot_bench_default_{os.getpid()}')
+        bounded = scheduler.BOUNDED_MAX_PROXIES
+        scheduler.BOUNDED_MAX_PROXIES = 1500
+        try:
+            assert state.size == app.STATE_SHM_SIZE_MB * 1024 * 1024
+            service = app.VPNService(state)
+            fleet.install(service)
+            assert len(refresh(service)) == 3000
+            assert all(entry['last_truncated'] == 2500 for entry in service.sources.get_all_stats().values())
+        finally:
+            scheduler.BOUNDED_MAX_PROXIES = bounded
+            drop_segment(state)
+
+        # Segment trop petit : StateFullError explicite, refresh sans plantage
+        state = app.SharedMemoryState(f'benbot_bench_{os.getpid()}', size=64 * 1024)
+        try:
+            try:
+                state.set('big', ['x' * 100] * 1000)
+                raise AssertionError('StateFullError attendue')
+            except app.StateFullError as e:
+                assert 'big' in str(e) and 'STATE_SHM_SIZE_MB' in str(e), e
+            assert state.get('big') is None
+
+            service = app.VPNService(state)
+            fleet.install(service)
+            refresh(service)  # listes plafonnées encore plus grandes que le segment
+            stats = service.sources.get_all_stats()
+            assert all(entry['last_error'] == 'state_full' for entry in stats.values()), stats
+        finally:
+            drop_segment(state)
+    print(f"✅ Listes complètes hors shm, plafond de {bounded} proxies par source sur shm, "
+          f"débordement signalé sans plantage")
+
+
+def run_cycles(proxies, cycles, churn, conditional):
+    """Cycles de rafraîchissement où une seule liste change de `churn` proxies"""
+    with FakeProxyFleet(working=0, dead=0, sources=4, conditional=conditional) as fleet:
+        per_source = proxies // len(fleet.sources)
+        for s, name in enumerate(fleet.sources):
+            fleet.sources[name] = '\n'.join(fake_ip(s * per_source + i) for i in range(per_source))
+        service = make_service(fleet)
+        refresh(service)
+
+        fleet.counters.clear()
+        durations = []
+        next_ip = proxies
+        for cycle in range(cycles):
+            name = list(fleet.sources)[cycle % len(fleet.sources)]
+            lines = fleet.sources[name].split('\n')
+            fleet.update_source(name, add=[fake_ip(next_ip + i) for i in range(churn)],
+                                remove=lines[:churn])
+            next_ip += churn
+            start = time.perf_counter()
+            refresh(service)
+            durations.append(time.perf_counter() - start)
+        return {
+            'conditional': conditional,
+            'bytes_per_cycle': fleet.counters.get('source_bytes', 0) // cycles,
+            'not_modified': fleet.counters.get('source_not_modified', 0),
+            'cycle_ms': round(sum(durations) / cycles * 1000, 1),
+            'candidates': len(service.get_proxies_cache())
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark du rafraîchissement incrémental')
+    parser.add_argument('--proxies', type=int, default=20000)
+    parser.add_argument('--cycles', type=int, default=10)
+    parser.add_argument('--churn', type=int, default=50)
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    check_conditional_and_diff()
+    check_capacity()
+
+    results = {}
+    for conditional in (False, True):
+        result = run_cycles(args.proxies, args.cycles, args.churn, conditional)
+        label = 'conditionnel' if conditional else 'complet'
+        results[label] = result
+        print(f"{label:<13} {result['bytes_per_cycle'] / 1024:>9.1f} Ko/cycle  "
+              f"{result['cycle_ms']:>8.1f} ms/cycle  304: {result['not_modified']:>3}  "
+              f"candidats: {result['candidates']}")
+
+    path = loadgen.save_report(loadgen.build_report('refresh', vars(args), results), args.output)
+    print(f"\n📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# ============================================
+# BENCHMARK - RECHERCHE PLEIN TEXTE DANS LA MÉMOIRE
+# - Vérifie que la recherche retrouve des tours anciens (hors des 50
+#   messages gardés en session) et que le rappel exclut l'historique récent
+# - Mesure l'insertion (add_message) et la recherche (p50/p95) sur des
+#   conversations de milliers de messages, comparée à un parcours linéaire
+#
+# Usage: python benchmarks/bench_search.py [--messages 1000 5000 20000] [--queries 200] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+VOCABULARY = ("météo voyage recette musique football python chat jardin vacances film livre "
+              "train avion montagne plage projet travail examen banque santé sport café").split()
+
+
+def make_message(rng, i):
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(6, 20))]
+    return f"message {i} " + ' '.join(words) + f" mot{rng.randint(0, 5000)}"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def check_recall():
+    """Un fait énoncé tôt est retrouvé après 300 messages"""
+    app.ConversationIndex.configure(':memory:')
+    store = app.DetachedSession()
+    app.MemoryService24h.init_conversation(store)
+    app.MemoryService24h.add_message('user', "Mon chien s'appelle Rantanplan", store=store)
+    for i in range(300):
+        app.MemoryService24h.add_message('user', f"question {i} sur la météo", store=store)
+    conversation = store['conversation']
+    assert len(conversation['messages']) < 300
+
+    found = app.ConversationIndex.search(conversation['id'], 'rantanplan')
+    assert [m['id'] for m in found] == [0], found
+    recalled = app.ConversationIndex.recall(conversation, "Comment s'appelle mon chien ?")
+    assert recalled and recalled[0]['id'] == 0, recalled
+    # Les derniers messages sont déjà dans l'historique du prompt
+    latest = conversation['messages'][-1]['id']
+    assert all(m['id'] <= latest - app.PromptBuilder.HISTORY_LIMIT
+               for m in app.ConversationIndex.recall(conversation, 'météo'))
+    _, prompt = app.PromptBuilder.build(conversation, {}, [], "", recalled=recalled)
+    assert 'Rantanplan' in prompt
+
+    app.MemoryService24h.clear(store=store)
+    assert app.ConversationIndex.search(conversation['id'], 'rantanplan') == []
+
+
+def run(size, queries, seed):
+    rng = random.Random(seed)
+    app.ConversationIndex.configure(':memory:')
+    # Bruit : d'autres conversations partagent l'index
+    for other in range(5):
+        for i in range(size // 5):
+            app.ConversationIndex.add(f'autre{other}', i, 'user', make_message(rng, i))
+
+    messages = []
+    start = time.perf_counter()
+    for i in range(size):
+        content = make_message(rng, i)
+        messages.append(content)
+        app.ConversationIndex.add('bench', i, 'user', content)
+    insert_us = (time.perf_counter() - start) / size * 1e6
+
+    terms = [f"{rng.choice(VOCABULARY)} mot{rng.randint(0, 5000)}" for _ in range(queries)]
+    indexed, linear = [], []
+    for query in terms:
+        start = time.perf_counter()
+        app.ConversationIndex.search('bench', query, limit=10)
+        indexed.append((time.perf_counter() - start) * 1000)
+
+        # Parcours linéaire (ce qu'imposerait une recherche dans la session)
+        words = app.ConversationIndex.keywords(query)
+        start = time.perf_counter()
+        [m for m in messages if any(w in m.lower() for w in words)][:10]
+        linear.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'insert_us': round(insert_us, 1),
+        'search_p50_ms': round(statistics.median(indexed), 3),
+        'search_p95_ms': round(percentile(indexed, 0.95), 3),
+        'linear_p50_ms': round(statistics.median(linear), 3),
+        'linear_p95_ms': round(percentile(linear, 0.95), 3)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de la recherche plein texte')
+    parser.add_argument('--messages', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        check_recall()
+    print("✅ Rappel d'un tour ancien et oubli à l'effacement vérifiés")
+
+    results = {}
+    print(f"\n{'messages':>9} {'insertion':>10} {'index p50/p95':>17} {'linéaire p50/p95':>19}")
+    for size in args.messages:
+        r = results[str(size)] = run(size, args.queries, args.seed)
+        print(f"{size:>9} {r['insert_us']:>8.1f}µs {r['search_p50_ms']:>7.2f}/{r['search_p95_ms']:<7.2f}ms "
+              f"{r['linear_p50_ms']:>8.2f}/{r['linear_p95_ms']:<7.2f}ms")
+
+    path = loadgen.save_report(loadgen.build_report('search', vars(args), results), args.output)
+    print(f"\n📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
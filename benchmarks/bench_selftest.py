@@ -0,0 +1,108 @@
+# ============================================
+# BENCHMARK - AUTO-TEST DES MODÈLES GEMINI
+# Durée de GeminiService.self_test (tests en parallèle) comparée à
+# l'ancien test séquentiel, selon le nombre de modèles (faux Gemini).
+# Vérifie que les tests ne partent qu'à la demande de /api/gemini/debug
+# (au plus une fois par SELF_TEST_TTL) et sont comptés dans les tokens.
+#
+# Usage: python benchmarks/bench_selftest.py [--latency 0.3] [--models 2 5 10 20] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+from fakes import install_fake_genai  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+
+def sequential_self_test(genai):
+    """Reproduction de l'ancienne boucle de /api/gemini/debug"""
+    for model in genai.list_models():
+        if 'generateContent' in model.supported_generation_methods:
+            genai.GenerativeModel(model.name).generate_content(
+                "Dis 'OK' en un mot", generation_config={"max_output_tokens": 10})
+
+
+def check_on_demand():
+    """Aucun test en arrière-plan; /api/gemini/debug les lance une fois par TTL"""
+    install_fake_genai(app, latency=0, models=['models/gemini-bench-0', 'models/gemini-bench-1'])
+    flask_app = app.create_app(state=app.InProcessState())
+    client = flask_app.test_client()
+    services = flask_app.extensions['benbot']
+    status, usage = services.status, services.gemini.usage
+
+    client.get('/api/system/status')
+    time.sleep(2 * status.TICK)
+    assert status.get('model_tests') is None and usage.get_stats()['actions']['self_test'] == 0
+
+    assert client.get('/api/gemini/debug').get_json()['refreshing']
+    deadline = time.time() + 10
+    while status.get('model_tests') is None and time.time() < deadline:
+        time.sleep(0.05)
+    assert usage.get_stats()['actions']['self_test'] == 2
+    debug = client.get('/api/gemini/debug').get_json()
+    assert not debug['refreshing'] and len(debug['models']) == 2, debug
+    time.sleep(status.TICK + 1)
+    assert usage.get_stats()['actions']['self_test'] == 2
+
+    # Relance forcée : ?refresh=true seulement, et avec la clé d'administration
+    for flag in ('false', '0', 'no'):
+        assert not client.get(f'/api/gemini/debug?refresh={flag}').get_json()['refreshing'], flag
+    app.ADMIN_KEY = None
+    assert client.get('/api/gemini/debug?refresh=true').status_code == 403
+    app.ADMIN_KEY = 'bench'
+    assert client.get('/api/gemini/debug?refresh=true&key=nope').status_code == 403
+    assert client.get('/api/gemini/debug?refresh=TRUE', headers={'X-Admin-Key': 'bench'}).get_json()['refreshing']
+    deadline = time.time() + 10
+    while usage.get_stats()['actions']['self_test'] < 4 and time.time() < deadline:
+        time.sleep(0.05)
+    assert usage.get_stats()['actions']['self_test'] == 4
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de l'auto-test des modèles")
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--models', type=int, nargs='+', default=[2, 5, 10, 20])
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        check_on_demand()
+    print("✅ Tests des modèles à la demande seulement, comptés dans les tokens, relance réservée à l'administration")
+
+    results = {}
+    print(f"{'modèles':>8} {'séquentiel':>11} {'parallèle':>10}")
+    for count in args.models:
+        fake = install_fake_genai(app, latency=args.latency,
+                                  models=[f'models/gemini-bench-{i}' for i in range(count)])
+        start = time.perf_counter()
+        sequential_self_test(fake)
+        sequential = time.perf_counter() - start
+
+        service = app.GeminiService(app.InProcessState())
+        start = time.perf_counter()
+        report = service.self_test()
+        parallel = time.perf_counter() - start
+        assert report['error'] is None and len(report['models']) == count
+        assert service.usage.get_stats()['actions']['self_test'] == count
+
+        results[str(count)] = {'sequential_s': round(sequential, 3), 'parallel_s': round(parallel, 3)}
+        print(f"{count:>8} {sequential:>10.2f}s {parallel:>9.2f}s")
+
+    path = loadgen.save_report(loadgen.build_report('selftest', vars(args), results), args.output)
+    print(f"\n📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
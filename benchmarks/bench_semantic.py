@@ -0,0 +1,122 @@
+# ============================================
+# BENCHMARK - RAPPEL SÉMANTIQUE LOCAL (N-GRAMMES HACHÉS)
+# - Vérifie que SemanticIndex retrouve un tour ancien formulé autrement
+#   (fautes de frappe, accents) là où la recherche par mots exacts échoue
+# - Mesure le coût de vectorisation à l'ajout et du rappel (p50/p95)
+#   selon la taille de l'historique, NumPy et Python pur, comparé à une
+#   vectorisation complète de l'historique à chaque requête
+#
+# Usage: python benchmarks/bench_semantic.py [--messages 1000 5000 20000] [--queries 100] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+from bench_search import make_message, percentile  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+NUMPY = app.SemanticIndex.numpy()
+
+
+def reset(numpy):
+    app.SemanticIndex._numpy = NUMPY if numpy else False
+    app.SemanticIndex._entries.clear()
+    app.SemanticIndex._total = 0
+
+
+def check_recall():
+    """Tour ancien retrouvé malgré une formulation différente"""
+    reset(NUMPY is not None)
+    app.ConversationIndex.configure(':memory:')
+    store = app.DetachedSession()
+    app.MemoryService24h.init_conversation(store)
+    app.MemoryService24h.add_message('user', "Je prépare des lasagnes végétariennes ce soir", store=store)
+    for i in range(100):
+        app.MemoryService24h.add_message('user', f"question {i} sur le football", store=store)
+    conversation = store['conversation']
+
+    query = "Tu te souviens de ma lazagne vejetarienne ?"
+    assert app.ConversationIndex.recall(conversation, query) == []
+    recalled = app.recall_past_turns(conversation, query)
+    assert [m['id'] for m in recalled] == [0], recalled
+
+    # Index vide (autre worker, redémarrage) : recomplété depuis la session
+    app.SemanticIndex.forget(conversation['id'])
+    assert app.SemanticIndex.recall(conversation, "football") != []
+    app.MemoryService24h.clear(store=store)
+    assert app.SemanticIndex.get_stats()['conversations'] == 0
+
+
+def run(size, queries, numpy, seed):
+    reset(numpy)
+    rng = random.Random(seed)
+    messages = [make_message(rng, i) for i in range(size)]
+    conversation = {'id': 'bench', 'messages': [{'id': size - 1, 'role': 'user', 'content': messages[-1]}]}
+
+    start = time.perf_counter()
+    for i, content in enumerate(messages):
+        app.SemanticIndex.add('bench', i, 'user', content)
+    add_us = (time.perf_counter() - start) / size * 1e6
+
+    terms = [make_message(rng, -1) for _ in range(queries)]
+    timings = []
+    for query in terms:
+        start = time.perf_counter()
+        app.SemanticIndex.recall(conversation, query)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Sans index incrémental : tout l'historique vectorisé à chaque requête
+    start = time.perf_counter()
+    for content in messages:
+        app.SemanticIndex.embed(content)
+    rebuild_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        'add_us': round(add_us, 1),
+        'recall_p50_ms': round(statistics.median(timings), 3),
+        'recall_p95_ms': round(percentile(timings, 0.95), 3),
+        'rebuild_ms': round(rebuild_ms, 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark du rappel sémantique')
+    parser.add_argument('--messages', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        check_recall()
+    print("✅ Rappel d'un tour reformulé et resynchronisation depuis la session vérifiés")
+
+    backends = (['numpy'] if NUMPY is not None else []) + ['python']
+    results = {}
+    print(f"\n{'moteur':<7} {'messages':>9} {'ajout':>9} {'rappel p50/p95':>18} {'revectorisation':>16}")
+    for backend in backends:
+        for size in args.messages:
+            r = results[f'{backend}:{size}'] = run(size, args.queries, backend == 'numpy', args.seed)
+            print(f"{backend:<7} {size:>9} {r['add_us']:>7.1f}µs {r['recall_p50_ms']:>7.2f}/{r['recall_p95_ms']:<8.2f}ms "
+                  f"{r['rebuild_ms']:>13.1f}ms")
+    reset(NUMPY is not None)
+
+    path = loadgen.save_report(loadgen.build_report('semantic', vars(args), results), args.output)
+    print(f"\n📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
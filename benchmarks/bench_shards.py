@@ -0,0 +1,146 @@
+# ============================================
+# BENCHMARK - SESSIONS RÉPARTIES SUR PLUSIEURS SHARDS SQLITE
+# - Collisions d'identifiants de conversation lors de démarrages
+#   simultanés : ancien md5(time)[:8] contre new_conversation_id()
+# - Rebalancement à chaud : ajout d'un shard, part des clés déplacées,
+#   lectures correctes pendant le déplacement
+# - Débit d'écriture des sessions (une écriture par add_message) depuis
+#   plusieurs processus : 1 fichier SQLite contre N shards
+#
+# Usage: python benchmarks/bench_shards.py [--processes 4] [--writes 500] [--shards 1 4 8] [--ids 50000] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import hashlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+
+def count_collisions(make_id, threads=8, per_thread=50000):
+    ids = []
+    barrier = threading.Barrier(threads)
+
+    def start():
+        barrier.wait()
+        ids.extend(make_id() for _ in range(per_thread))
+
+    workers = [threading.Thread(target=start) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(ids) - len(set(ids))
+
+
+def check_rebalance(path):
+    store = app.create_session_store(4, path)
+    keys = [f'session:{app.new_conversation_id()}' for _ in range(2000)]
+    for i, key in enumerate(keys):
+        store.set(key, {'n': i})
+
+    assert store.rebalance('session:')['moved'] == 0 and not store.describe()['migrating']
+
+    store.add_shard('shard4', app.SQLiteState(os.path.join(path, 'sessions-4.db')))
+    assert store.describe()['migrating']
+    misplaced = sum(store.owner(key) == 'shard4' for key in keys)
+    # Lectures correctes avant tout déplacement (recherche sur les autres shards)
+    assert all(store.get(key) == {'n': i} for i, key in enumerate(keys[:100]))
+    result = store.rebalance('session:')
+    assert not store.describe()['migrating']
+    assert all(store.get(key) == {'n': i} for i, key in enumerate(keys))
+    assert store.rebalance('session:')['moved'] == 0
+
+    # Lectures pendant l'ajout d'un shard depuis un autre thread
+    errors = []
+
+    def read():
+        try:
+            for i, key in enumerate(keys):
+                assert store.get(key) == {'n': i}
+        except Exception as e:
+            errors.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    store.add_shard('shard5', app.SQLiteState(os.path.join(path, 'sessions-5.db')))
+    reader.join()
+    assert not errors, errors[:1]
+    store.remove_shard('shard5')
+    assert all(store.get(key) == {'n': i} for i, key in enumerate(keys))
+    return {'keys': len(keys), 'moved_share': round(misplaced / len(keys), 3),
+            'moved_by_rebalance': result['moved']}
+
+
+def writer(path, shards, writes, worker, payload):
+    store = app.create_session_store(shards, path)
+    for i in range(writes):
+        # Une session par conversation, réécrite à chaque message
+        store.set(f'session:{worker}-{i % 50}', {'data': payload, 'expires_at': time.time() + 86400, 'n': i})
+
+
+def throughput(processes, writes, shards, payload):
+    path = tempfile.mkdtemp(prefix='benbot-shards-')
+    app.create_session_store(shards, path)  # création des fichiers avant les workers
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=writer, args=(path, shards, writes, w, payload)) for w in range(processes)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return processes * writes / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark des sessions réparties')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=500)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--ids', type=int, default=50000, help="identifiants générés par thread")
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    # 32 bits d'empreinte : collisions attendues dès quelques centaines de milliers d'ids
+    total = 8 * args.ids
+    old = count_collisions(lambda: hashlib.md5(str(time.time()).encode()).hexdigest()[:8], per_thread=args.ids)
+    new = count_collisions(app.new_conversation_id, per_thread=args.ids)
+    assert new == 0
+    print(f"Collisions sur {total} démarrages (8 threads) : md5(time)[:8] = {old}, new_conversation_id = {new}")
+
+    rebalance = check_rebalance(tempfile.mkdtemp(prefix='benbot-shards-'))
+    print(f"✅ Ajout d'un 5e shard : {rebalance['moved_share'] * 100:.1f}% des clés déplacées "
+          f"({rebalance['moved_by_rebalance']} par rebalance), lectures correctes")
+
+    # Session typique : 50 messages en mémoire
+    payload = {'conversation': {'messages': [{'role': 'user', 'content': 'x' * 150}] * 50}}
+    results = {'collisions': {'md5_time': old, 'new_conversation_id': new}, 'rebalance': rebalance,
+               'throughput': {}}
+    print(f"\n{'shards':>7} {'écritures/s':>12}   ({args.processes} processus)")
+    for shards in args.shards:
+        rate = throughput(args.processes, args.writes, shards, payload)
+        results['throughput'][str(shards)] = round(rate, 1)
+        print(f"{shards:>7} {rate:>12.0f}")
+    if (os.cpu_count() or 1) < 2:
+        print("⚠️ Un seul CPU : les écritures sont limitées par la sérialisation, pas par les verrous")
+
+    path = loadgen.save_report(loadgen.build_report('shards', vars(args), results), args.output)
+    print(f"\n📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# ============================================
+# BENCHMARK DE DÉMARRAGE À FROID
+# - Temps d'import par module (python -X importtime)
+# - Temps jusqu'au premier octet de /health dans un processus neuf,
+#   avec import différé du SDK Gemini (lazy) ou import anticipé (eager)
+# - Vérifie que l'import n'affiche rien, ne charge ni le SDK ni NumPy, et
+#   que POST /api/system/warmup exige la clé d'administration
+#
+# Usage: python benchmarks/bench_startup.py [--runs 5] [--top 15] [-o fichier.json]
+# ============================================
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import loadgen  # noqa: E402
+
+SERVER_CODE = """
+import sys
+if sys.argv[2] == 'eager':
+    import google.generativeai
+import app
+from werkzeug.serving import make_server
+make_server('127.0.0.1', int(sys.argv[1]), app.app).serve_forever()
+"""
+
+
+def child_env(extra=None):
+    env = dict(os.environ)
+    env.setdefault('SECRET_KEY', 'benchmark')
+    env.update(extra or {})
+    return env
+
+
+def import_times(module='app', top=15):
+    """Temps d'import cumulés du module et de chacun de ses imports directs (ms)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, env=child_env(), capture_output=True, text=True
+    )
+    # Format: "import time: self [us] | cumulative | imported package"
+    # Les imports d'un module sont listés avant lui, avec un niveau d'indentation en plus
+    total = None
+    children = []
+    pending = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entry = {
+            'module': name.strip(),
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000
+        }
+        if depth == 1:
+            pending.append(entry)
+        elif depth == 0:
+            if entry['module'] == module:
+                total = entry['cumulative_ms']
+                children = pending
+            pending = []
+    children.sort(key=lambda m: m['cumulative_ms'], reverse=True)
+    return {'total_ms': total, 'modules': children[:top]}
+
+
+LAZY_CODE = """
+import sys, app
+status = app.app.test_client().post('/api/system/warmup').status_code
+loaded = [m for m in ('google.generativeai', 'numpy') if m in sys.modules]
+sys.stderr.write(f"{status} {','.join(loaded)}")
+"""
+
+
+def check_lazy_imports():
+    """Import silencieux, sans le SDK Gemini ni NumPy; /api/system/warmup sans clé refusé"""
+    env = child_env()
+    env.pop('ADMIN_KEY', None)
+    env.pop('WARMUP_ON_START', None)
+    result = subprocess.run([sys.executable, '-c', LAZY_CODE], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    status, _, loaded = result.stderr.strip().partition(' ')
+    assert not result.stdout, f"affiché à l'import : {result.stdout[:200]}"
+    assert status == '403', f"/api/system/warmup sans clé : HTTP {status}"
+    assert not loaded, f"importés au démarrage : {loaded}"
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def first_byte(port, deadline):
+    """Boucle jusqu'à recevoir le premier octet de GET /health"""
+    request = b'GET /health HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'
+    while time.perf_counter() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1) as sock:
+                sock.sendall(request)
+                if sock.recv(1):
+                    return time.perf_counter()
+        except OSError:
+            time.sleep(0.005)
+    return None
+
+
+def cold_start(mode, timeout=30):
+    """Secondes entre le lancement du processus et le premier octet de /health"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVER_CODE, str(port), mode],
+        cwd=ROOT, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        received = first_byte(port, start + timeout)
+    finally:
+        process.kill()
+        process.wait()
+    return None if received is None else received - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de démarrage à froid')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    check_lazy_imports()
+    print("✅ Import silencieux, SDK Gemini et NumPy au premier usage seulement, préchauffage réservé à l'administration")
+
+    imports = import_times('app', args.top)
+    print(f"📦 import app: {imports['total_ms']:.1f}ms")
+    for m in imports['modules']:
+        print(f"   {m['cumulative_ms']:>9.1f}ms  {m['module']}")
+
+    genai_import = import_times('google.generativeai', 1)
+    print(f"📦 import google.generativeai seul: {genai_import['total_ms'] or 0:.1f}ms")
+
+    results = {'imports': imports, 'genai_import_ms': genai_import['total_ms'], 'cold_start': {}}
+    for mode in ('lazy', 'eager'):
+        samples = [cold_start(mode) for _ in range(args.runs)]
+        ok = [s for s in samples if s is not None]
+        results['cold_start'][mode] = {
+            'runs': args.runs,
+            'failures': len(samples) - len(ok),
+            'median_ms': round(statistics.median(ok) * 1000, 1) if ok else None,
+            'min_ms': round(min(ok) * 1000, 1) if ok else None,
+            'max_ms': round(max(ok) * 1000, 1) if ok else None
+        }
+        stats = results['cold_start'][mode]
+        print(f"🚀 /health premier octet ({mode}): médiane {stats['median_ms']}ms "
+              f"[{stats['min_ms']} - {stats['max_ms']}]")
+
+    path = loadgen.save_report(loadgen.build_report('startup', vars(args), results), args.output)
+    print(f"\n📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# ============================================
+# BENCHMARK - COMPTABILITÉ DES TOKENS ET BUDGETS
+# - Vérifie les comptes lus dans usage_metadata (ou estimés sans elle),
+#   la réduction de max_output_tokens et le passage au modèle économique
+#   quand le budget baisse, le refus (HTTP 429) à budget épuisé
+# - Sous charge : tokens et coût par modèle exposés par /api/gemini/usage
+#   et /api/system/status, surcoût de la comptabilité sur /api/chat
+#
+# Usage: python benchmarks/bench_usage.py [-n 300] [-c 8] [--gemini-latency 0.05] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+from fakes import install_fake_genai  # noqa: E402
+from run import scenario_chat  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+MODELS = ('models/gemini-1.5-pro', 'models/gemini-1.5-flash')
+
+
+def check_budgets(fake):
+    """Comptes exacts, estimation, réponses raccourcies, modèle économique, refus"""
+    app.UsageLedger.SESSION_BUDGET = 20000
+    app.UsageLedger.DAILY_BUDGET = 0
+    client = app.create_app(state=app.InProcessState()).test_client()
+
+    first = client.post('/api/chat', json={'message': 'Bonjour', 'max_tokens': 5000}).get_json()
+    usage = first['usage']
+    assert first['model'] == 'models/gemini-1.5-pro' and usage['action'] == 'ok', first
+    assert not usage['estimated'] and usage['completion_tokens'] == len(fake.reply) // 4, usage
+    assert usage['max_tokens'] == 1000  # max_tokens borné à 1000
+
+    # Sans usage_metadata (SDK ancien) : estimation depuis les longueurs
+    response = app.genai.GenerativeModel(MODELS[0]).generate_content('x' * 400)
+    del response.usage_metadata
+    assert app.UsageLedger(None).count(response, 'x' * 400, response.text)[2] is True
+
+    # Budget qui baisse : réponses raccourcies puis modèle économique, jusqu'au refus
+    actions, models, status = [], [], 200
+    while status == 200 and len(actions) < 100:
+        response = client.post('/api/chat', json={'message': 'Parle-moi du Japon ' * 20})
+        status = response.status_code
+        body = response.get_json()
+        actions.append(body['usage']['action'])
+        models.append(body['model'])
+    assert status == 429 and actions[-1] == 'refused', (status, actions)
+    assert 'downgraded' in actions and 'models/gemini-1.5-flash' in models, (actions, models)
+
+    session = client.get('/api/gemini/usage').get_json()['session']
+    assert session['remaining'] < 20000 * app.UsageLedger.LOW_RATIO, session
+    stats = client.get('/api/gemini/usage').get_json()['global']
+    assert stats['actions']['refused'] == 1 and set(stats['models']) == {'gemini-1.5-pro', 'gemini-1.5-flash'}
+    assert client.post('/api/chat', json={'message': 'x', 'temperature': 'chaud'}).status_code == 400
+    return {'actions': actions, 'session': session}
+
+
+def load(flask_app, requests, concurrency):
+    server = loadgen.LocalServer(flask_app)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return loadgen.run_load(server.url, scenario_chat, concurrency, requests, trace_memory=False)
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de la comptabilité des tokens')
+    parser.add_argument('-n', '--requests', type=int, default=300)
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('--gemini-latency', type=float, default=0.05)
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    fake = install_fake_genai(app, latency=args.gemini_latency, models=MODELS)
+    with contextlib.redirect_stdout(io.StringIO()):
+        checks = check_budgets(fake)
+    print(f"✅ Comptes, réduction, modèle économique et refus vérifiés ({len(checks['actions'])} tours : "
+          f"{', '.join(sorted(set(checks['actions'])))})")
+
+    budgets = (app.UsageLedger.SESSION_BUDGET, app.UsageLedger.DAILY_BUDGET)
+    results = {}
+    real_record = app.UsageLedger.record
+    for label in ('sans comptabilité', 'avec comptabilité'):
+        if label == 'sans comptabilité':
+            app.UsageLedger.record = lambda self, *a, **k: {'prompt_tokens': 0, 'completion_tokens': 0}
+            app.UsageLedger.SESSION_BUDGET = app.UsageLedger.DAILY_BUDGET = 0
+        else:
+            app.UsageLedger.record = real_record
+            app.UsageLedger.SESSION_BUDGET, app.UsageLedger.DAILY_BUDGET = 200000, 5000000
+        flask_app = app.create_app(state=app.InProcessState())
+        result = results[label] = load(flask_app, args.requests, args.concurrency)
+        loadgen.print_result(label, result)
+    app.UsageLedger.SESSION_BUDGET, app.UsageLedger.DAILY_BUDGET = budgets
+
+    client = flask_app.test_client()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = client.get('/api/gemini/usage').get_json()['global']
+        status = client.get('/api/system/status').get_json()['apis']['gemini']['usage']
+    assert status is None or status['requests'] <= stats['requests']
+    results['usage'] = stats
+    print(f"\n📊 {stats['requests']} appels, {stats['prompt_tokens']} + {stats['completion_tokens']} tokens, "
+          f"{stats['cost_usd']:.4f} $ ({', '.join(stats['models'])})")
+    overhead = (results['avec comptabilité']['latency_ms']['p50']
+                / results['sans comptabilité']['latency_ms']['p50'] - 1)
+    print(f"⚡ Surcoût p50 de la comptabilité : {overhead * 100:+.1f}%")
+    path = loadgen.save_report(loadgen.build_report('usage', vars(args), results), args.output)
+    print(f"📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# ============================================
+# BENCHMARK - ÉCRITURES DIFFÉRÉES DES SESSIONS (WRITE-BEHIND)
+# - Vérifie la lecture de ses propres écritures avant vidage, la
+#   visibilité pour un autre worker après vidage, les suppressions et le
+#   vidage à l'arrêt du processus
+# - Sous charge (/api/chat, sessions sur shards SQLite) : écritures,
+#   transactions et octets écrits par requête, latence, comparés aux
+#   écritures immédiates
+#
+# Usage: python benchmarks/bench_write_behind.py [-n 400] [-c 8] [--interval-ms 50] [-o fichier.json]
+# ============================================
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+from fakes import install_fake_genai  # noqa: E402
+from run import scenario_chat  # noqa: E402
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class WriteCounter:
+    """Compte lignes, transactions et octets écrits par les shards SQLite, chronomètre store_session"""
+
+    def __init__(self):
+        self.rows = self.transactions = self.bytes = 0
+        self.save_ms = []
+        self._store_session = app.ShardedSessionInterface.store_session
+        self._set, self._set_many = app.SQLiteState.set, app.SQLiteState.set_many
+        counter = self
+
+        def counted_set(state, key, value):
+            counter.rows += 1
+            counter.transactions += 1
+            counter.bytes += len(json.dumps(value))
+            return counter._set(state, key, value)
+
+        def counted_set_many(state, items):
+            counter.rows += len(items)
+            counter.transactions += 1
+            counter.bytes += sum(len(json.dumps(value)) for value in items.values())
+            return counter._set_many(state, items)
+
+        def timed_store_session(interface, *args):
+            start = time.perf_counter()
+            try:
+                return counter._store_session(interface, *args)
+            finally:
+                counter.save_ms.append((time.perf_counter() - start) * 1000)
+
+        app.SQLiteState.set, app.SQLiteState.set_many = counted_set, counted_set_many
+        app.ShardedSessionInterface.store_session = timed_store_session
+
+    def close(self):
+        app.SQLiteState.set, app.SQLiteState.set_many = self._set, self._set_many
+        app.ShardedSessionInterface.store_session = self._store_session
+
+
+def check_consistency():
+    path = tempfile.mkdtemp(prefix='benbot-wb-')
+    store = app.create_session_store(4, path, write_behind_ms=60000)
+    other = app.create_session_store(4, path)  # un autre worker, sans tampon
+
+    record = {'data': {'conversation': {'messages': [1, 2]}}, 'expires_at': 1}
+    store.set('session:a', record)
+    store.set('session:a', dict(record, expires_at=2))
+    assert store.get('session:a')['expires_at'] == 2 and other.get('session:a') is None
+    store.get('session:a')['data']['conversation']['messages'].append(3)  # copie indépendante
+    assert store.get('session:a')['data']['conversation']['messages'] == [1, 2]
+    assert store.flush() == 1 and other.get('session:a')['expires_at'] == 2
+    store.delete('session:a')
+    assert store.get('session:a') is None and other.get('session:a') is not None
+    store.flush()
+    assert other.get('session:a') is None
+    assert store.describe()['write_behind']['coalesced'] == 1
+
+    # Vidage à la sortie du processus (atexit), tampon jamais vidé par le thread
+    script = textwrap.dedent(f"""
+        import contextlib, io, sys
+        sys.path.insert(0, {ROOT!r})
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+        store = app.create_session_store(4, {path!r}, write_behind_ms=60000)
+        store.set('session:exit', {{'data': {{}}, 'expires_at': 3}})
+    """)
+    subprocess.run([sys.executable, '-c', script], check=True, env=dict(os.environ, SECRET_KEY='benchmark'))
+    assert other.get('session:exit') == {'data': {}, 'expires_at': 3}
+
+
+def load(requests, concurrency, interval_ms):
+    sessions = app.create_session_store(4, tempfile.mkdtemp(prefix='benbot-wb-'), write_behind_ms=interval_ms)
+    flask_app = app.create_app(state=app.InProcessState(), sessions=sessions)
+    counter = WriteCounter()
+    server = loadgen.LocalServer(flask_app)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = loadgen.run_load(server.url, scenario_chat, concurrency, requests, trace_memory=False)
+        if interval_ms:
+            sessions.flush()
+    finally:
+        server.close()
+        counter.close()
+    result['writes'] = {
+        'rows_per_request': round(counter.rows / requests, 3),
+        'transactions_per_request': round(counter.transactions / requests, 3),
+        'bytes_per_request': round(counter.bytes / requests),
+        'save_p50_ms': round(loadgen.percentile(sorted(counter.save_ms), 50), 3),
+        'save_p95_ms': round(loadgen.percentile(sorted(counter.save_ms), 95), 3)
+    }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark des écritures différées des sessions')
+    parser.add_argument('-n', '--requests', type=int, default=400)
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('--interval-ms', type=int, default=50)
+    parser.add_argument('--gemini-latency', type=float, default=0.0)
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    install_fake_genai(app, latency=args.gemini_latency)
+    with contextlib.redirect_stdout(io.StringIO()):
+        check_consistency()
+    print("✅ Lecture de ses écritures, visibilité après vidage, suppressions et vidage à l'arrêt vérifiés")
+
+    results = {}
+    for label, interval_ms in (('immédiat', 0), (f'différé {args.interval_ms} ms', args.interval_ms)):
+        result = results[label] = load(args.requests, args.concurrency, interval_ms)
+        loadgen.print_result(label, result)
+        writes = result['writes']
+        print(f"{'':<20} {writes['rows_per_request']:.2f} lignes, {writes['transactions_per_request']:.2f} "
+              f"transactions, {writes['bytes_per_request'] / 1024:.1f} Ko écrits par requête, "
+              f"sauvegarde de session p50/p95 {writes['save_p50_ms']:.2f}/{writes['save_p95_ms']:.2f} ms")
+
+    path = loadgen.save_report(loadgen.build_report('write_behind', vars(args), results), args.output)
+    print(f"\n📄 Résultats: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+# ============================================
+# FAUX SERVICES LOCAUX POUR LES BENCHMARKS
+# - FakeGenAI: remplace google.generativeai (latence, streaming, erreurs)
+# - FakeProxyFleet: sources de listes de proxies + faux proxies HTTP
+# ============================================
+
+import hashlib
+import json
+import random
+import selectors
+import socket
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+
+# ============================================
+# FAUX GEMINI
+# ============================================
+
+class FakeGenAIError(Exception):
+    """Erreur simulée renvoyée par le faux SDK"""
+
+
+class FakeResponse:
+    """Réponse compatible GenerateContentResponse (text + usage_metadata)"""
+
+    def __init__(self, text, prompt_tokens, chunks=None):
+        self._text = text
+        self._chunks = chunks
+        completion_tokens = max(1, len(text) // 4)
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=completion_tokens,
+            total_token_count=prompt_tokens + completion_tokens
+        )
+
+    @property
+    def text(self):
+        return self._text
+
+    def __iter__(self):
+        for chunk in self._chunks or [self._text]:
+            yield SimpleNamespace(text=chunk)
+
+    def resolve(self):
+        return self
+
+
+class FakeGenAI:
+    """Module factice imitant l'API de google.generativeai utilisée par app.py"""
+
+    DEFAULT_MODELS = ('models/gemini-1.5-flash', 'models/gemini-1.0-pro')
+
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0,
+                 error_message='429 quota exceeded', stream_chunks=4,
+                 models=DEFAULT_MODELS, reply='Bonjour ! Je suis BenBot.', seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_message = error_message
+        self.stream_chunks = stream_chunks
+        self.models = list(models)
+        self.reply = reply
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.api_key = None
+        self.GenerativeModel = self._model_class()
+
+    def configure(self, api_key=None, **kwargs):
+        self.api_key = api_key
+
+    def list_models(self):
+        for name in self.models:
+            yield SimpleNamespace(
+                name=name,
+                display_name=name.split('/')[-1],
+                supported_generation_methods=['generateContent', 'countTokens']
+            )
+
+    def _delay(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise FakeGenAIError(self.error_message)
+
+    def _model_class(self):
+        fake = self
+
+        class GenerativeModel:
+            def __init__(self, model_name='gemini-pro', system_instruction=None, **kwargs):
+                self.model_name = model_name
+                self.system_instruction = system_instruction
+
+            def generate_content(self, contents, generation_config=None, stream=False, **kwargs):
+                fake._delay()
+                prompt = contents if isinstance(contents, str) else json.dumps(contents, default=str)
+                if self.system_instruction:
+                    prompt = self.system_instruction + prompt
+                text = fake.reply
+                max_tokens = (generation_config or {}).get('max_output_tokens')
+                if max_tokens:
+                    text = text[:max_tokens * 4]
+                chunks = None
+                if stream:
+                    size = max(1, len(text) // max(1, fake.stream_chunks))
+                    chunks = [text[i:i + size] for i in range(0, len(text), size)]
+                return FakeResponse(text, max(1, len(prompt) // 4), chunks)
+
+            def count_tokens(self, contents):
+                prompt = contents if isinstance(contents, str) else json.dumps(contents, default=str)
+                return SimpleNamespace(total_tokens=max(1, len(prompt) // 4))
+
+        return GenerativeModel
+
+
+def install_fake_genai(app_module, **config):
+    """Remplace genai dans app.py par un FakeGenAI et force une clé API factice"""
+    fake = FakeGenAI(**config)
+    app_module.genai = fake
+    app_module.GEMINI_API_KEY = app_module.GEMINI_API_KEY or 'fake-benchmark-key'
+    app_module.PromptBuilder._supports_system_instruction = None
+    return fake
+
+
+# ============================================
+# FAUX PROXIES ET SOURCES DE LISTES
+# ============================================
+
+def free_port():
+    """Réserve puis libère un port local (connexion refusée ensuite)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    """Faux proxy HTTP: répond à toute URL absolue comme un service d'écho IP"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        payload = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        fleet = self.server.fleet
+        if fleet.proxy_latency:
+            time.sleep(fleet.proxy_latency)
+        fleet.count('proxy_requests')
+        self._send(200, json.dumps({
+            'origin': '127.0.0.1',
+            'ip': '127.0.0.1',
+            'headers': {'Via': '1.1 fake-proxy'} if fleet.add_via_header else {}
+        }))
+
+    def do_CONNECT(self):
+        fleet = self.server.fleet
+        fleet.count('connect_requests')
+        self.send_response(200, 'Connection established')
+        self.end_headers()
+        self.close_connection = True
+
+
+class _ControlHandler(_ProxyHandler):
+    """Serveur de contrôle: listes de proxies (/sources/<nom>) et géolocalisation (/json/<ip>)"""
+
+    def do_GET(self):
+        fleet = self.server.fleet
+        path = self.path.split('?', 1)[0]
+        if path.startswith('/sources/'):
+            fleet.count('source_requests')
+            name = path[len('/sources/'):]
+            body = fleet.source_body(name)
+            if body is None:
+                self._send(404, 'not found', 'text/plain')
+            else:
+                if fleet.source_latency:
+                    time.sleep(fleet.source_latency)
+                headers = {}
+                if fleet.conditional:
+                    etag, modified = fleet.source_validators(name)
+                    headers = {'ETag': etag, 'Last-Modified': formatdate(modified, usegmt=True)}
+                    if self._not_modified(etag, modified):
+                        fleet.count('source_not_modified')
+                        self._send(304, b'', 'text/plain', headers)
+                        return
+                fleet.count('source_bytes', len(body.encode('utf-8')))
+                self._send(200, body, 'text/plain', headers)
+        elif path.startswith('/json/'):
+            fleet.count('geo_requests')
+            self._send(200, json.dumps({'status': 'success', 'country': fleet.country}))
+        elif path.startswith('/ip'):
+            self._send(200, json.dumps({'ip': '127.0.0.1'}))
+        else:
+            self._send(404, 'not found', 'text/plain')
+
+    def _not_modified(self, etag, modified):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return if_none_match == etag
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= int(modified)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+class FakeProxyFleet:
+    """Flotte de faux proxies locaux + serveur imitant les sources de listes.
+
+    - `working` proxies écoutent réellement et répondent 200 à toute requête
+    - `dead` proxies pointent vers des ports fermés (connexion refusée)
+    - `sources` listes servies en texte sur /sources/<nom>, avec recouvrement
+    - `conditional` active ETag / Last-Modified et les réponses 304
+    """
+
+    def __init__(self, working=5, dead=20, sources=3, overlap=0.5,
+                 proxy_latency=0.0, source_latency=0.0, country='Localhost',
+                 add_via_header=False, conditional=True, seed=0):
+        self.proxy_latency = proxy_latency
+        self.conditional = conditional
+        self.add_via_header = add_via_header
+        self.source_latency = source_latency
+        self.country = country
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {}
+        self._servers = []
+        self._threads = []
+
+        self.control = self._start(_ControlHandler)
+        self.working = [f'127.0.0.1:{self._start(_ProxyHandler).server_address[1]}'
+                        for _ in range(working)]
+        self.dead = [f'127.0.0.1:{free_port()}' for _ in range(dead)]
+
+        candidates = self.working + self.dead
+        self.sources = {}
+        self.modified = {}
+        for i in range(sources):
+            if i == 0:
+                chosen = list(candidates)
+            else:
+                chosen = [c for c in candidates if self._random.random() < overlap]
+            self._random.shuffle(chosen)
+            self.sources[f'list{i}.txt'] = '\n'.join(chosen)
+            self.modified[f'list{i}.txt'] = time.time()
+
+    def _start(self, handler):
+        server = _QuietServer(('127.0.0.1', 0), handler)
+        server.fleet = self
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self._servers.append(server)
+        self._threads.append(thread)
+        return server
+
+    @property
+    def base_url(self):
+        host, port = self.control.server_address
+        return f'http://{host}:{port}'
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def source_body(self, name):
+        return self.sources.get(name)
+
+    def source_validators(self, name):
+        body = self.sources[name]
+        return '"' + hashlib.md5(body.encode('utf-8')).hexdigest() + '"', self.modified[name]
+
+    def update_source(self, name, add=(), remove=()):
+        """Modifie une liste servie (nouvel ETag, Last-Modified à la seconde suivante)"""
+        removed = set(remove)
+        lines = [line for line in self.sources[name].split('\n') if line and line not in removed]
+        self.sources[name] = '\n'.join(lines + list(add))
+        self.modified[name] = max(time.time(), self.modified[name] + 1)
+
+    def source_list(self, parser='github'):
+        """Liste au format VPNService.PROXY_SOURCES"""
+        return [{'name': name, 'url': f'{self.base_url}/sources/{name}', 'parser': parser}
+                for name in self.sources]
+
+    def install(self, vpn_service):
+        """Redirige VPNService (classe ou instance) vers la flotte locale"""
+        vpn_service.PROXY_SOURCES = self.source_list()
+        vpn_service.GEO_URL = self.base_url + '/json/{ip}'
+        vpn_service.IP_ECHO_URL = self.base_url + '/ip'
+        vpn_service.TEST_URLS = [self.base_url + '/ip']
+        vpn_service.HEADERS_ECHO_URL = self.base_url + '/headers'
+        vpn_service.CONNECT_TARGET = self.control.server_address[0] + f':{self.control.server_address[1]}'
+
+    def close(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeListenerFarm:
+    """Milliers de ports en écoute servis par un seul thread (accept + close).
+
+    Sert à mesurer le pré-filtrage TCP sans lancer un serveur HTTP par port.
+    Les `tarpits` imitent des proxies qui ne répondent pas : file d'attente
+    saturée et jamais vidée, les connexions suivantes expirent.
+    """
+
+    def __init__(self, count=500, tarpits=0):
+        self._selector = selectors.DefaultSelector()
+        self._sockets = []
+        self._tarpit_sockets = []
+        self._running = True
+        for _ in range(tarpits):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(0)
+            filler = socket.create_connection(sock.getsockname(), timeout=1)
+            self._tarpit_sockets.extend([sock, filler])
+        self.tarpits = [f'127.0.0.1:{sock.getsockname()[1]}' for sock in self._tarpit_sockets[::2]]
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(128)
+            sock.setblocking(False)
+            self._selector.register(sock, selectors.EVENT_READ)
+            self._sockets.append(sock)
+        self.addresses = [f'127.0.0.1:{sock.getsockname()[1]}' for sock in self._sockets]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while self._running:
+            for key, _ in self._selector.select(timeout=0.1):
+                try:
+                    conn, _ = key.fileobj.accept()
+                    conn.close()
+                except OSError:
+                    pass
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        for sock in self._sockets:
+            self._selector.unregister(sock)
+            sock.close()
+        for sock in self._tarpit_sockets:
+            sock.close()
+        self._selector.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
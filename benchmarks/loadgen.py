@@ -0,0 +1,216 @@
+# ============================================
+# GÉNÉRATEUR DE CHARGE ET MESURES
+# Débit, latences p50/p95/p99, mémoire, résultats JSON comparables
+# ============================================
+
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def percentile(values, p):
+    """Percentile par interpolation linéaire (values déjà triées)"""
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * p / 100.0
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+def max_rss_kb():
+    """Pic de mémoire résidente du processus (Ko)"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class LocalServer:
+    """Sert une application WSGI sur un port local dans un thread"""
+
+    def __init__(self, wsgi_app):
+        from werkzeug.serving import make_server
+        self._server = make_server('127.0.0.1', 0, wsgi_app, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def close(self):
+        self._server.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_load(base_url, scenario, concurrency=8, total_requests=200, warmup=0, trace_memory=True):
+    """Exécute `scenario(http, i)` en parallèle et mesure chaque appel.
+
+    `scenario` reçoit une requests.Session propre à chaque utilisateur virtuel
+    (cookies conservés) et l'index de la requête. Il retourne la Response.
+    tracemalloc ralentit fortement l'interpréteur: désactiver `trace_memory`
+    pour des latences absolues, le garder pour comparer la mémoire par route.
+    """
+    local = threading.local()
+    latencies = []
+    status_counts = {}
+    errors = []
+    bytes_received = [0]
+    lock = threading.Lock()
+
+    def http():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            local.session.base_url = base_url
+        return local.session
+
+    def one(i, record=True):
+        start = time.perf_counter()
+        try:
+            response = scenario(http(), i)
+            elapsed = time.perf_counter() - start
+            if record:
+                with lock:
+                    latencies.append(elapsed)
+                    status_counts[response.status_code] = status_counts.get(response.status_code, 0) + 1
+                    bytes_received[0] += len(response.content)
+        except Exception as e:
+            if record:
+                with lock:
+                    errors.append(f'{type(e).__name__}: {str(e)[:100]}')
+
+    for i in range(warmup):
+        one(i, record=False)
+
+    tracemalloc_started = trace_memory and not tracemalloc.is_tracing()
+    if tracemalloc_started:
+        tracemalloc.start()
+    if trace_memory:
+        tracemalloc.reset_peak()
+    base_memory, _ = tracemalloc.get_traced_memory()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total_requests)))
+    duration = time.perf_counter() - start
+
+    _, peak_memory = tracemalloc.get_traced_memory() if trace_memory else (0, 0)
+    if tracemalloc_started:
+        tracemalloc.stop()
+
+    latencies.sort()
+    completed = len(latencies)
+    return {
+        'requests': total_requests,
+        'completed': completed,
+        'errors': len(errors),
+        'error_samples': errors[:5],
+        'status_codes': {str(k): v for k, v in sorted(status_counts.items())},
+        'concurrency': concurrency,
+        'duration_s': round(duration, 4),
+        'throughput_rps': round(completed / duration, 2) if duration > 0 else 0.0,
+        'latency_ms': {
+            'min': round(latencies[0] * 1000, 3) if latencies else 0.0,
+            'mean': round(sum(latencies) / completed * 1000, 3) if completed else 0.0,
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p95': round(percentile(latencies, 95) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0
+        },
+        'bytes_received': bytes_received[0],
+        'memory': {
+            'python_peak_kb': round((peak_memory - base_memory) / 1024, 1) if trace_memory else None,
+            'max_rss_kb': max_rss_kb()
+        }
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def build_report(name, config, results):
+    return {
+        'name': name,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': config,
+        'results': results
+    }
+
+
+def save_report(report, output=None):
+    """Écrit le rapport JSON et retourne son chemin"""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{report['name']}-{stamp}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return output
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_reports(old, new, threshold=0.10):
+    """Compare deux rapports; retourne les lignes et les régressions (> threshold)"""
+    rows = []
+    regressions = []
+    for scenario, new_result in new['results'].items():
+        old_result = old['results'].get(scenario)
+        if not old_result:
+            continue
+        for metric in ('p50', 'p95', 'p99'):
+            before = old_result['latency_ms'][metric]
+            after = new_result['latency_ms'][metric]
+            delta = (after - before) / before if before else 0.0
+            rows.append((scenario, metric, before, after, delta))
+            if delta > threshold:
+                regressions.append((scenario, metric, before, after, delta))
+        before = old_result['throughput_rps']
+        after = new_result['throughput_rps']
+        delta = (after - before) / before if before else 0.0
+        rows.append((scenario, 'rps', before, after, delta))
+        if delta < -threshold:
+            regressions.append((scenario, 'rps', before, after, delta))
+    return rows, regressions
+
+
+def print_result(scenario, result):
+    latency = result['latency_ms']
+    print(f"{scenario:<16} {result['completed']:>6}/{result['requests']:<6} "
+          f"{result['throughput_rps']:>9.1f} rps  p50 {latency['p50']:>8.2f}ms  "
+          f"p95 {latency['p95']:>8.2f}ms  p99 {latency['p99']:>8.2f}ms  "
+          f"mem {result['memory']['python_peak_kb'] or 0:>8.1f}Ko  err {result['errors']}")
@@ -0,0 +1,293 @@
+# ============================================
+# REJEU DÉTERMINISTE DE TRAFIC CAPTURÉ
+# Rejoue une trace JSONL (TRACE_CAPTURE_PATH, app.TrafficRecorder) contre
+# une instance locale aux services amont simulés (faux Gemini, faux
+# proxies), au rythme enregistré ou plus vite, et compare les latences
+# par endpoint avec le rapport d'un autre build.
+#
+# Usage:
+#   python benchmarks/replay.py capture -o trace.jsonl -n 300     # trace synthétique
+#   python benchmarks/replay.py run trace.jsonl -o avant.json      # rythme enregistré
+#   python benchmarks/replay.py run trace.jsonl --speed 0          # au plus vite
+#   python benchmarks/replay.py run trace.jsonl --baseline avant.json --threshold 0.15
+#   python benchmarks/replay.py run trace.jsonl --url http://localhost:5000
+# ============================================
+
+import argparse
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import requests  # noqa: E402
+
+import loadgen  # noqa: E402
+from fakes import FakeProxyFleet, install_fake_genai  # noqa: E402
+from run import (scenario_chat, scenario_get_proxies, scenario_health, scenario_memory_status,  # noqa: E402
+                 scenario_system_status, scenario_vpn_stats)
+
+# Mélange de la trace synthétique (capture) : poids par scénario
+CAPTURE_MIX = [
+    (scenario_chat, 5),
+    (scenario_memory_status, 2),
+    (scenario_get_proxies, 1),
+    (scenario_vpn_stats, 1),
+    (scenario_system_status, 1),
+    (scenario_health, 1)
+]
+
+
+def import_app():
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+    return app
+
+
+@contextlib.contextmanager
+def local_instance(args, capture_path=None):
+    """Instance locale, Gemini et proxies simulés (graine fixe)"""
+    app = import_app()
+    random.seed(args.seed)
+    install_fake_genai(app, latency=args.gemini_latency, jitter=args.gemini_jitter, seed=args.seed)
+    app.TRACE_CAPTURE_PATH = capture_path
+    with FakeProxyFleet(working=5, dead=20) as fleet:
+        fleet.install(app.VPNService)
+        flask_app = app.create_app(state=app.InProcessState())
+        server = loadgen.LocalServer(flask_app)
+        try:
+            yield server.url, flask_app
+        finally:
+            server.close()
+            app.TRACE_CAPTURE_PATH = None
+
+
+def load_trace(path):
+    """Lignes de la trace (JSONL, éventuellement .gz) triées par instant"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda record: record['t'])
+
+
+def trace_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def replay(base_url, records, speed=1.0, concurrency=32, timeout=30):
+    """Rejoue chaque client dans l'ordre (cookies conservés), clients en parallèle.
+
+    `speed` : 1 = rythme enregistré, 2 = deux fois plus vite, 0 = sans attente.
+    """
+    clients = OrderedDict()
+    for record in records:
+        clients.setdefault(record['c'], []).append(record)
+    origin = records[0]['t']
+    rows = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def run_client(entries):
+        http = requests.Session()
+        for record in entries:
+            if speed > 0:
+                delay = (record['t'] - origin) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            url = base_url + record['p'] + (f"?{record['q']}" if record.get('q') else '')
+            kwargs = {'headers': dict(record.get('h') or {}), 'timeout': timeout}
+            kwargs['headers'].pop('If-None-Match', None)  # ETag propre à l'instance capturée
+            if record.get('b') is not None:
+                kwargs['json'] = record['b']
+            begin = time.perf_counter()
+            try:
+                response = http.request(record['m'], url, **kwargs)
+                status, error = response.status_code, None
+            except requests.RequestException as e:
+                status, error = None, f'{type(e).__name__}: {str(e)[:100]}'
+            elapsed_ms = (time.perf_counter() - begin) * 1000
+            with lock:
+                rows.append({
+                    'endpoint': f"{record['m']} {record.get('e') or record['p']}",
+                    'recorded_status': record.get('s'),
+                    'status': status,
+                    'ms': elapsed_ms,
+                    'recorded_ms': record.get('d'),
+                    'error': error
+                })
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(clients)))) as pool:
+        list(pool.map(run_client, clients.values()))
+    return rows, time.perf_counter() - start
+
+
+def summarize(rows, duration):
+    """Résultats par endpoint au format des rapports de run.py (comparables)"""
+    groups = OrderedDict([('*', rows)])
+    for row in sorted(rows, key=lambda row: row['endpoint']):
+        groups.setdefault(row['endpoint'], []).append(row)
+
+    results = {}
+    for endpoint, group in groups.items():
+        latencies = sorted(row['ms'] for row in group if row['error'] is None)
+        recorded = sorted(row['recorded_ms'] for row in group if row['recorded_ms'] is not None)
+        completed = len(latencies)
+        errors = [row['error'] for row in group if row['error']]
+        results[endpoint] = {
+            'requests': len(group),
+            'completed': completed,
+            'errors': len(errors),
+            'error_samples': errors[:5],
+            'status_mismatches': sum(1 for row in group if row['error'] is None
+                                     and row['status'] != row['recorded_status']),
+            'duration_s': round(duration, 4),
+            'throughput_rps': round(completed / duration, 2) if duration > 0 else 0.0,
+            'latency_ms': {
+                'min': round(latencies[0], 3) if latencies else 0.0,
+                'mean': round(sum(latencies) / completed, 3) if completed else 0.0,
+                'p50': round(loadgen.percentile(latencies, 50), 3),
+                'p95': round(loadgen.percentile(latencies, 95), 3),
+                'p99': round(loadgen.percentile(latencies, 99), 3),
+                'max': round(latencies[-1], 3) if latencies else 0.0
+            },
+            'recorded_latency_ms': {
+                'p50': round(loadgen.percentile(recorded, 50), 3),
+                'p95': round(loadgen.percentile(recorded, 95), 3)
+            }
+        }
+    return results
+
+
+def print_summary(results):
+    print(f"{'endpoint':<34} {'n':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'capturé p50':>12} {'statut ≠':>9}")
+    for endpoint, result in results.items():
+        latency = result['latency_ms']
+        print(f"{endpoint:<34} {result['requests']:>5} {latency['p50']:>7.2f}ms {latency['p95']:>7.2f}ms "
+              f"{latency['p99']:>7.2f}ms {result['recorded_latency_ms']['p50']:>10.2f}ms "
+              f"{result['status_mismatches']:>9}")
+
+
+def compare_with(baseline_path, report, threshold, min_samples=20):
+    """Régressions par endpoint; ceux de moins de `min_samples` requêtes sont ignorés (trop bruités)"""
+    baseline = loadgen.load_report(baseline_path)
+    for key, label in (('trace_digest', 'une autre trace'), ('speed', 'une autre vitesse')):
+        if baseline['config'].get(key) != report['config'].get(key):
+            print(f"⚠️ Le rapport de référence a été produit avec {label}")
+    current = dict(report, results={endpoint: result for endpoint, result in report['results'].items()
+                                    if result['completed'] >= min_samples})
+    rows, regressions = loadgen.compare_reports(baseline, current, threshold)
+    print(f"\n{'endpoint':<34} {'métrique':<6} {'avant':>10} {'après':>10} {'delta':>8}")
+    for endpoint, metric, before, after, delta in rows:
+        print(f"{endpoint:<34} {metric:<6} {before:>10.2f} {after:>10.2f} {delta * 100:>+7.1f}%")
+    if regressions:
+        print(f"\n❌ {len(regressions)} régression(s) au-delà de {threshold * 100:.0f}%")
+        return 1
+    print("\n✅ Aucune régression")
+    return 0
+
+
+def command_capture(args):
+    """Trace synthétique : scénarios de run.py contre une instance qui capture"""
+    if os.path.exists(args.output):
+        os.remove(args.output)
+    scenarios = [scenario for scenario, weight in CAPTURE_MIX for _ in range(weight)]
+
+    def mixed(http, i):
+        return scenarios[i % len(scenarios)](http, i)
+
+    with local_instance(args, capture_path=args.output) as (base_url, flask_app):
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = loadgen.run_load(base_url, mixed, args.concurrency, args.requests, trace_memory=False)
+        recorded = flask_app.wsgi_app.recorded
+    loadgen.print_result('capture', result)
+    print(f"📼 {recorded} requêtes capturées dans {args.output}")
+    return 0
+
+
+def command_run(args):
+    records = load_trace(args.trace)
+    if not records:
+        print("❌ Trace vide")
+        return 1
+    config = {
+        'trace': os.path.abspath(args.trace),
+        'trace_digest': trace_digest(args.trace),
+        'records': len(records),
+        'clients': len({record['c'] for record in records}),
+        'recorded_span_s': round(records[-1]['t'] - records[0]['t'], 3),
+        **{key: getattr(args, key) for key in ('speed', 'concurrency', 'seed', 'gemini_latency',
+                                                'gemini_jitter', 'url')}
+    }
+    print(f"▶️ {config['records']} requêtes, {config['clients']} clients, "
+          f"{config['recorded_span_s']} s capturées, vitesse {args.speed or 'max'}")
+
+    if args.url:
+        rows, duration = replay(args.url, records, args.speed, args.concurrency, args.timeout)
+    else:
+        with local_instance(args) as (base_url, _):
+            with contextlib.redirect_stdout(io.StringIO()):
+                rows, duration = replay(base_url, records, args.speed, args.concurrency, args.timeout)
+
+    results = summarize(rows, duration)
+    print_summary(results)
+    report = loadgen.build_report(args.name, config, results)
+    path = loadgen.save_report(report, args.output)
+    print(f"\n📄 Résultats: {path}")
+    if args.baseline:
+        return compare_with(args.baseline, report, args.threshold, args.min_samples)
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Capture et rejeu de trafic de Chat App IA')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def upstream_options(command):
+        command.add_argument('--seed', type=int, default=0)
+        command.add_argument('--gemini-latency', type=float, default=0.05)
+        command.add_argument('--gemini-jitter', type=float, default=0.0)
+        command.add_argument('-c', '--concurrency', type=int, default=32,
+                             help='clients rejoués en parallèle (capture : utilisateurs virtuels)')
+
+    capture = commands.add_parser('capture', help='génère une trace synthétique')
+    capture.add_argument('-n', '--requests', type=int, default=300)
+    capture.add_argument('-o', '--output', default='trace.jsonl')
+    upstream_options(capture)
+
+    run = commands.add_parser('run', help='rejoue une trace')
+    run.add_argument('trace', help='fichier JSONL (ou .jsonl.gz)')
+    run.add_argument('--speed', type=float, default=1.0, help='1 = rythme capturé, 0 = sans attente')
+    run.add_argument('--url', help='cible externe (ses services amont doivent être simulés)')
+    run.add_argument('--timeout', type=float, default=30)
+    run.add_argument('--baseline', help='rapport JSON de référence (autre build)')
+    run.add_argument('--threshold', type=float, default=0.10,
+                     help='seuil de régression (0.10 = 10%%)')
+    run.add_argument('--min-samples', type=int, default=20,
+                     help='requêtes minimales par endpoint pour juger une régression')
+    run.add_argument('--name', default='replay')
+    run.add_argument('-o', '--output', help='fichier JSON de sortie')
+    upstream_options(run)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    return command_capture(args) if args.command == 'capture' else command_run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
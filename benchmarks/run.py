@@ -0,0 +1,207 @@
+# ============================================
+# BENCHMARKS DE CHARGE PAR ROUTE
+# Lance l'application en local avec un faux Gemini et une flotte de
+# faux proxies, mesure chaque route sous concurrence et sauvegarde
+# un rapport JSON comparable entre deux builds.
+#
+# Usage:
+#   python benchmarks/run.py                          # tous les scénarios
+#   python benchmarks/run.py -s chat -s health -c 16 -n 500
+#   python benchmarks/run.py --gemini-latency 0.2 --gemini-error-rate 0.05
+#   python benchmarks/run.py --url http://localhost:5000 -s health
+#   python benchmarks/run.py --compare results/a.json results/b.json
+# ============================================
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+import loadgen  # noqa: E402
+from fakes import FakeProxyFleet, install_fake_genai  # noqa: E402
+
+GREETINGS = ['Bonjour', 'Salut !', 'Bonjour']
+MESSAGES = [
+    "Je m'appelle Alice",
+    "Peux-tu m'aider à apprendre le python ?",
+    "Je prépare un voyage au Japon",
+    "Quel est le meilleur métier dans la programmation ?"
+]
+BATCH_SIZE = 10
+
+
+def scenario_index(http, i):
+    return http.get(http.base_url + '/')
+
+
+def scenario_health(http, i):
+    return http.get(http.base_url + '/health')
+
+
+def scenario_chat(http, i):
+    message = GREETINGS[i % len(GREETINGS)] if i % 3 == 0 else MESSAGES[i % len(MESSAGES)]
+    return http.post(http.base_url + '/api/chat', json={'message': message})
+
+
+def scenario_chat_batch(http, i):
+    items = [{'id': f'{i}-{k}', 'message': MESSAGES[(i + k) % len(MESSAGES)]} for k in range(BATCH_SIZE)]
+    return http.post(http.base_url + '/api/chat/batch', json={'items': items})
+
+
+def scenario_memory_status(http, i):
+    if not http.cookies:
+        http.post(http.base_url + '/api/chat', json={'message': 'Bonjour'})
+    return http.get(http.base_url + '/api/memory/status')
+
+
+def scenario_system_status(http, i):
+    return http.get(http.base_url + '/api/system/status')
+
+
+def scenario_gemini_models(http, i):
+    return http.get(http.base_url + '/api/gemini/models')
+
+
+def scenario_vpn_stats(http, i):
+    return http.get(http.base_url + '/api/vpn/stats')
+
+
+def scenario_get_proxies(http, i):
+    return http.get(http.base_url + '/api/get-proxies')
+
+
+def scenario_vpn_scan(http, i):
+    # Le scan est une tâche de fond : on attend son résultat (scans identiques dédupliqués)
+    return http.post(http.base_url + '/api/vpn/scan', json={'limit': 5, 'max_tests': 25, 'wait': 25})
+
+
+SCENARIOS = {
+    'index': scenario_index,
+    'health': scenario_health,
+    'chat': scenario_chat,
+    'chat_batch': scenario_chat_batch,
+    'memory_status': scenario_memory_status,
+    'system_status': scenario_system_status,
+    'gemini_models': scenario_gemini_models,
+    'vpn_stats': scenario_vpn_stats,
+    'get_proxies': scenario_get_proxies,
+    'vpn_scan': scenario_vpn_scan,
+}
+
+# Scénarios lents: moins de requêtes par défaut
+HEAVY = {'vpn_scan': 0.1, 'chat_batch': 1 / BATCH_SIZE}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks de charge de Chat App IA')
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scénario à lancer (répétable, défaut: tous)')
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('-n', '--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--url', help="cible externe (pas de faux services)")
+    parser.add_argument('--gemini-latency', type=float, default=0.05)
+    parser.add_argument('--gemini-jitter', type=float, default=0.02)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    parser.add_argument('--state', choices=('memory', 'sqlite', 'shm'), default='memory',
+                        help="backend d'état des services")
+    parser.add_argument('--proxy-working', type=int, default=5)
+    parser.add_argument('--proxy-dead', type=int, default=20)
+    parser.add_argument('--proxy-latency', type=float, default=0.0)
+    parser.add_argument('--no-trace-memory', dest='trace_memory', action='store_false',
+                        help='désactive tracemalloc (latences plus réalistes)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="affiche les logs de l'application")
+    parser.add_argument('--name', default='routes')
+    parser.add_argument('-o', '--output', help='fichier JSON de sortie')
+    parser.add_argument('--compare', nargs=2, metavar=('AVANT', 'APRES'),
+                        help='compare deux rapports JSON')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='seuil de régression pour --compare (0.10 = 10%%)')
+    return parser.parse_args(argv)
+
+
+def compare(args):
+    old = loadgen.load_report(args.compare[0])
+    new = loadgen.load_report(args.compare[1])
+    rows, regressions = loadgen.compare_reports(old, new, args.threshold)
+    print(f"{'scénario':<16} {'métrique':<6} {'avant':>10} {'après':>10} {'delta':>8}")
+    for scenario, metric, before, after, delta in rows:
+        print(f"{scenario:<16} {metric:<6} {before:>10.2f} {after:>10.2f} {delta * 100:>+7.1f}%")
+    if regressions:
+        print(f"\n❌ {len(regressions)} régression(s) au-delà de {args.threshold * 100:.0f}%")
+        return 1
+    print("\n✅ Aucune régression")
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        return compare(args)
+
+    scenarios = args.scenario or list(SCENARIOS)
+    config = {k: v for k, v in vars(args).items() if k not in ('compare', 'output', 'verbose')}
+    results = {}
+
+    fleet = None
+    server = None
+    if not args.verbose:
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    quiet = contextlib.nullcontext if args.verbose else lambda: contextlib.redirect_stdout(io.StringIO())
+    try:
+        if args.url:
+            base_url = args.url
+        else:
+            with quiet():
+                import app as app_module
+            install_fake_genai(
+                app_module,
+                latency=args.gemini_latency,
+                jitter=args.gemini_jitter,
+                error_rate=args.gemini_error_rate
+            )
+            fleet = FakeProxyFleet(
+                working=args.proxy_working,
+                dead=args.proxy_dead,
+                proxy_latency=args.proxy_latency
+            )
+            fleet.install(app_module.VPNService)
+            state_path = None
+            if args.state == 'sqlite':
+                state_path = os.path.join(tempfile.mkdtemp(prefix='benbot-bench-'), 'state.db')
+            elif args.state == 'shm':
+                state_path = f'benbot_bench_{os.getpid()}'
+            flask_app = app_module.create_app(
+                state=app_module.create_state_backend(args.state, state_path)
+            )
+            server = loadgen.LocalServer(flask_app)
+            base_url = server.url
+
+        for name in scenarios:
+            total = max(1, int(args.requests * HEAVY.get(name, 1)))
+            with quiet():
+                result = loadgen.run_load(base_url, SCENARIOS[name], args.concurrency, total,
+                                          args.warmup, args.trace_memory)
+            results[name] = result
+            loadgen.print_result(name, result)
+    finally:
+        if server:
+            server.close()
+        if fleet:
+            fleet.close()
+
+    path = loadgen.save_report(loadgen.build_report(args.name, config, results), args.output)
+    print(f"\n📄 Résultats: {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,54 +1,291 @@
+// ============================================
+// CACHE LOCAL DE LA CONVERSATION (IndexedDB)
+// Les messages sont rangés par conversation et par identifiant serveur
+// (croissant) : au rechargement l'historique s'affiche sans attendre le
+// réseau, puis seuls les messages plus récents sont demandés au serveur.
+// ============================================
+
+const ConversationCache = {
+    db: null,
+
+    open() {
+        if (this.db) return Promise.resolve(this.db);
+        if (!('indexedDB' in window)) return Promise.resolve(null);
+
+        return new Promise(resolve => {
+            const request = indexedDB.open('benbot', 1);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                db.createObjectStore('messages', { keyPath: ['conversationId', 'id'] });
+                db.createObjectStore('meta');
+            };
+            request.onsuccess = () => {
+                this.db = request.result;
+                resolve(this.db);
+            };
+            // Navigation privée ou stockage refusé : on fonctionne sans cache
+            request.onerror = () => resolve(null);
+        });
+    },
+
+    async run(storeName, mode, action) {
+        const db = await this.open();
+        if (!db) return null;
+        return new Promise(resolve => {
+            const transaction = db.transaction(storeName, mode);
+            const result = action(transaction.objectStore(storeName));
+            transaction.oncomplete = () => resolve(result && 'result' in result ? result.result : null);
+            transaction.onerror = () => resolve(null);
+        });
+    },
+
+    async getMeta() {
+        return (await this.run('meta', 'readonly', store => store.get('sync'))) || { conversationId: null, lastId: -1 };
+    },
+
+    setMeta(meta) {
+        return this.run('meta', 'readwrite', store => store.put(meta, 'sync'));
+    },
+
+    async getMessages(conversationId) {
+        if (!conversationId) return [];
+        const range = IDBKeyRange.bound([conversationId, -Infinity], [conversationId, Infinity]);
+        return (await this.run('messages', 'readonly', store => store.getAll(range))) || [];
+    },
+
+    putMessages(conversationId, messages) {
+        return this.run('messages', 'readwrite', store => {
+            messages.forEach(message => store.put({ ...message, conversationId }));
+        });
+    },
+
+    clear() {
+        return this.run('messages', 'readwrite', store => store.clear());
+    }
+};
+
+// ============================================
+// REQUÊTES ANNULABLES
+// Une nouvelle requête d'un même type annule la précédente devenue inutile
+// ============================================
+
+const inflightRequests = {};
+
+function fetchLatest(key, url, options = {}, timeoutMs = 30000) {
+    if (inflightRequests[key]) {
+        inflightRequests[key].abort();
+    }
+    const controller = new AbortController();
+    inflightRequests[key] = controller;
+    const timer = setTimeout(() => controller.abort(), timeoutMs);
+
+    return fetch(url, { ...options, signal: controller.signal }).finally(() => {
+        clearTimeout(timer);
+        if (inflightRequests[key] === controller) {
+            delete inflightRequests[key];
+        }
+    });
+}
+
+function isAbort(error) {
+    return error && error.name === 'AbortError';
+}
+
+// ============================================
+// SYNCHRONISATION INCRÉMENTALE
+// ============================================
+
+const renderedIds = new Set();
+let syncMeta = { conversationId: null, lastId: -1 };
+
+async function restoreConversation() {
+    syncMeta = await ConversationCache.getMeta();
+    const cached = await ConversationCache.getMessages(syncMeta.conversationId);
+    cached.sort((a, b) => a.id - b.id);
+    renderHistory(cached);
+    await syncConversation();
+}
+
+async function syncConversation() {
+    const params = new URLSearchParams({ after: syncMeta.lastId });
+    if (syncMeta.conversationId) {
+        params.set('conversation', syncMeta.conversationId);
+    }
+
+    try {
+        const response = await fetchLatest('sync', '/api/memory/messages?' + params.toString());
+        const data = await response.json();
+        if (!data.success) return;
+
+        // Conversation expirée ou remplacée : on repart de zéro
+        if (data.reset) {
+            await ConversationCache.clear();
+            clearRenderedHistory();
+        }
+
+        const fresh = data.messages.filter(message => !renderedIds.has(message.id));
+        renderHistory(fresh);
+        if (data.conversation_id && data.messages.length) {
+            await ConversationCache.putMessages(data.conversation_id, data.messages);
+        }
+
+        syncMeta = { conversationId: data.conversation_id, lastId: data.last_id };
+        await ConversationCache.setMeta(syncMeta);
+    } catch (error) {
+        if (!isAbort(error)) {
+            console.warn('Synchronisation impossible:', error.message);
+        }
+    }
+}
+
+// ============================================
+// CHAT
+// ============================================
+
 // Fonction pour envoyer un message à ChatGPT
 async function sendMessage() {
     const userInput = document.getElementById('user-input');
     const message = userInput.value.trim();
-    
+
     if (!message) {
         alert('Veuillez entrer un message');
         return;
     }
-    
+
     // Ajouter le message de l'utilisateur au chat
-    addMessage(message, 'user');
+    const userElement = addMessage(message, 'user');
     userInput.value = '';
-    
+
+    // Une synchronisation en cours serait déjà périmée
+    if (inflightRequests.sync) {
+        inflightRequests.sync.abort();
+    }
+
     // Afficher un indicateur de chargement
     const loadingId = addLoadingMessage();
-    
+
     try {
-        // Envoyer la requête à l'API
-        const response = await fetch('/api/chat', {
+        // Envoyer la requête à l'API (un envoi n'annule pas le précédent)
+        const response = await fetchLatest('chat-' + loadingId, '/api/chat', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({ message: message })
-        });
-        
+        }, 60000);
+
         const data = await response.json();
-        
+
         // Supprimer le message de chargement
         removeLoadingMessage(loadingId);
-        
+
         if (response.ok) {
-            addMessage(data.response, 'bot');
+            const botElement = addMessage('', 'bot');
+            renderProgressively(botElement, data.response);
+            rememberExchange(data.sync, userElement, message, botElement, data.response);
         } else {
             addMessage(`Erreur: ${data.error}`, 'bot');
         }
     } catch (error) {
         removeLoadingMessage(loadingId);
-        addMessage(`Erreur de connexion: ${error.message}`, 'bot');
+        addMessage(isAbort(error) ? 'Erreur: délai dépassé' : `Erreur de connexion: ${error.message}`, 'bot');
+    }
+}
+
+// Associe les messages affichés à leurs identifiants serveur puis complète le cache
+async function rememberExchange(sync, userElement, userText, botElement, botText) {
+    if (!sync || !sync.conversation_id) return;
+
+    const known = [];
+    sync.messages.forEach(message => {
+        if (renderedIds.has(message.id)) return;
+        const isUser = message.role === 'user';
+        const element = isUser ? userElement : botElement;
+        if (element.dataset.id !== undefined) return;
+        element.dataset.id = message.id;
+        renderedIds.add(message.id);
+        known.push({ ...message, content: isUser ? userText : botText });
+    });
+
+    if (syncMeta.conversationId === sync.conversation_id) {
+        await ConversationCache.putMessages(sync.conversation_id, known);
     }
+    // Récupère d'éventuels messages envoyés depuis un autre onglet
+    await syncConversation();
 }
 
 // Fonction pour ajouter un message au chat
-function addMessage(text, sender) {
+function addMessage(text, sender, id) {
     const chatMessages = document.getElementById('chat-messages');
-    const messageDiv = document.createElement('div');
-    messageDiv.className = `message ${sender}`;
-    messageDiv.innerHTML = `<strong>${sender === 'user' ? 'Vous' : 'IA'}:</strong> ${escapeHtml(text)}`;
+    const messageDiv = createMessageElement(text, sender, id);
     chatMessages.appendChild(messageDiv);
     chatMessages.scrollTop = chatMessages.scrollHeight;
+    return messageDiv;
+}
+
+function createMessageElement(text, sender, id) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${sender}`;
+    messageDiv.innerHTML = `<strong>${sender === 'user' ? 'Vous' : 'IA'}:</strong> <span class="message-text">${escapeHtml(text)}</span>`;
+    if (id !== undefined) {
+        messageDiv.dataset.id = id;
+        renderedIds.add(id);
+    }
+    return messageDiv;
+}
+
+// Affiche un historique par lots, une image à la fois, sans bloquer la page
+function renderHistory(messages, batchSize = 25) {
+    const chatMessages = document.getElementById('chat-messages');
+    let index = 0;
+
+    function renderBatch() {
+        const fragment = document.createDocumentFragment();
+        messages.slice(index, index + batchSize).forEach(message => {
+            if (renderedIds.has(message.id)) return;
+            fragment.appendChild(createMessageElement(message.content, message.role === 'user' ? 'user' : 'bot', message.id));
+        });
+        chatMessages.appendChild(fragment);
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+        index += batchSize;
+        if (index < messages.length) {
+            requestAnimationFrame(renderBatch);
+        }
+    }
+
+    if (messages.length) {
+        renderBatch();
+    }
+}
+
+function clearRenderedHistory() {
+    document.querySelectorAll('#chat-messages .message[data-id]').forEach(element => element.remove());
+    renderedIds.clear();
+}
+
+// Révèle la réponse mot à mot (au plus ~0,6 s, instantané si mouvements réduits)
+function renderProgressively(element, text) {
+    const target = element.querySelector('.message-text');
+    const reduceMotion = window.matchMedia && window.matchMedia('(prefers-reduced-motion: reduce)').matches;
+    if (reduceMotion) {
+        target.textContent = text;
+        return;
+    }
+
+    const words = text.split(/(\s+)/);
+    const perFrame = Math.max(1, Math.ceil(words.length / 36));
+    const chatMessages = document.getElementById('chat-messages');
+    let shown = 0;
+
+    function step() {
+        shown = Math.min(words.length, shown + perFrame);
+        target.textContent = words.slice(0, shown).join('');
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+        if (shown < words.length) {
+            requestAnimationFrame(step);
+        }
+    }
+    requestAnimationFrame(step);
 }
 
 // Fonction pour ajouter un message de chargement
@@ -79,24 +316,29 @@ function escapeHtml(text) {
     return div.innerHTML;
 }
 
+// ============================================
+// VPN
+// ============================================
+
 // Tester le VPN
 async function testVPN() {
     const ipElement = document.getElementById('current-ip');
     const statusElement = document.getElementById('vpn-status');
-    
+
     ipElement.textContent = 'Test en cours...';
     statusElement.textContent = 'Test en cours';
     statusElement.className = 'status-offline';
-    
+
     try {
-        const response = await fetch('/api/vpn-test');
+        // Un nouveau clic annule le test précédent
+        const response = await fetchLatest('vpn-test', '/api/vpn-test');
         const data = await response.json();
-        
+
         if (data.success) {
             ipElement.textContent = data.ip;
             statusElement.textContent = `Connecté (${data.method})`;
             statusElement.className = 'status-online';
-            
+
             if (data.method.includes('VPN')) {
                 showNotification('VPN actif avec IP: ' + data.ip);
             }
@@ -106,6 +348,7 @@ async function testVPN() {
             statusElement.className = 'status-offline';
         }
     } catch (error) {
+        if (isAbort(error) && inflightRequests['vpn-test']) return;
         ipElement.textContent = 'Erreur de connexion';
         statusElement.textContent = 'Hors ligne';
         statusElement.className = 'status-offline';
@@ -116,15 +359,15 @@ async function testVPN() {
 async function getProxies() {
     const proxiesList = document.getElementById('proxies-list');
     const proxiesContent = document.getElementById('proxies-content');
-    
+
     if (proxiesList.style.display === 'none') {
         proxiesContent.innerHTML = '<div class="proxy-item">Chargement...</div>';
         proxiesList.style.display = 'block';
-        
+
         try {
-            const response = await fetch('/api/vpn/proxies');
+            const response = await fetchLatest('proxies', '/api/vpn/proxies');
             const data = await response.json();
-            
+
             if (data.success) {
                 proxiesContent.innerHTML = '';
                 data.proxies.forEach(proxy => {
@@ -133,7 +376,7 @@ async function getProxies() {
                     proxyDiv.textContent = proxy;
                     proxiesContent.appendChild(proxyDiv);
                 });
-                
+
                 if (data.count > 10) {
                     const moreDiv = document.createElement('div');
                     moreDiv.className = 'proxy-item';
@@ -142,12 +385,17 @@ async function getProxies() {
                     proxiesContent.appendChild(moreDiv);
                 }
             } else {
-                proxiesContent.innerHTML = `<div class="proxy-item">Erreur: ${data.error}</div>`;
+                proxiesContent.innerHTML = `<div class="proxy-item">Erreur: ${escapeHtml(data.error)}</div>`;
             }
         } catch (error) {
+            if (isAbort(error)) return;
             proxiesContent.innerHTML = '<div class="proxy-item">Erreur de chargement</div>';
         }
     } else {
+        // Liste refermée : la réponse attendue ne sera plus affichée
+        if (inflightRequests.proxies) {
+            inflightRequests.proxies.abort();
+        }
         proxiesList.style.display = 'none';
     }
 }
@@ -170,12 +418,13 @@ document.getElementById('user-input').addEventListener('keydown', function(e) {
     }
 });
 
-// Tester l'IP au chargement
+// Restaurer la conversation et tester l'IP au chargement
 window.onload = function() {
+    restoreConversation();
     testVPN();
-    
+
     // Demander la permission pour les notifications
     if ('Notification' in window && Notification.permission === 'default') {
         Notification.requestPermission();
     }
-};
\ No newline at end of file
+};